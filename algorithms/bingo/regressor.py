@@ -1,7 +1,7 @@
 from bingo.symbolic_regression.symbolic_regressor import SymbolicRegressor, CrossValRegressor
 from bingo.evolutionary_algorithms.age_fitness import AgeFitnessEA
 
-from sklearn.model_selection import KFold
+from folds import CachedKFold
 
 hyper_params = [
     # narrowed to 3 by looking at most commonly chosen
@@ -27,8 +27,9 @@ non_tuned_est = SymbolicRegressor(population_size=500, stack_size=24,
 
 N_FOLDS = 3
 
-# use `N_FOLDS` grid search cross-validation to select hyper parameters
-cv = KFold(n_splits=N_FOLDS, shuffle=True)
+# use `N_FOLDS` grid search cross-validation to select hyper parameters,
+# on the folds shared with the other methods (see experiment/folds.py)
+cv = CachedKFold(n_splits=N_FOLDS)
 
 est = CrossValRegressor(non_tuned_est, cv=cv, param_grid=hyper_params,
                         verbose=3, n_jobs=1, scoring="r2", error_score="raise")
@@ -86,17 +87,14 @@ def get_cv_time(total_time):
     # set on `N_FOLDS` then also need to retrain final model
 
 
-def pre_train_fn(est, X, y):
-    """set max_time in seconds based on length of X."""
-    if len(X) <= 1000:
-        max_time = get_cv_time(60 * 60 - 200)  # 1 hour with 200 seconds of slack
-    else:
-        max_time = get_cv_time(10 * 60 * 60 - 1000)  # 10 hours with 1000 seconds of slack
-    est.set_max_time(new_max_time=max_time)
+def set_time_budget_fn(est, max_time):
+    """split the time budget (in seconds) over the cross-validation runs."""
+    est.set_max_time(new_max_time=get_cv_time(max_time))
+    return 'max_time'
 
 
 eval_kwargs = {
-    "pre_train": pre_train_fn,
+    "set_time_budget": set_time_budget_fn,
     "test_params": {"test": True}
 }
 
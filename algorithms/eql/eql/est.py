@@ -3,8 +3,8 @@ import sklearn
 from . import eqlearner as eql
 from .symbolic import get_symbolic_expr, get_symbolic_expr_layer
 import jax
-from jax import random, numpy as jnp
-from .np_utils import flatten, unflatten
+from jax import lax, random, numpy as jnp
+from jax.flatten_util import ravel_pytree
 import numpy as np
 import scipy
 import time
@@ -24,6 +24,8 @@ class EQL(BaseEstimator, RegressorMixin):
         reg=1e-3,
         random_state=None,
         do_bfgs=True,
+        batch_size=None,
+        n_restarts=1,
     ):
 
         self.n_layers = n_layers
@@ -33,6 +35,8 @@ class EQL(BaseEstimator, RegressorMixin):
         self.reg = reg
         self.random_state = random_state
         self.do_bfgs = do_bfgs
+        self.batch_size = batch_size
+        self.n_restarts = n_restarts
 
     def fit(self, X, y):
         # comply with scikit
@@ -62,70 +66,84 @@ class EQL(BaseEstimator, RegressorMixin):
             drop_rate=self.drop_rate,
         )
 
-        def make_l0_fn():
-            def l0(params, key):
-                return self._eql.apply(
-                    params, rngs={"l0": key}, method=self._eql.l0_reg
-                )
-
-            return jax.jit(l0)
-
-        def mse_fn(params, key):
+        def loss(params, key, X, y):
             def err(x, y):
                 pred = self._eql.apply(params, x, rngs={"l0": key})
                 return (pred - y) ** 2
 
-            return jnp.mean(jax.vmap(err)(X, y))
-
-        mse_fn = jax.jit(mse_fn)
-        l0_fn = make_l0_fn()
-
-        def loss(params, key):
-            return mse_fn(params, key) + self.reg * l0_fn(params, key)
+            mse = jnp.mean(jax.vmap(err)(X, y))
+            l0 = self._eql.apply(params, rngs={"l0": key}, method=self._eql.l0_reg)
+            return mse + self.reg * l0
 
-        loss_grad_fn = jax.jit(jax.value_and_grad(loss))
+        loss_grad_fn = jax.value_and_grad(loss)
 
         if self.random_state == None:
             self.random_state = np.random.randint(0, 9999)
 
-        key = random.PRNGKey(self.random_state)
-        key, k1, k2 = random.split(key, 3)
-        params = self._eql.init({"params": k1, "l0": k2}, X)
+        X = jnp.asarray(X)
+        y = jnp.asarray(y)
+        n_samples = X.shape[0]
+        batch_size = self.batch_size
+        if batch_size is None or batch_size >= n_samples:
+            batch_size = None
 
         tx = optax.adam(learning_rate=1e-2)
-        opt_state = tx.init(params)
 
-        for i in range(self.n_iter):
-            key, _ = random.split(key)
-            loss_val, grads = loss_grad_fn(params, key)
+        def train_step(carry, _):
+            params, opt_state, key = carry
+            key, k_l0, k_batch = random.split(key, 3)
+            if batch_size is None:
+                X_batch, y_batch = X, y
+            else:
+                idx = random.choice(k_batch, n_samples, (batch_size,), replace=False)
+                X_batch, y_batch = X[idx], y[idx]
+            loss_val, grads = loss_grad_fn(params, k_l0, X_batch, y_batch)
             updates, opt_state = tx.update(grads, opt_state)
             params = optax.apply_updates(params, updates)
-            
-        if self.do_bfgs:    
-            def np_fn(params, key):
-                params = unflatten(spec, params)
-                # new key or same key
-                #key = jax.random.fold_in(key, np_fn.counter)
-                loss, grad = loss_grad_fn(params, key)
-                _, grad = flatten(grad)
-                np_fn.counter += 1
-                return loss, np.array(grad)
-            np_fn.counter = 0
-            
-            spec, flat_params = flatten(params)
-            
+            return (params, opt_state, key), loss_val
+
+        def train(key):
+            # Adam phase of one restart, fused into a single scan
+            key, k1, k2 = random.split(key, 3)
+            params = self._eql.init({"params": k1, "l0": k2}, X)
+            opt_state = tx.init(params)
+            (params, _, key), _ = lax.scan(
+                train_step, (params, opt_state, key), None, length=self.n_iter
+            )
+            return params, key, loss(params, key, X, y)
+
+        keys = random.split(random.PRNGKey(self.random_state), self.n_restarts)
+        all_params, all_keys, all_losses = jax.jit(jax.vmap(train))(keys)
+
+        # keep the restart with the lowest loss on the full training set
+        best = int(jnp.nanargmin(all_losses))
+        params = jax.tree_util.tree_map(lambda p: p[best], all_params)
+        key = all_keys[best]
+
+        if self.do_bfgs:
+            flat_params, unravel = ravel_pytree(params)
+
+            flat_loss_grad_fn = jax.jit(jax.value_and_grad(
+                lambda flat, key: loss(unravel(flat), key, X, y)
+            ))
+
+            def np_fn(flat, key):
+                flat = jnp.asarray(flat, dtype=flat_params.dtype)
+                loss_val, grad = flat_loss_grad_fn(flat, key)
+                return float(loss_val), np.asarray(grad, dtype=np.float64)
+
             # final fitting
             x0, _, info = scipy.optimize.fmin_l_bfgs_b(
                     np_fn,
                     args=[key],
-                    x0=np.array(flat_params),
+                    x0=np.asarray(flat_params, dtype=np.float64),
                     maxfun=50,
                     factr=1,
                     m=20,
                     pgtol=1e-14,
             )
 
-            self._params = unflatten(spec, x0)
+            self._params = unravel(jnp.asarray(x0, dtype=flat_params.dtype))
             
         else: 
             self._params = params
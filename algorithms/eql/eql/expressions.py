@@ -0,0 +1,26 @@
+"""
+Rounding of sympy expressions. Only needs sympy, so srbench's experiment
+code (experiment/metrics/expressions.py) loads it from here as well.
+"""
+import sympy as sp
+
+
+def round_floats(expr, digits=3, zero_tol=0.0001, precision=None):
+    """Round every Float in expr to `digits` decimals.
+
+    Floats smaller than `zero_tol` in magnitude are replaced by 0 (pass
+    zero_tol=None to keep them). If `precision` is given, the rounded Floats
+    are created with that many significant digits.
+
+    The replacement mapping is built once from expr.atoms(Float) and applied
+    with a single xreplace, so the cost is linear in the size of expr.
+    """
+    mapping = {}
+    for a in expr.atoms(sp.Float):
+        if zero_tol is not None and abs(a) < zero_tol:
+            mapping[a] = sp.Integer(0)
+        elif precision is None:
+            mapping[a] = round(a, digits)
+        else:
+            mapping[a] = sp.Float(round(a, digits), precision)
+    return expr.xreplace(mapping)
@@ -1,6 +1,7 @@
 from sympy import Symbol, simplify, factor, Float, preorder_traversal, Integer
 from sympy.parsing.sympy_parser import parse_expr
 import math
+from .expressions import round_floats as _round_floats
 
 
 def simplicity(expr):
@@ -21,12 +22,4 @@ def complexity(expr):
 
 
 def round_floats(ex1):
-    ex2 = ex1
-
-    for a in preorder_traversal(ex1):
-        if isinstance(a, Float):
-            if abs(a) < 0.0001:
-                ex2 = ex2.subs(a, Integer(0))
-            else:
-                ex2 = ex2.subs(a, Float(round(a, 3), 3))
-    return ex2
+    return _round_floats(ex1, precision=3)
@@ -1,4 +1,5 @@
 import sympy as sy
+import numpy as np
 import jax.numpy as jnp
 from . import custom_functions
 from .utils import get_indices, get_una_bin_funs
@@ -24,21 +25,13 @@ def get_symbolic_expr_layer(W, b, functions, var_name="x"):
     Constructs a sympy representation of the function described
     by the layer
     """
+    W = np.asarray(W, dtype=float)
     in_features = W.shape[0]
-    out_features = W.shape[1]
 
     unary_funcs, binary_funcs = get_una_bin_funs(functions)
 
     in_symbols = sy.symbols("{}:{}".format(var_name, in_features))
-    z = []
-
-    for i in range(out_features):
-        o = 0
-        for j in range(in_features):
-            o += in_symbols[j] * W[j, i].item()
-        if b is not None:
-            o += b[i].item()
-            z.append(o)
+    z = linear_combinations(in_symbols, W, b)
 
     outs = []
     for f, i in unary_funcs:
@@ -51,6 +44,24 @@ def get_symbolic_expr_layer(W, b, functions, var_name="x"):
     return outs
 
 
+def linear_combinations(inputs, W, b=None):
+    """
+    Builds the sympy expressions inputs @ W + b, one per output column,
+    skipping the weights that are zero (e.g. masked by the L0 gates)
+    """
+    W = np.asarray(W, dtype=float)
+    if b is not None:
+        b = np.asarray(b, dtype=float)
+
+    z = []
+    for i in range(W.shape[1]):
+        terms = [inputs[j] * sy.Float(W[j, i]) for j in np.flatnonzero(W[:, i])]
+        if b is not None and b[i] != 0:
+            terms.append(sy.Float(b[i]))
+        z.append(sy.Add(*terms))
+    return z
+
+
 def get_Wb(layer, use_l0=False):
     kernel = layer["kernel"]
     bias = layer["bias"]
@@ -81,23 +92,9 @@ def get_symbolic_expr(params, functions, use_l0=False):
         b = get_symbolic_expr_layer(
             *get_Wb(hidden[i]["linear_layer"], use_l0), functions[i], var_name="b"
         )
-        c = []
-        for k in range(len(b)):
-            c.append(b[k].subs({"b" + str(j): a[j] for j in range(len(a))}))
-        a = c
-
-    # get weight/bias of last (normal) linear layer
-    w, b = last["kernel"], last["bias"]
-    z = []
-
-    in_features = w.shape[0]
-    out_features = w.shape[1]
+        mapping = {sy.Symbol("b" + str(j)): a[j] for j in range(len(a))}
+        a = [bk.xreplace(mapping) for bk in b]
 
-    for i in range(out_features):
-        s = 0
-        for j in range(in_features):
-            s += a[j] * w[j, i].item()
-        if b is not None:
-            s += b[i].item()
-        z.append(s)
-    return z
+    # get (masked) weight/bias of last linear layer
+    w, b = get_Wb(last, use_l0)
+    return linear_combinations(a, w, b)
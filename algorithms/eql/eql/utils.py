@@ -2,6 +2,7 @@ from typing import List, Tuple, Callable
 import sympy as sy
 import jax.numpy as jnp
 from . import custom_functions
+from .expressions import round_floats as _round_floats
 
 
 f_dict_jax = {
@@ -71,9 +72,4 @@ def round_floats(expr, to: int = 3):
     Takes a sympy expression and rounds every float to
     `to` digits
     """
-    new_expr = expr
-    # walks along the expression tree
-    for a in sy.preorder_traversal(expr):
-        if isinstance(a, sy.Float):
-            new_expr = new_expr.subs(a, round(a, to))
-    return new_expr
+    return _round_floats(expr, digits=to, zero_tol=None)
@@ -1,8 +1,12 @@
 from audioop import cross
+import math
+import os
 from typing import Union
 import geneticengine.off_the_shelf.regressors as gengy_regressors
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.model_selection import GridSearchCV
+from sklearn.experimental import enable_halving_search_cv # noqa
+from sklearn.model_selection import HalvingGridSearchCV
+from folds import CachedKFold
 
 """
 est: a sklearn-compatible regressor. 
@@ -20,6 +24,8 @@ class OptimisedGPRegressor(BaseEstimator, TransformerMixin):
         max_time = 100,
         optimisation_dedicated_proportion = 0.2,
         slack_time = 0.05,
+        n_jobs = None,
+        halving_factor = 3,
     ):
         self.population_size = population_size
         self.n_novelties = n_novelties
@@ -28,6 +34,8 @@ class OptimisedGPRegressor(BaseEstimator, TransformerMixin):
         self.max_time = max_time
         self.optimisation_dedicated_proportion = optimisation_dedicated_proportion
         self.slack_time = slack_time
+        self.n_jobs = n_jobs
+        self.halving_factor = halving_factor
         self.model = None
     
 
@@ -39,9 +47,20 @@ class OptimisedGPRegressor(BaseEstimator, TransformerMixin):
         crossover_probs = [ 0.8, 0.9, 0.95 ]
         
         CVS = 2
-        
+        n_jobs = self.n_jobs
+        if n_jobs is None:
+            # stay within the cores allotted to the job
+            n_jobs = int(os.environ.get('OMP_NUM_THREADS', 1))
+
+        # Successive halving over timer_limit: every round keeps the best
+        # 1/factor of the candidates and gives them factor times more time.
+        # Each round costs about the same (grid * CVS * min_time), so the
+        # tuning budget, spread over n_jobs workers, is split evenly over
+        # the rounds.
+        factor = self.halving_factor
         param_grid_size = len(n_elites) * len(max_depths) * len(hill_climbings) * len(mutation_probs) * len(crossover_probs)
-        param_alloted_time = int((self.max_time * self.optimisation_dedicated_proportion) / (param_grid_size * CVS))
+        n_rounds = 1 + int(math.log(param_grid_size, factor))
+        param_alloted_time = int((self.max_time * self.optimisation_dedicated_proportion * n_jobs) / (n_rounds * param_grid_size * CVS))
         if param_alloted_time < 1: # For testing
             n_elites = [ 5 ]
             max_depths = [ 10 ]
@@ -49,6 +68,7 @@ class OptimisedGPRegressor(BaseEstimator, TransformerMixin):
             crossover_probs = [ 0.8 ]
 
             param_alloted_time = 1
+            n_rounds = 1 + int(math.log(len(hill_climbings), factor))
             
         param_grid: Union[dict, list] = { 
                                 "population_size": [ self.population_size ],
@@ -61,14 +81,27 @@ class OptimisedGPRegressor(BaseEstimator, TransformerMixin):
                                 "probability_mutation": mutation_probs,
                                 "probability_crossover": crossover_probs,
                                 "timer_stop_criteria": [ True ],
-                                "timer_limit": [ param_alloted_time ],
                                 "metric": [ 'r2' ],
                                 }
 
-        grid_search = GridSearchCV(gengy_regressors.GeneticProgrammingRegressor(),param_grid,cv=CVS)
+        search = HalvingGridSearchCV(
+            gengy_regressors.GeneticProgrammingRegressor(),
+            param_grid,
+            # the folds are shared with the other methods
+            cv=CachedKFold(CVS),
+            factor=factor,
+            resource='timer_limit',
+            min_resources=param_alloted_time,
+            max_resources=param_alloted_time * factor**(n_rounds - 1),
+            refit=False,
+            n_jobs=n_jobs,
+            random_state=self.random_state,
+        )
         
-        grid_search.fit(X,y)
-        model = grid_search.best_estimator_
+        search.fit(X,y)
+        model = gengy_regressors.GeneticProgrammingRegressor(
+            **search.best_params_
+        )
         
         model_alloted_time = int(self.max_time * (1 - self.optimisation_dedicated_proportion - self.slack_time))
         if "timer_limit" in model.get_params():
@@ -138,18 +171,8 @@ def model(est, X=None):
 
     return model_str
 
-def pre_train_fn(est, X, y): 
-    """set max_time in seconds based on length of X."""
-    slack = 20
-    if len(X)<=1000:
-        max_time = 3600 - slack
-    else:
-        max_time = 36000 - slack
-    est.set_params(max_time=max_time)
-
-# pass the function to eval_kwargs
+# max_time is set by evaluate_model from the job's time budget
 eval_kwargs = dict(
-    pre_train=pre_train_fn,
     test_params={'max_time': 100,
                  }
 )
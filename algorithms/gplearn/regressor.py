@@ -1,5 +1,6 @@
 from gplearn.genetic import SymbolicRegressor
 import re
+import numpy as np
 
 hyper_params = []
 for p, g in zip([1000,500,100],[500,1000,5000]):
@@ -37,3 +38,20 @@ def model(est):
 def complexity(est):
     #TODO: check
     return len(re.split('\(|,',model(est)))
+
+def harvest_fn(est, X, y):
+    """after a timeout, use the best program of the last full generation.
+
+    gplearn keeps every finished generation in est._programs but only sets
+    est._program at the end of fit.
+    """
+    programs = [p for p in est._programs[-1] if p is not None]
+    fitness = [p.raw_fitness_ for p in programs]
+    if est._metric.greater_is_better:
+        est._program = programs[np.argmax(fitness)]
+    else:
+        est._program = programs[np.argmin(fitness)]
+
+eval_kwargs = {
+    'harvest': harvest_fn
+}
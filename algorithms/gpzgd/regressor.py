@@ -250,19 +250,17 @@ Options
 """
 
 def pre_train_fn(est, X, y):
+    # timeout is set by evaluate_model from the job's time budget
     if len(X) <= 1000:
         pop_size = 500
         generations = 5000
-        max_time = 3564 ## 99% of one hour
     else:
         pop_size = 200
         generations = 5000
-        max_time = 35640 ## 99% of ten hours
 
     est.tournament_size = 10
     est.pop_size = pop_size
     est.generations = generations
-    est.timeout = max_time
     
 # define eval_kwargs.
 eval_kwargs = {
@@ -1,5 +1,7 @@
 from operon.sklearn import SymbolicRegressor
+from sklearn.base import clone
 import optuna
+from folds import CachedKFold
 import pandas as pd
 import numpy as np
 
@@ -33,8 +35,9 @@ param_distributions = {
         }
 
 # want to tune your estimator? wrap it in a sklearn CV class.
+# the folds are shared with the other methods (see experiment/folds.py)
 reg = SymbolicRegressor(**default_params)
-est = optuna.integration.OptunaSearchCV(reg, param_distributions, cv=5, refit=True, n_trials=50, timeout=2640)
+est = optuna.integration.OptunaSearchCV(reg, param_distributions, cv=CachedKFold(5), refit=True, n_trials=50, timeout=2640)
 
 def model(est, X=None):
     names = X.columns.tolist() if isinstance(X, pd.DataFrame) else None
@@ -68,18 +71,46 @@ Options
             est: sklearn regressor; the fitted model.
             X: pd.DataFrame; the training data.
             y: training labels.
+    set_time_budget: function, default = None
+        Give est a time budget in seconds, called as
+            set_time_budget(est, max_time)
+        before pre_train. By default, the first of max_time, time_limit,
+        timeout_in_seconds and timeout that est has is set.
+    harvest: function, default = None
+        Recover the best model found so far when est.fit times out. Called
+        with the same signature as pre_train.
 """
 
 
-def pre_train_fn(est, X, y):
-    #"""set max_time in seconds based on length of X."""
-    timeout = 2640 if len(X) <= 1000 else 32400
-    est.set_params(timeout=timeout, estimator__time_limit=900)
+# time limit (s) of the refit of harvest_fn
+HARVEST_TIME = 60
+
+
+def set_time_budget_fn(est, max_time):
+    """stop starting trials in time to refit the best one, and to leave
+    room for the refit of harvest_fn if the search overruns."""
+    refit_time = est.estimator.time_limit + 60
+    est.set_params(timeout=max(max_time - refit_time - HARVEST_TIME, 60))
+    return 'timeout'
+
+
+def harvest_fn(est, X, y):
+    """after a timeout, refit with the best parameters found by the trials
+    completed so far (or the defaults, if none completed), within the
+    HARVEST_TIME that set_time_budget_fn kept for it."""
+    try:
+        best_params = est.study_.best_params
+    except (AttributeError, ValueError):
+        best_params = {}
+    best = clone(est.estimator).set_params(**best_params,
+                                           time_limit=HARVEST_TIME)
+    est.best_estimator_ = best.fit(X, y)
 
 
 # pass the function to eval_kwargs
 eval_kwargs = {
-    'pre_train': pre_train_fn,
+    'set_time_budget': set_time_budget_fn,
+    'harvest': harvest_fn,
     'test_params': {'timeout': 60, 'estimator__time_limit': 25 }
 }
 
@@ -71,3 +71,17 @@ eval_kwargs = {
         populations=3,
     )
 }
+
+def harvest_fn(est, X, y):
+    """after a timeout, read the hall of fame PySR saved during the search."""
+    est.refresh()
+
+eval_kwargs["harvest"] = harvest_fn
+
+
+def set_time_budget_fn(est, max_time):
+    """budget 10 minutes for compile time."""
+    est.set_params(timeout_in_seconds=max(max_time - 10*60, 60))
+    return "timeout_in_seconds"
+
+eval_kwargs["set_time_budget"] = set_time_budget_fn
@@ -1,4 +1,6 @@
+import os
 import signal
+import time
 
 import feyn
 import numpy as np
@@ -17,6 +19,19 @@ def alarm_handler(signum, frame):
     raise InternalTimeOutException
 
 
+def available_threads():
+    """number of threads allotted to this job.
+
+    Respects OMP_NUM_THREADS (set from -n_jobs by evaluate_model) so that
+    co-scheduled jobs on the same node do not oversubscribe it; falls back to
+    feyn's own inference when it is not set.
+    """
+    n_threads = os.environ.get('OMP_NUM_THREADS')
+    if n_threads is not None and n_threads.isdigit() and int(n_threads) > 0:
+        return int(n_threads)
+    return feyn.tools.infer_available_threads()
+
+
 def auto_run_time(ql,
                   data,
                   output_name,
@@ -31,8 +46,19 @@ def auto_run_time(ql,
                   sample_weights=None,
                   function_names=None,
                   starting_models=None,
-                  max_time=None
+                  max_time=None,
+                  n_iter_no_change=None,
+                  tol=1e-6
                   ):
+    """Run the QLattice search for n_epochs, or until the budget runs out.
+
+    With max_time set, the budget is spent epoch by epoch: the cost of an
+    epoch is measured as the search goes, and no new epoch is started if it
+    is not expected to finish within max_time. SIGALRM is kept as a hard
+    backstop. With n_iter_no_change set, the search also stops once the loss
+    of the best model has not improved by more than tol for that many epochs.
+    """
+    t_start = time.time()
     if max_time:
         signal.signal(signal.SIGALRM, alarm_handler)
         signal.alarm(max_time)
@@ -43,7 +69,7 @@ def auto_run_time(ql,
         raise ValueError("n_epochs must be 1 or higher.")
 
     if threads == "auto":
-        threads = feyn.tools.infer_available_threads()
+        threads = available_threads()
     elif isinstance(threads, str):
         raise ValueError("threads must be a number, or string 'auto'.")
 
@@ -55,8 +81,12 @@ def auto_run_time(ql,
     priors = feyn.tools.estimate_priors(data, output_name)
     ql.update_priors(priors)
 
+    best_loss = np.inf
+    no_change = 0
+    epoch_time = 0.0
     try:
         for epoch in range(1, n_epochs + 1):
+            t_epoch = time.time()
             new_sample = ql.sample_models(
                 data,
                 output_name,
@@ -81,12 +111,38 @@ def auto_run_time(ql,
             models = feyn.prune_models(models)
             ql.update(models)
 
+            # slowest epoch so far, as the cost estimate for the next one
+            epoch_time = max(epoch_time, time.time() - t_epoch)
+            if max_time:
+                time_left = max_time - (time.time() - t_start)
+                if time_left < epoch_time:
+                    print('stopping after epoch', epoch, ': time left',
+                          round(time_left, 1), 's < epoch cost',
+                          round(epoch_time, 1), 's')
+                    break
+
+            if n_iter_no_change and len(models) > 0:
+                loss = min(m.loss_value for m in models)
+                if loss < best_loss - tol:
+                    best_loss = loss
+                    no_change = 0
+                else:
+                    no_change += 1
+                if no_change >= n_iter_no_change:
+                    print('stopping after epoch', epoch, ': no improvement '
+                          'in', n_iter_no_change, 'epochs')
+                    break
+
         best = feyn.get_diverse_models(models)
 
     except InternalTimeOutException:
         print('InternalTimeOutException raised')
         best = feyn.get_diverse_models(models)
 
+    finally:
+        if max_time:
+            signal.alarm(0)
+
     return best
 
 
@@ -135,7 +191,9 @@ class QLatticeRegressor(BaseEstimator, RegressorMixin):
                  function_names=None,
                  starting_models=None,
                  random_state=None,
-                 max_time=None
+                 max_time=None,
+                 n_iter_no_change=None,
+                 tol=1e-6
                  ):
         self.kind = kind
         self.stypes = stypes
@@ -150,6 +208,8 @@ class QLatticeRegressor(BaseEstimator, RegressorMixin):
         self.starting_models = starting_models
         self.random_state = random_state
         self.max_time = max_time
+        self.n_iter_no_change = n_iter_no_change
+        self.tol = tol
 
     def fit(self, X, y, sample_weight=None):
 
@@ -191,7 +251,9 @@ class QLatticeRegressor(BaseEstimator, RegressorMixin):
                                      sample_weights=sample_weight,
                                      function_names=self.function_names,
                                      starting_models=self.starting_models,
-                                     max_time=self.max_time
+                                     max_time=self.max_time,
+                                     n_iter_no_change=self.n_iter_no_change,
+                                     tol=self.tol
                                      )
         return self
 
@@ -229,6 +291,7 @@ est = QLatticeRegressor(
     n_epochs=200,
     max_complexity=10,
     criterion='wide_parsimony',
+    n_iter_no_change=20,
 )
 
 
@@ -279,18 +342,8 @@ Options
 """
 
 
-def pre_train_fn(est, X, y):
-    """set max_time in seconds based on length of X."""
-    if len(X) <= 1000:
-        max_time = 3600 - 5
-    else:
-        max_time = 36000 - 5
-    est.set_params(max_time=max_time)
-
-
-# define eval_kwargs.
+# max_time is set by evaluate_model from the job's time budget
 eval_kwargs = dict(
-    pre_train=pre_train_fn,
     test_params={'n_epochs': 2,
                  }
 )
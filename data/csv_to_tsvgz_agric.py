@@ -8,15 +8,25 @@ dropna, categorical encoding, LabelEncoder on Crop_Type and Seasonal_Factor) but
 - No train/test split here (SRBench does the split when loading).
 
 So the TSV.GZ files in agric_01_*, agric_001_* contain raw, unscaled feature and target values.
+
+The merge is many-to-many on the crop (each farm is paired with every market of its crop), so
+the merged data is about n_farms * n_markets / n_crops rows. It is never held in memory: the
+raw CSVs are read in chunks with explicit dtypes, the crops are encoded as integer keys, and the
+rows of every requested sample fraction are written block by block (the rows of one farm at a
+time), in the order of the pandas merge. The TSV.GZ files are block gzip (see
+experiment/bgzf.py), compressed on all cores. Each dataset also gets a binary sidecar,
+<name>.npy, a float64 array of the same rows (features, then target) that read_file loads
+instead of parsing the TSV.GZ.
 """
-import csv
-import gzip
 import os
+import sys
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
 
 SRB = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SRB, '..', 'experiment'))
+import bgzf
+
 DATA_AGRIC = os.path.join(SRB, "data_agric")
 
 # Configuration
@@ -31,6 +41,32 @@ TARGETS = {
     "consumer_trend": "Consumer_Trend_Index"
 }
 
+# Raw columns used, with their dtypes (IDs are dropped by the merge)
+FARMER_DTYPES = {
+    'Crop_Type': str, 'Soil_pH': 'float64', 'Soil_Moisture': 'float64',
+    'Temperature_C': 'float64', 'Rainfall_mm': 'float64', 'Fertilizer_Usage_kg': 'float64',
+    'Pesticide_Usage_kg': 'float64', 'Crop_Yield_ton': 'float64', 'Sustainability_Score': 'float64'
+}
+MARKET_DTYPES = {
+    'Product': str, 'Market_Price_per_ton': 'float64', 'Demand_Index': 'float64',
+    'Supply_Index': 'float64', 'Competitor_Price_per_ton': 'float64',
+    'Economic_Indicator': 'float64', 'Weather_Impact_Score': 'float64', 'Seasonal_Factor': str,
+    'Consumer_Trend_Index': 'float64'
+}
+# Features, in the order of mtr_ginn_agric_sym.py: farm columns, then market columns
+FARMER_FEATURES = ['Crop_Type', 'Soil_pH', 'Soil_Moisture', 'Temperature_C', 'Rainfall_mm',
+                   'Fertilizer_Usage_kg', 'Pesticide_Usage_kg', 'Crop_Yield_ton']
+MARKET_FEATURES = ['Market_Price_per_ton', 'Demand_Index', 'Supply_Index',
+                   'Competitor_Price_per_ton', 'Economic_Indicator', 'Weather_Impact_Score',
+                   'Seasonal_Factor']
+FEATURES = FARMER_FEATURES + MARKET_FEATURES
+
+CHUNKSIZE = 100000
+# Merged rows written at a time
+BLOCK_ROWS = 100000
+# Line terminator of the TSV (that of csv.writer)
+LINE_END = '\r\n'
+
 def get_dataset_name(base_name, sample_fraction):
     """Generate dataset name with sample fraction prefix."""
     if sample_fraction == 0.1:
@@ -42,98 +78,84 @@ def get_dataset_name(base_name, sample_fraction):
         frac_str = str(int(sample_fraction * 1000)).zfill(3)
         return f"agric_{frac_str}_{base_name}"
 
-def process_agriculture_data(sample_fraction=0.1):
-    """
-    Process agriculture data following the same steps as mtr_ginn_agric_sym.py
-    Returns: processed DataFrame with all features and both targets
-    """
-    # Load raw CSVs
-    fa_ds = pd.read_csv(os.path.join(DATA_AGRIC, 'farmer_advisor_dataset.csv'))
-    mr_ds = pd.read_csv(os.path.join(DATA_AGRIC, 'market_researcher_dataset.csv'))
-    
+def read_raw(filename, dtypes, chunksize=CHUNKSIZE):
+    """Read the columns in dtypes of a raw CSV, chunk by chunk."""
+    chunks = pd.read_csv(filename, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize)
+    return pd.concat(chunks, ignore_index=True)
+
+def load_raw_data():
+    fa_ds = read_raw(os.path.join(DATA_AGRIC, 'farmer_advisor_dataset.csv'), FARMER_DTYPES)
+    mr_ds = read_raw(os.path.join(DATA_AGRIC, 'market_researcher_dataset.csv'), MARKET_DTYPES)
     print(f"Loaded farmer_advisor: {len(fa_ds)} rows")
     print(f"Loaded market_researcher: {len(mr_ds)} rows")
-    
-    # Optional sampling
-    if sample_fraction is not None and 0 < sample_fraction < 1:
-        fa_ds = fa_ds.sample(frac=sample_fraction, random_state=RANDOM_STATE_SAMPLE)
-        mr_ds = mr_ds.sample(frac=sample_fraction, random_state=RANDOM_STATE_SAMPLE)
-        print(f"After sampling ({sample_fraction}): {len(fa_ds)} rows each")
-    
-    # Sort
-    fa_ds.sort_values('Crop_Type', inplace=True)
-    mr_ds.sort_values('Product', inplace=True)
-    
-    # Merge and select columns
-    df_mrg = pd.merge(fa_ds, mr_ds, left_on='Crop_Type', right_on='Product', how='inner').drop(
-        ['Farm_ID', 'Market_ID', 'Product'], axis=1
-    )
-    print(f"After merge: {len(df_mrg)} rows")
-    
-    # Select specific columns (same as mtr_ginn_agric_sym.py)
-    df_mrg = df_mrg[[
-        'Crop_Type', 'Soil_pH', 'Soil_Moisture', 'Temperature_C', 'Rainfall_mm',
-        'Fertilizer_Usage_kg', 'Pesticide_Usage_kg', 'Crop_Yield_ton',
-        'Market_Price_per_ton', 'Demand_Index', 'Supply_Index', 'Competitor_Price_per_ton', 'Economic_Indicator',
-        'Weather_Impact_Score', 'Seasonal_Factor', 'Sustainability_Score', 'Consumer_Trend_Index'
-    ]]
-    
-    # Cleanup
-    df_mrg.dropna(inplace=True)
-    print(f"After dropna: {len(df_mrg)} rows")
-    
-    # Convert object columns to category
-    for col in df_mrg.select_dtypes(include=['object']).columns:
-        df_mrg[col] = df_mrg[col].astype('category')
-    
-    # Encode categoricals used in features (same as mtr_ginn_agric_sym.py)
-    df = df_mrg.copy()
-    for c in ['Crop_Type', 'Seasonal_Factor']:
-        if c in df.columns:
-            le = LabelEncoder()
-            df[c] = le.fit_transform(df[c])
-            print(f"Encoded {c}: {len(le.classes_)} unique values")
-    
-    return df
+    return fa_ds, mr_ds
 
-def create_dataset(df, dataset_name, target_col, sample_fraction=0.1):
-    """
-    Create a single-target dataset for SRBench.
-    
-    Args:
-        df: Processed DataFrame with all features and targets
-        dataset_name: Name for the dataset (e.g., 'agric_sustainability')
-        target_col: Name of the target column
-        sample_fraction: Sample fraction used (for naming)
+def _text(values):
+    """Values as written by the TSV writer (float64, shortest repr)."""
+    return np.asarray(values, dtype=np.float64).astype(str)
+
+def _rows_text(columns):
+    return ['\t'.join(row) for row in zip(*(_text(c) for c in columns))]
+
+class AgricMerge:
+    """The merge of mtr_ginn_agric_sym.py for one sample fraction, with integer keys.
+
+    Farms and markets are sampled and sorted as in the reference script, rows with missing
+    values are dropped, and Crop_Type and Seasonal_Factor are encoded as LabelEncoder does
+    (the sorted values present in the merge). The merged rows are those of each farm, in
+    sorted order, paired with the markets of its crop, in sorted order.
     """
-    # Select features (all columns except both targets)
-    feature_cols = [col for col in df.columns if col not in ['Sustainability_Score', 'Consumer_Trend_Index']]
-    target_data = df[target_col].values
-    
-    # Create output directory
-    out_dir = os.path.join(SRB, dataset_name)
-    os.makedirs(out_dir, exist_ok=True)
-    
-    # Create TSV.GZ file
-    tsv_gz_path = os.path.join(out_dir, f"{dataset_name}.tsv.gz")
-    
-    # Prepare data: features + target (use position i, not row index, for target_data)
-    data_rows = []
-    for i, (_, row) in enumerate(df.iterrows()):
-        feature_values = [str(row[col]) for col in feature_cols]
-        data_rows.append(feature_values + [str(target_data[i])])
-    
-    # Write header + data
-    with gzip.open(tsv_gz_path, "wt", encoding="utf-8") as f_out:
-        w = csv.writer(f_out, delimiter="\t")
-        # Write header: feature names + "target"
-        w.writerow(feature_cols + ["target"])
-        # Write data rows
-        w.writerows(data_rows)
-    
-    print(f"Created {tsv_gz_path}: {len(data_rows)} rows, {len(feature_cols)} features")
-    
-    # Create metadata.yaml
+    def __init__(self, fa_ds, mr_ds, sample_fraction=0.1):
+        # Optional sampling
+        if sample_fraction is not None and 0 < sample_fraction < 1:
+            fa_ds = fa_ds.sample(frac=sample_fraction, random_state=RANDOM_STATE_SAMPLE)
+            mr_ds = mr_ds.sample(frac=sample_fraction, random_state=RANDOM_STATE_SAMPLE)
+            print(f"After sampling ({sample_fraction}): {len(fa_ds)} rows each")
+        # Sort (the same sort as the reference, so that ties keep its order)
+        fa_ds = fa_ds.sort_values('Crop_Type').dropna()
+        mr_ds = mr_ds.sort_values('Product').dropna()
+
+        # Integer keys: the crops of both datasets
+        crops = np.intersect1d(fa_ds['Crop_Type'].to_numpy(dtype=object),
+                               mr_ds['Product'].to_numpy(dtype=object))
+        fa_key = pd.Categorical(fa_ds['Crop_Type'], categories=crops).codes
+        mr_key = pd.Categorical(mr_ds['Product'], categories=crops).codes
+        fa_ds, fa_key = fa_ds[fa_key >= 0], fa_key[fa_key >= 0]
+        mr_ds, mr_key = mr_ds[mr_key >= 0], mr_key[mr_key >= 0]
+        seasons = np.unique(mr_ds['Seasonal_Factor'].to_numpy(dtype=object))
+        print(f"Encoded Crop_Type: {len(crops)} unique values")
+        print(f"Encoded Seasonal_Factor: {len(seasons)} unique values")
+
+        self.fa = fa_ds.assign(Crop_Type=fa_key)
+        self.mr = mr_ds.assign(Seasonal_Factor=pd.Categorical(
+            mr_ds['Seasonal_Factor'], categories=seasons).codes)
+        self.fa_key = fa_key
+        # market rows of each crop, in sorted order
+        self.groups = [np.flatnonzero(mr_key == k) for k in range(len(crops))]
+        self.sizes = np.array([len(g) for g in self.groups])
+        self.n_rows = int(self.sizes[fa_key].sum())
+        print(f"After merge: {self.n_rows} rows")
+
+    def blocks(self, block_rows=BLOCK_ROWS):
+        """Yield (farm rows, market rows) index arrays of consecutive merged rows, about
+        block_rows at a time, whole farms per block."""
+        ends = np.cumsum(self.sizes[self.fa_key])
+        start = 0
+        while start < len(self.fa_key):
+            stop = max(start + 1, int(np.searchsorted(ends, ends[start] + block_rows - 1,
+                                                      side='right')))
+            farms = np.arange(start, stop)
+            groups = [self.groups[k] for k in self.fa_key[start:stop]]
+            yield (np.repeat(farms, self.sizes[self.fa_key[start:stop]]),
+                   np.concatenate(groups))
+            start = stop
+
+def _write_npy_header(f, n_rows, n_cols):
+    np.lib.format.write_array_header_1_0(
+        f, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+            'fortran_order': False, 'shape': (n_rows, n_cols)})
+
+def write_metadata(out_dir, dataset_name, target_col, feature_cols, sample_fraction):
     metadata_path = os.path.join(out_dir, "metadata.yaml")
     with open(metadata_path, "w") as f:
         f.write(f"dataset: {dataset_name}\n")
@@ -146,47 +168,95 @@ def create_dataset(df, dataset_name, target_col, sample_fraction=0.1):
         for i, col in enumerate(feature_cols, 1):
             f.write(f"  - name: {col}\n")
             f.write("    type: continuous\n")
-    
     print(f"Created {metadata_path}")
-    
-    return tsv_gz_path, len(data_rows), len(feature_cols)
+
+def create_datasets(merge, sample_fraction=0.1):
+    """
+    Write the single-target datasets of every target of a merge in one pass over its rows:
+    <name>/<name>.tsv.gz, the binary sidecar <name>/<name>.npy and <name>/metadata.yaml.
+
+    Returns a list of (dataset_name, n_rows, n_features).
+    """
+    fa, mr = merge.fa, merge.mr
+    # Text of each farm and market row, formatted once
+    fa_text = _rows_text([fa[c] for c in FARMER_FEATURES])
+    mr_text = _rows_text([mr[c] for c in MARKET_FEATURES])
+    fa_values = fa[FARMER_FEATURES].to_numpy(dtype=np.float64)
+    mr_values = mr[MARKET_FEATURES].to_numpy(dtype=np.float64)
+
+    outputs = []
+    for base_name, target_col in TARGETS.items():
+        dataset_name = get_dataset_name(base_name, sample_fraction)
+        out_dir = os.path.join(SRB, dataset_name)
+        os.makedirs(out_dir, exist_ok=True)
+        from_farm = target_col in fa.columns
+        target = (fa if from_farm else mr)[target_col].to_numpy(dtype=np.float64)
+        tsv = bgzf.BgzfWriter(os.path.join(out_dir, f"{dataset_name}.tsv.gz"))
+        tsv.write('\t'.join(FEATURES + ["target"]) + LINE_END)
+        npy = open(os.path.join(out_dir, f"{dataset_name}.npy"), "wb")
+        _write_npy_header(npy, merge.n_rows, len(FEATURES) + 1)
+        outputs.append((dataset_name, out_dir, target_col, from_farm, target, _text(target),
+                        tsv, npy))
+
+    for farms, markets in merge.blocks():
+        left_text = [fa_text[i] for i in farms]
+        right_text = [mr_text[j] for j in markets]
+        values = np.hstack([fa_values[farms], mr_values[markets], np.zeros((len(farms), 1))])
+        for _, _, _, from_farm, target, target_text, tsv, npy in outputs:
+            rows = farms if from_farm else markets
+            tsv.write(''.join(a + '\t' + b + '\t' + t + LINE_END for a, b, t in
+                              zip(left_text, right_text, target_text[rows])))
+            values[:, -1] = target[rows]
+            npy.write(values.tobytes())
+
+    results = []
+    for dataset_name, out_dir, target_col, _, _, _, tsv, npy in outputs:
+        tsv.close()
+        npy.close()
+        # the sidecar is used while it is not older than the TSV.GZ
+        os.utime(npy.name)
+        print(f"Created {os.path.join(out_dir, dataset_name)}.tsv.gz and .npy: "
+              f"{merge.n_rows} rows, {len(FEATURES)} features")
+        write_metadata(out_dir, dataset_name, target_col, FEATURES, sample_fraction)
+        results.append((dataset_name, merge.n_rows, len(FEATURES)))
+    return results
 
 if __name__ == "__main__":
     import sys
     
-    # Allow sample fraction to be passed as command-line argument
-    if len(sys.argv) > 1:
+    # Allow sample fractions to be passed as command-line arguments
+    sample_fracs = []
+    for arg in sys.argv[1:]:
         try:
-            sample_frac = float(sys.argv[1])
+            sample_frac = float(arg)
             if not (0 < sample_frac <= 1):
                 raise ValueError("Sample fraction must be between 0 and 1")
         except ValueError as e:
-            print(f"Error: Invalid sample fraction '{sys.argv[1]}'. {e}")
-            print("Usage: python csv_to_tsvgz_agric.py [sample_fraction]")
+            print(f"Error: Invalid sample fraction '{arg}'. {e}")
+            print("Usage: python csv_to_tsvgz_agric.py [sample_fraction ...]")
             print("Example: python csv_to_tsvgz_agric.py 0.1")
-            print("Example: python csv_to_tsvgz_agric.py 0.01")
+            print("Example: python csv_to_tsvgz_agric.py 0.01 0.1 1")
             sys.exit(1)
-    else:
-        sample_frac = SAMPLE_FRACTION
+        sample_fracs.append(sample_frac)
+    if not sample_fracs:
+        sample_fracs = [SAMPLE_FRACTION]
     
     print("=" * 60)
     print("Converting Agriculture CSVs to SRBench TSV.GZ format")
     print("=" * 60)
-    print(f"Sample fraction: {sample_frac}")
+    print(f"Sample fractions: {sample_fracs}")
     print()
     
-    # Process data
-    df = process_agriculture_data(sample_fraction=sample_frac)
-    print()
+    # Read the raw data once for all sample fractions
+    fa_ds, mr_ds = load_raw_data()
     
-    # Create datasets for each target (with sample fraction in name)
+    # Create datasets for each fraction and target (with sample fraction in name)
     results = []
-    for base_name, target_col in TARGETS.items():
-        dataset_name = get_dataset_name(base_name, sample_frac)
-        print(f"\nCreating dataset: {dataset_name} (target: {target_col})")
+    for sample_frac in sample_fracs:
+        print(f"\nCreating datasets for sample fraction {sample_frac}")
         print("-" * 60)
-        tsv_path, n_rows, n_features = create_dataset(df, dataset_name, target_col, sample_frac)
-        results.append((dataset_name, n_rows, n_features))
+        merge = AgricMerge(fa_ds, mr_ds, sample_frac)
+        results += create_datasets(merge, sample_frac)
     
     print("\n" + "=" * 60)
     print("Conversion complete!")
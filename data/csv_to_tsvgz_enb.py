@@ -6,6 +6,8 @@ and Y2=Cooling) but:
 - No MinMaxScaler on features (data is not scaled).
 - No train/test split here (SRBench does the split when loading).
 
+The TSV.GZ files are block gzip (see experiment/bgzf.py), which read_file decompresses in parallel.
+
 Supports two input modes:
 1) Single combined file: data_enb/ENB2012_data.csv with 8 feature columns + 2 target
    columns (e.g. X1..X8, Y1, Y2 or target_1, target_2). Same structure as the Excel
@@ -14,11 +16,13 @@ Supports two input modes:
    X1..X8 + target), used as-is with no transformation.
 """
 import csv
-import gzip
 import os
+import sys
 import pandas as pd
 
 SRB = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SRB, '..', 'experiment'))
+import bgzf
 DATA_ENB = os.path.join(SRB, "data_enb")
 
 # Same as mtr_ginn_sym.py: 8 features, 2 targets (Y1=Heating, Y2=Cooling)
@@ -55,7 +59,7 @@ def write_tsvgz_and_metadata(out_dir, name, feature_cols, X, y, target_descripti
     os.makedirs(out_dir, exist_ok=True)
     tsv_gz_path = os.path.join(out_dir, f"{name}.tsv.gz")
     n_rows = len(y)
-    with gzip.open(tsv_gz_path, "wt", encoding="utf-8") as f_out:
+    with bgzf.BgzfWriter(tsv_gz_path) as f_out:
         w = csv.writer(f_out, delimiter="\t")
         w.writerow(feature_cols + ["target"])
         for i in range(n_rows):
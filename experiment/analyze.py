@@ -5,9 +5,15 @@ import numpy as np
 from glob import glob
 import argparse
 import os, errno, sys
-from joblib import Parallel, delayed
+import time
 from seeds import SEEDS
 from yaml import load, Loader
+import slurm
+import packing
+import ledger
+from executors import get_executor, EXECUTORS
+from budget import read_cost_model, dataset_time_budget
+from read_file import multi_target_siblings
 
 #TODO make this script smarter about running jobs. 
 # have it check to see whether results for that job exist before
@@ -28,8 +34,18 @@ if __name__ == '__main__':
             help='Run locally as opposed to on LPC')
     parser.add_argument('--slurm', action='store_true', dest='SLURM', default=False, 
             help='Run on a SLURM scheduler as opposed to on LPC')
+    parser.add_argument('-executor', action='store', dest='EXECUTOR',
+            default=None, choices=EXECUTORS,
+            help='Backend that runs the jobs. Defaults to pool with --local, '
+            'slurm with --slurm and lsf otherwise')
     parser.add_argument('--noskips', action='store_true', dest='NOSKIPS', default=False, 
             help='Overwite existing results if found')
+    parser.add_argument('-tune', action='store_true', dest='TUNE', default=False, 
+            help='Tune the hyper_params of each method with successive halving')
+    parser.add_argument('-multi_target', action='store_true',
+            dest='MULTI_TARGET', default=False,
+            help='Evaluate the targets of multi-target datasets (agric, enb) '
+            'in one job that shares their features')
     parser.add_argument('-skip_tuning', action='store_true', dest='SKIP_TUNE', default=False, 
             help='Skip tuning step')
     parser.add_argument('-A', action='store', dest='A', default='plgsrbench', 
@@ -41,7 +57,8 @@ if __name__ == '__main__':
     parser.add_argument('-n_jobs',action='store',dest='N_JOBS',default=1,type=int,
             help='Number of parallel jobs')
     parser.add_argument('-time_limit',action='store',dest='TIME',default='48:00',
-            type=str, help='Time limit (hr:min) e.g. 24:00')
+            type=str, help='Maximum time limit (hr:min) e.g. 24:00; jobs '
+            'get the time budget of their dataset (see budget.py)')
     parser.add_argument('-seed',action='store',dest='SEED',default=None,
             type=int, help='A specific random seed')
     parser.add_argument('-n_trials',action='store',dest='N_TRIALS',default=1,
@@ -68,6 +85,34 @@ if __name__ == '__main__':
     parser.add_argument('-feature_noise',action='store',dest='X_NOISE',
                         default=0.0, type=float, help='Gaussian noise to add'
                         'to the target')
+    parser.add_argument('--array',action='store_true',dest='ARRAY',
+                        default=False, help='With --slurm, submit the jobs as '
+                        'job arrays of a manifest file')
+    parser.add_argument('-array_throttle',action='store',dest='THROTTLE',
+                        default=100, type=int,
+                        help='Maximum number of array tasks running at once')
+    parser.add_argument('-array_max',action='store',dest='ARRAY_MAX',
+                        default=1000, type=int,
+                        help='Maximum array size (SLURM MaxArraySize)')
+    parser.add_argument('-pack',action='store_true',dest='PACK',
+                        default=False, help='Pack short jobs into shared '
+                        'scheduler jobs run by a local pool of N_JOBS workers')
+    parser.add_argument('-short_time',action='store',dest='SHORT_TIME',
+                        default=600, type=int,
+                        help='Jobs predicted by the cost model to run at '
+                        'most this long (s) are packed')
+    parser.add_argument('-pack_time',action='store',dest='PACK_TIME',
+                        default=3600, type=int,
+                        help='Predicted runtime (s) of each pack')
+    parser.add_argument('-cost_model',action='store',dest='COST_MODEL',
+                        default=None, type=str,
+                        help='Cost model file (from budget.py) used to '
+                        'predict runtimes and set the time limits of jobs')
+    parser.add_argument('-max_attempts',action='store',dest='MAX_ATTEMPTS',
+                        default=ledger.MAX_ATTEMPTS, type=int,
+                        help='Give up on jobs that failed this many times. '
+                        'Jobs that ran out of memory or time are retried '
+                        'with more of it')
     parser.add_argument('-job_limit',action='store',dest='JOB_LIMIT',
                         default=1000, type=int, 
                         help='Limit number of jobs submitted at once')
@@ -104,14 +149,29 @@ if __name__ == '__main__':
     #####################################################
     ## look for existing jobs
     ########################
-    current_jobs = []
-    if args.SLURM:
-        res = subprocess.check_output(['squeue -o "%j"'],shell=True)
-        current_jobs = res.decode().split('\n')
-    elif not args.LOCAL:
-        res = subprocess.check_output(['bjobs -o "JOB_NAME" -noheader'],shell=True)
-        current_jobs = res.decode().split('\n')
+    if args.EXECUTOR is None:
+        args.EXECUTOR = ('pool' if args.LOCAL else
+                         'slurm' if args.SLURM else 'lsf')
+    manifest_dir = os.path.join(args.RDIR, 'manifests')
+    pack_dir = os.path.join(args.RDIR, 'packs')
+    executor = get_executor(args.EXECUTOR, n_jobs=args.N_JOBS,
+                            account=args.A, queue=args.QUEUE,
+                            array=args.ARRAY, array_name=args.SCRIPT,
+                            throttle=args.THROTTLE,
+                            max_array_size=args.ARRAY_MAX,
+                            manifest_dir=manifest_dir)
+    local = args.EXECUTOR in ['local', 'pool']
+    current_jobs = executor.queued_names()
+    queued_commands = set()
+    for d in [manifest_dir, pack_dir]:
+        queued_commands.update(slurm.queued_commands(d, current_jobs))
     # current_jobs = ['_'.join(cj.split('_')[:-1]) for cj in current_jobs]
+    # attempts at each experiment, from the job ledger
+    index_file = os.path.join(args.RDIR, 'index.jsonl')
+    job_ledger = ledger.read_ledger(index_file)
+
+    cost_model = (read_cost_model(args.COST_MODEL) if args.COST_MODEL
+                  else None)
 
     # write run commands
     jobs_w_results = []
@@ -119,6 +179,7 @@ if __name__ == '__main__':
     suffix = ('.json.updated' if args.SCRIPT=='assess_symbolic_model' else
                   '.json')
     queued_jobs = []
+    gave_up_jobs = []
     all_commands = []
     job_info=[]
     for t in range(args.START_SEED, args.START_SEED+args.N_TRIALS):
@@ -141,6 +202,19 @@ if __name__ == '__main__':
                 continue
 
             dataname = os.path.basename(dataset).replace('.tsv.gz', '')
+            sibling_names = [dataname]
+            if args.MULTI_TARGET:
+                siblings = multi_target_siblings(dataset)
+                # one job evaluates all targets, from the first of them
+                if dataset != min(siblings) and min(siblings) in datasets:
+                    continue
+                sibling_names = [os.path.basename(s).replace('.tsv.gz', '')
+                                 for s in siblings]
+            # a multi-target job fits its targets with up to N_JOBS
+            # workers: each worker needs the memory of a job, for the time
+            # of its share of the targets
+            n_workers = min(args.N_JOBS, len(sibling_names))
+            job_memory = executor.workers_memory(args.M, n_workers)
             # Results go into algorithm-specific subdirectories under args.RDIR
             results_path = args.RDIR
             if not os.path.exists(results_path):
@@ -162,8 +236,21 @@ if __name__ == '__main__':
                 if not os.path.exists(algo_results_path):
                     os.makedirs(algo_results_path)
                 
+                # the wall clock the job's budget is derived from (see
+                # budget.py), within -time_limit
+                job_seconds = (dataset_time_budget(ml, dataset,
+                                                   cost_model)['job_time']
+                               * -(-len(sibling_names)//n_workers))
+                job_time = packing.seconds_to_time(
+                    min(job_seconds, packing.time_to_seconds(args.TIME)))
+
                 # Filename without prefix (since we're in algorithm folder)
                 base_name = dataname + '_' + ml + '_' + str(random_state)
+                key = base_name
+                if args.Y_NOISE > 0:
+                    key += '_target-noise'+str(args.Y_NOISE)
+                if args.X_NOISE > 0:
+                    key += '_feature-noise'+str(args.X_NOISE)
                 save_file = os.path.join(algo_results_path, base_name)
                 # if updated, check if json file exists (required)
                 if ('updated' in suffix 
@@ -180,24 +267,25 @@ if __name__ == '__main__':
                         save_file += '_feature-noise'+str(args.X_NOISE)
 
                     # check if there is already a result for this experiment
-                    if (os.path.exists(save_file+suffix) 
+                    # (for every target, with -multi_target)
+                    if (all(os.path.exists(os.path.join(
+                            algo_results_path,
+                            os.path.basename(save_file).replace(
+                                dataname, name, 1)) + suffix)
+                            for name in sibling_names)
                         and args.SCRIPT != 'fix_aifeynman_model_size'):
                         jobs_w_results.append([save_file,'exists'])
                         continue
-                    # check if there is already a queued job for this experiment
-                    if os.path.basename(save_file) in current_jobs:
-                        queued_jobs.append([save_file,'queued'])
-                        continue
 
-                
-                all_commands.append('python {SCRIPT}.py '
+                run_cmd = ('python {SCRIPT}.py '
                                     '{DATASET}'
                                     ' -ml {ML}'
                                     ' -results_path {RDIR}'
                                     ' -seed {RS} '
                                     ' -target_noise {TN} '
                                     ' -feature_noise {FN} '
-                                    '{TEST} {SYM_DATA} {SKIP_TUNE}'.format(
+                                    '{TEST} {SYM_DATA} {TUNE} {SKIP_TUNE}'
+                                    '{MULTI_TARGET}{COST_MODEL}'.format(
                                         SCRIPT=args.SCRIPT,
                                         ML=ml,
                                         DATASET=dataset,
@@ -209,109 +297,145 @@ if __name__ == '__main__':
                                                 else ''),
                                         SYM_DATA=('-sym_data' if args.SYM_DATA
                                                    else ''),
+                                        TUNE=('-tune' if args.TUNE
+                                              else ''),
                                         SKIP_TUNE=('-skip_tuning' if
-                                                   args.SKIP_TUNE else '')
+                                                   args.SKIP_TUNE else ''),
+                                        COST_MODEL=(
+                                            ' -cost_model ' + args.COST_MODEL
+                                            if args.COST_MODEL else ''),
+                                        MULTI_TARGET=(
+                                            ' -multi_target -n_jobs {}'.format(
+                                                args.N_JOBS)
+                                            if args.MULTI_TARGET else '')
                                         )
                                     )
+                # record how the job ends in the job ledger
+                run_cmd = ledger.wrap(run_cmd, index_file, key)
+                if not args.NOSKIPS:
+                    # check if there is already a queued job for this experiment
+                    if (os.path.basename(save_file) in current_jobs
+                        or run_cmd in queued_commands):
+                        queued_jobs.append([save_file,'queued'])
+                        continue
+                # triage previous attempts, giving failed jobs more memory
+                # or time
+                retry = ledger.retry_resources(
+                    [] if args.NOSKIPS else job_ledger.get(key, []),
+                    job_time, job_memory, args.MAX_ATTEMPTS)
+                if retry is None:
+                    gave_up_jobs.append([save_file,'gave up'])
+                    continue
+
+                all_commands.append(run_cmd)
                 job_info.append({'ml':ml,
                                  'dataset':dataname,
+                                 'dataset_path':dataset,
                                  'seed':str(random_state),
                                  'results_path':results_path,
-                                 'target_noise':args.Y_NOISE
+                                 'target_noise':args.Y_NOISE,
+                                 'key':key,
+                                 'attempt':retry['attempt'],
+                                 'outcome':retry['outcome'],
+                                 'time':retry['time'],
+                                 'memory':retry['memory']
                                  })
     if len(all_commands) > args.JOB_LIMIT:
         print('shaving jobs down to job limit ({})'.format(args.JOB_LIMIT))
         all_commands = all_commands[:args.JOB_LIMIT]
+        job_info = job_info[:args.JOB_LIMIT]
     if not args.NOSKIPS:
         print('skipped',len(jobs_w_results),'jobs with results. Override with --noskips.')
         print('skipped',len(jobs_wout_results),'jobs without results. Override with --noskips.')
         print('skipped',len(queued_jobs),'queued jobs. Override with --noskips.')
-    print('submitting',len(all_commands),'jobs...')
-    if args.LOCAL:
-        # run locally  
-        Parallel(n_jobs=args.N_JOBS)(delayed(os.system)(run_cmd)
-                                 for run_cmd in all_commands)
-        #for run_cmd in all_commands:
-        #    print(run_cmd)
-        #    os.system(run_cmd)
-    else:
-        # sbatch
-        for i,run_cmd in enumerate(all_commands):
-            job_name = '_'.join([
-                                 job_info[i]['dataset'],
-                                 job_info[i]['ml'],
-                                 job_info[i]['seed'],
-                                 args.SCRIPT
-                                ])
-            if args.Y_NOISE>0:
-                job_name += '_target-noise'+str(args.Y_NOISE)
-            if args.X_NOISE>0:
-                job_name += '_feature-noise'+str(args.X_NOISE)
-            out_file = (job_info[i]['results_path']
-                        + job_name 
-                        + '.%J.out')
-            error_file = out_file[:-4] + '.err'
-            
-            if args.SLURM:
-                    batch_script = \
-"""#!/usr/bin/bash 
-#SBATCH -o {OUT_FILE} 
-#SBATCH --error={ERR_FILE} 
-#SBATCH -N 1 
-#SBATCH -n {N_CORES} 
-#SBATCH -J {JOB_NAME} 
-#SBATCH -A {A} -p {QUEUE} 
-#SBATCH --ntasks-per-node=1 --time={TIME}:00 
-#SBATCH --mem-per-cpu={M} 
-
-conda info 
-source plg_modules.sh
+        print('gave up on',len(gave_up_jobs),'jobs that failed',
+              args.MAX_ATTEMPTS,'times. Override with --noskips.')
+    retries = {}
+    for ji in job_info:
+        if ji['attempt'] > 1:
+            retries[ji['outcome']] = retries.get(ji['outcome'], 0) + 1
+    if retries:
+        print('retrying failed jobs:',
+              ', '.join('{} {}'.format(n, o) for o,n in retries.items()))
+    if args.PACK and not local:
+        # replace the jobs predicted to be short by packs of them
+        runtimes = [packing.predicted_runtime(ji['ml'], ji['dataset_path'],
+                                              cost_model, args.TEST)
+                    for ji in job_info]
+        # retries keep their own (escalated) resources
+        # jobs without a predicted runtime are not packed
+        short = [i for i,rt in enumerate(runtimes)
+                 if rt is not None and rt <= args.SHORT_TIME
+                 and job_info[i]['attempt'] == 1]
+        packs, loads = packing.pack_jobs([runtimes[i] for i in short],
+                                         args.PACK_TIME*args.N_JOBS)
+        short_commands = [all_commands[i] for i in short]
+        short_info = [job_info[i] for i in short]
+        keep = [i for i in range(len(all_commands)) if i not in set(short)]
+        all_commands = [all_commands[i] for i in keep]
+        job_info = [job_info[i] for i in keep]
 
-{cmd}
-""".format(
-           OUT_FILE=out_file,
-           ERR_FILE=error_file,
-           JOB_NAME=job_name,
-           QUEUE=args.QUEUE,
-           A=args.A,
-           N_CORES=args.N_JOBS,
-           M=args.M,
-           cmd=run_cmd,
-           TIME=args.TIME
-          )
-                    with open('tmp_script','w') as f:
-                        f.write(batch_script)
+        os.makedirs(pack_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S') + '_' + str(os.getpid())
+        for k, (pack, load) in enumerate(zip(packs, loads)):
+            info = {'ml':stamp,
+                    'dataset':'pack',
+                    'seed':str(k),
+                    'results_path':args.RDIR,
+                    'target_noise':args.Y_NOISE,
+                    # twice the predicted time of the pack's workers
+                    'time':packing.seconds_to_time(2*load/args.N_JOBS + 300)
+                    }
+            # the manifest is named like the job, so its commands are
+            # recognized as queued
+            manifest = os.path.join(pack_dir, '_'.join(['pack', stamp,
+                                                        str(k), args.SCRIPT])
+                                    + '.manifest')
+            slurm.write_manifest(manifest, [short_commands[i] for i in pack])
+            info['members'] = [short_info[i] for i in pack]
+            # the commands record their own status in the job ledger
+            all_commands.append('python packing.py {} -n_jobs {}'.format(
+                                    manifest, args.N_JOBS))
+            job_info.append(info)
+        print('packed',len(short),'short jobs into',len(packs),'jobs')
 
-                    # print(batch_script)
-                    print(job_name)
-                    sbatch_response = subprocess.check_output(['sbatch tmp_script'],
-                                                              shell=True).decode()     # submit jobs 
-                    print(sbatch_response)
+    jobs = []
+    for i,run_cmd in enumerate(all_commands):
+        job_name = '_'.join([
+                             job_info[i]['dataset'],
+                             job_info[i]['ml'],
+                             job_info[i]['seed'],
+                             args.SCRIPT
+                            ])
+        if args.Y_NOISE>0:
+            job_name += '_target-noise'+str(args.Y_NOISE)
+        if args.X_NOISE>0:
+            job_name += '_feature-noise'+str(args.X_NOISE)
+        out_file = (job_info[i]['results_path']
+                    + job_name 
+                    + '.%J.out')
+        error_file = out_file[:-4] + '.err'
+        jobs.append({'name':job_name,
+                     'command':run_cmd,
+                     # local jobs print to the terminal
+                     'out_file':None if local else out_file,
+                     'err_file':None if local else error_file,
+                     'time':job_info[i].get('time', args.TIME),
+                     'cores':args.N_JOBS,
+                     'memory':job_info[i].get('memory', args.M)
+                     })
 
-            else: # LPC
-                # activate srbench env, load modules
-                # pre_run_cmds = ["conda activate srbench",
-                #                 "source lpc_modules.sh"]
-                # run_cmd = '; '.join(pre_run_cmds + [run_cmd])
-                bsub_cmd = ('bsub -o {OUT_FILE} '
-                            '-e {ERR_FILE} '
-                            '-n {N_CORES} '
-                            '-J {JOB_NAME} '
-                            '-q {QUEUE} '
-                            '-R "span[hosts=1] rusage[mem={M}]" '
-                            '-W {TIME} '
-                            '-M {M} ').format(
-                                   OUT_FILE=out_file,
-                                   ERR_FILE=error_file,
-                                   JOB_NAME=job_name,
-                                   QUEUE=args.QUEUE,
-                                   N_CORES=args.N_JOBS,
-                                   M=args.M,
-                                   TIME=args.TIME
-                                   )
-                
-                bsub_cmd +=  '"' + run_cmd + '"'
-                print(bsub_cmd)
-                os.system(bsub_cmd)     # submit jobs 
+    # record the attempts first, as local jobs may finish right away, with
+    # the resources and err file of the job (or pack) they run in
+    executor.prepare(jobs)
+    for ji, job in zip(job_info, jobs):
+        for member in ji.get('members', [ji]):
+            ledger.record_submitted(index_file, member['key'], job,
+                                    member['attempt'],
+                                    pack=None if member is ji else job['name'])
+    print('submitting',len(jobs),'jobs to',args.EXECUTOR,'...')
+    executor.submit(jobs)
+    if local:
+        executor.wait()
 
     print('Finished submitting',len(all_commands),'jobs.')
@@ -0,0 +1,231 @@
+"""
+Block gzip (BGZF) datasets.
+
+BGZF, the format of bgzip and samtools, is a gzip file made of independent
+members (blocks) of at most 64KB of data, each with its compressed size in
+a 'BC' extra field. A BGZF .tsv.gz is still a valid gzip file, so pandas,
+zcat and the gzip module read it as before, but its blocks can be
+compressed and decompressed in parallel (zlib releases the GIL, so threads
+suffice), and read from any offset.
+
+`BgzfWriter` compresses batches of blocks with a pool of threads and writes
+the bgzip index next to the file, <file>.gzi: the number of blocks after
+the first, then the (compressed, uncompressed) offsets of each of them, as
+little-endian uint64. `decompress` reads a whole file with a pool of
+threads, `read_range` reads part of it through its index, and
+`uncompressed_size` gives its size without decompressing it. read_file
+detects BGZF datasets with `is_bgzf`. Existing datasets are converted with
+
+    python bgzf.py DATASET.tsv.gz [...]
+"""
+import bisect
+import gzip
+import os
+import shutil
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# uncompressed bytes per block, as bgzip: the compressed block always fits
+# in the 64KB that BSIZE can address
+MAX_BLOCK = 0xff00
+LEVEL = 6
+# blocks handed to each thread at a time
+BATCH_BLOCKS = 16
+
+# gzip header with FEXTRA, then XLEN=6 and the 'BC' subfield (SLEN=2)
+_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+_HEADER_SIZE = len(_HEADER) + 2
+# the empty block that ends a BGZF file
+EOF_BLOCK = (_HEADER + b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def n_threads():
+    """the cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def compress_block(data, level=LEVEL):
+    """data (at most MAX_BLOCK bytes) as one BGZF block."""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = c.compress(data) + c.flush()
+    return (_HEADER + struct.pack('<H', _HEADER_SIZE + len(deflated) + 8 - 1)
+            + deflated + struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                                     len(data)))
+
+
+def _inflate(block):
+    return zlib.decompress(block[_HEADER_SIZE:-8], -15)
+
+
+def is_bgzf(filename):
+    """whether filename is a BGZF file."""
+    with open(filename, 'rb') as f:
+        head = f.read(_HEADER_SIZE)
+    return (len(head) == _HEADER_SIZE and head[:4] == _HEADER[:4]
+            and head[12:16] == _HEADER[12:16])
+
+
+class BgzfWriter:
+    """writes a BGZF file and its index. write() takes bytes, or str (as
+    utf-8), so it can back a csv.writer."""
+    def __init__(self, filename, level=LEVEL, threads=None, index=True):
+        self.filename = filename
+        self.level = level
+        self.index = index
+        self.f = open(filename, 'wb')
+        threads = threads or n_threads()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.batch = MAX_BLOCK*BATCH_BLOCKS*threads
+        self.buffer = bytearray()
+        # (compressed, uncompressed) offsets of the blocks
+        self.offsets = []
+        self.compressed = 0
+        self.uncompressed = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.buffer += data
+        if len(self.buffer) >= self.batch:
+            self._flush(len(self.buffer) - len(self.buffer) % MAX_BLOCK)
+        return len(data)
+
+    def _flush(self, size):
+        chunks = [bytes(self.buffer[i:i + MAX_BLOCK])
+                  for i in range(0, size, MAX_BLOCK)]
+        del self.buffer[:size]
+        for chunk, block in zip(chunks, self.pool.map(
+                lambda c: compress_block(c, self.level), chunks)):
+            self.offsets.append((self.compressed, self.uncompressed))
+            self.f.write(block)
+            self.compressed += len(block)
+            self.uncompressed += len(chunk)
+
+    def close(self):
+        if self.f.closed:
+            return
+        self._flush(len(self.buffer))
+        self.f.write(EOF_BLOCK)
+        self.f.close()
+        self.pool.shutdown()
+        if self.index:
+            write_index(self.filename + '.gzi', self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_index(filename, offsets):
+    # bgzip leaves out the first block, at (0, 0)
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<Q', max(len(offsets) - 1, 0)))
+        for offset in offsets[1:]:
+            f.write(struct.pack('<QQ', *offset))
+
+
+def read_index(filename):
+    """the (compressed, uncompressed) offsets of the blocks of a BGZF file,
+    from its index."""
+    with open(filename + '.gzi', 'rb') as f:
+        data = f.read()
+    n, = struct.unpack_from('<Q', data)
+    return [(0, 0)] + [struct.unpack_from('<QQ', data, 8 + 16*i)
+                       for i in range(n)]
+
+
+def uncompressed_size(filename):
+    """the size of the data of a BGZF file, from its index and the size
+    field of its last data block (the one before the EOF block)."""
+    offsets = read_index(filename)
+    with open(filename, 'rb') as f:
+        f.seek(-len(EOF_BLOCK) - 4, os.SEEK_END)
+        last_size, = struct.unpack('<I', f.read(4))
+    return offsets[-1][1] + last_size
+
+
+def _blocks(data):
+    """the blocks of BGZF data, read from their headers."""
+    blocks = []
+    start = 0
+    while start < len(data):
+        size = struct.unpack_from('<H', data, start + 16)[0] + 1
+        blocks.append(data[start:start + size])
+        start += size
+    return blocks
+
+
+def decompress(filename, threads=None):
+    """the data of a BGZF file, decompressing its blocks in parallel."""
+    with open(filename, 'rb') as f:
+        data = memoryview(f.read())
+    blocks = _blocks(data)
+    if len(blocks) < 2:
+        return b''.join(map(_inflate, blocks))
+    with ThreadPoolExecutor(max_workers=threads or n_threads()) as pool:
+        return b''.join(pool.map(_inflate, blocks,
+                                 chunksize=BATCH_BLOCKS))
+
+
+def read_range(filename, start, size):
+    """size bytes of the data of a BGZF file from offset start, reading only
+    the blocks that hold them."""
+    offsets = read_index(filename)
+    first = bisect.bisect_right([u for _, u in offsets], start) - 1
+    data = b''
+    with open(filename, 'rb') as f:
+        f.seek(offsets[first][0])
+        while len(data) < start - offsets[first][1] + size:
+            head = f.read(_HEADER_SIZE)
+            if len(head) < _HEADER_SIZE:
+                break
+            block = head + f.read(struct.unpack_from('<H', head, 16)[0] + 1
+                                  - _HEADER_SIZE)
+            data += _inflate(block)
+    start -= offsets[first][1]
+    return data[start:start + size]
+
+
+def convert(filename, level=LEVEL, threads=None):
+    """rewrites a gzip file as BGZF, with its index. Its modification time
+    is kept, since its data does not change."""
+    stat = os.stat(filename)
+    tmp = filename + '.tmp'
+    with gzip.open(filename, 'rb') as src, \
+         BgzfWriter(tmp, level, threads, index=False) as dst:
+        shutil.copyfileobj(src, dst, MAX_BLOCK*BATCH_BLOCKS)
+    os.replace(tmp, filename)
+    write_index(filename + '.gzi', dst.offsets)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Rewrite gzip datasets as BGZF, which read_file "
+        "decompresses in parallel.", add_help=False)
+    parser.add_argument('FILES', type=str, nargs='+',
+                        help='Datasets (.tsv.gz) to convert')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-level', action='store', type=int, default=LEVEL,
+                        help='Compression level')
+    parser.add_argument('-threads', action='store', type=int, default=None,
+                        help='Compression threads (default: all cores)')
+    args = parser.parse_args()
+
+    for filename in args.FILES:
+        if is_bgzf(filename):
+            print(filename,'is already BGZF')
+            continue
+        convert(filename, args.level, args.threads)
+        print('converted',filename)
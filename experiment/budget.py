@@ -0,0 +1,191 @@
+"""
+Time budgets of evaluate_model jobs.
+
+Every job gets a wall clock limit (`job_time`) from the size of its training
+set, and the estimator gets a slightly smaller budget (`fit_time`) for its
+own time parameter, so it stops cleanly before the job is interrupted.
+
+The wall clock limit is the benchmark's limit for the dataset size (1 hour up
+to 1000 training samples, 10 hours above), unless a cost model is given. A
+cost model is fit per method on previous results:
+
+    log(time_time) = a + b*log(n_samples*n_features)
+
+and the job gets `MARGIN` times the 90th percentile of the predicted time,
+within [MIN_JOB_TIME, the benchmark's limit]. Fits that timed out or used
+most of their budget stopped because of it: their time is only a lower
+bound of their cost, so dropping them would bias the model low. They are
+kept as censored at their budget, and their time is re-estimated as the
+larger of the budget and the model's prediction while refitting
+(CENSORED_ITERATIONS times). Like time_budget, the model takes the size of
+the training set before evaluate_model subsamples it (n_train_samples in
+the results).
+
+    python budget.py RESULTS_DIR -o cost_model.json
+"""
+import json
+import os
+import numpy as np
+from glob import glob
+from read_file import read_shape
+
+# fraction of the data used for training by evaluate_model
+TRAIN_SIZE = 0.8
+# benchmark limits: (max training samples, wall clock seconds)
+TIME_LIMITS = [(1000, 3600), (np.inf, 36000)]
+# the estimator's budget leaves this fraction of the job (at least
+# MIN_SLACK seconds) for setup, scoring and a clean stop
+SLACK = 0.02
+MIN_SLACK = 30
+# cost model settings
+MARGIN = 2.0
+MIN_JOB_TIME = 600
+QUANTILE = 0.9
+# fits using more of their time budget than this are budget-bound
+BOUND_FRACTION = 0.9
+CENSORED_ITERATIONS = 10
+MIN_RESULTS = 5
+
+# names of time limit parameters (in seconds), in order of preference
+TIME_PARAMS = ['max_time', 'time_limit', 'timeout_in_seconds', 'timeout']
+# names of thread count parameters
+THREAD_PARAMS = ['n_jobs', 'n_threads', 'num_threads', 'nthread', 'n_cores']
+
+
+def job_time_limit(n_samples):
+    """the benchmark's wall clock limit for a training set of n_samples."""
+    for max_samples, limit in TIME_LIMITS:
+        if n_samples <= max_samples:
+            return limit
+
+
+def predicted_time(est_name, n_samples, n_features, cost_model=None):
+    """the QUANTILE of the time of est_name on a training set of n_samples by
+    n_features predicted by the cost model, in seconds, or None if there is
+    no cost model for est_name."""
+    if not cost_model or est_name not in cost_model:
+        return None
+    c = cost_model[est_name]
+    return float(np.exp(c['intercept']
+                        + c['slope']*np.log(n_samples*n_features)
+                        + c['residual_quantile']))
+
+
+def time_budget(est_name, n_samples, n_features, cost_model=None):
+    """returns a dict with the wall clock limit of the job (job_time) and the
+    time budget of the estimator (fit_time), in seconds."""
+    job_time = job_time_limit(n_samples)
+    predicted = predicted_time(est_name, n_samples, n_features, cost_model)
+    if predicted is not None:
+        job_time = int(min(job_time, max(MIN_JOB_TIME, MARGIN*predicted)))
+    fit_time = int(job_time - max(MIN_SLACK, SLACK*job_time))
+    return dict(job_time=job_time, fit_time=fit_time)
+
+
+def dataset_time_budget(est_name, dataset, cost_model=None):
+    """time_budget of est_name on dataset, from the shape of the dataset
+    (see read_file.read_shape), as evaluate_model computes it. analyze.py
+    asks the scheduler for its job_time."""
+    n_samples, n_features = read_shape(dataset)
+    return time_budget(est_name, int(TRAIN_SIZE*n_samples), n_features,
+                       cost_model)
+
+
+def set_time_budget(est, seconds):
+    """the default hook: sets the first of TIME_PARAMS that est has, if
+    any. Returns the name of the parameter set."""
+    params = est.get_params()
+    for p in TIME_PARAMS:
+        if p in params:
+            est.set_params(**{p:seconds})
+            return p
+    return None
+
+
+def set_threads(est, n_threads):
+    """sets the THREAD_PARAMS of est, and of the estimators it wraps, to
+    n_threads, for workers that share the cores of a job: the thread
+    counts that methods read when imported do not follow OMP_NUM_THREADS.
+    Returns the names of the parameters set."""
+    params = est.get_params()
+    names = [p for p, v in params.items()
+             if p.split('__')[-1] in THREAD_PARAMS
+             and (v is None or (isinstance(v, int)
+                                and not isinstance(v, bool)))]
+    est.set_params(**{p:n_threads for p in names})
+    return names
+
+
+def fit_cost_model(results_dir):
+    """fits the cost model of each method on the result files in
+    results_dir (searched recursively)."""
+    runs = {}
+    for f in glob(os.path.join(results_dir, '**', '*.json'), recursive=True):
+        try:
+            with open(f, 'r') as fh:
+                r = json.load(fh)
+            # the training set before subsampling, as time_budget is given
+            size = r.get('n_train_samples', r['n_samples'])*r['n_features']
+            t = r['time_time']
+        except Exception:
+            continue
+        budget = r.get('time_budget')
+        censored = bool(r.get('timed_out')
+                        or (budget and t > BOUND_FRACTION*budget))
+        if censored and budget:
+            t = max(t, budget)
+        runs.setdefault(r['algorithm'], []).append(
+            (np.log(size), np.log(max(t, 1e-3)), censored))
+
+    cost_model = {}
+    for alg, xy in runs.items():
+        if len(xy) < MIN_RESULTS:
+            continue
+        x, bound, censored = np.array(xy).T
+        censored = censored.astype(bool)
+        y = bound.copy()
+        for _ in range(CENSORED_ITERATIONS if censored.any() else 1):
+            if np.ptp(x) > 0:
+                slope, intercept = np.polyfit(x, y, 1)
+            else:
+                slope, intercept = 0.0, y.mean()
+            y[censored] = np.maximum(bound, intercept + slope*x)[censored]
+        residuals = y - (intercept + slope*x)
+        cost_model[alg] = dict(
+            intercept=float(intercept),
+            slope=float(slope),
+            residual_quantile=float(np.quantile(residuals, QUANTILE)),
+            n_results=len(xy),
+            n_censored=int(censored.sum())
+        )
+    return cost_model
+
+
+def read_cost_model(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Fit the cost model of each method on its results.",
+        add_help=False)
+    parser.add_argument('RESULTS_DIR', type=str,
+                        help='Directory of evaluate_model results')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-o', action='store', dest='OUT', type=str,
+                        default='cost_model.json', help='Output file')
+    args = parser.parse_args()
+
+    cost_model = fit_cost_model(args.RESULTS_DIR)
+    for alg, c in sorted(cost_model.items()):
+        print(alg, c)
+    with open(args.OUT, 'w') as out:
+        json.dump(cost_model, out, indent=4)
+    print('cost model of',len(cost_model),'methods saved to',args.OUT)
@@ -15,30 +15,128 @@ import time
 from tempfile import mkdtemp
 from shutil import rmtree
 from joblib import Memory
-from read_file import read_file
+from read_file import (read_file, read_target, read_feature_names,
+                       multi_target_siblings)
 import pdb
 import numpy as np
 import json
 import os
 import inspect
-from utils import jsonify
+from utils import (jsonify, PhaseTimer, cpu_time,
+                   resource_usage)
 from symbolic_utils import get_sym_model
 
-from metrics.evaluation import simplicity, equation_predictions, equation_metrics
-
-import signal
-class TimeOutException(Exception):
-    pass
-
-def alarm_handler(signum, frame):
-    print(f"raising TimeOutException")
-    raise TimeOutException
+from metrics.evaluation import simplicity, equation_predictions
+from postprocess import symbolic_analysis, enqueue, enqueue_full_simplicity
+
+import multiprocessing
+import copy
+from concurrent.futures import ProcessPoolExecutor
+import cProfile
+import budget
+from budget import time_budget, read_cost_model
+from supervisor import (TimeOutException, FitFailed, fit, supervised_fit,
+                        SymbolicModel)
+import tuning
+import folds
+import knowledge_base
 
 def set_env_vars(n_jobs):
     os.environ['OMP_NUM_THREADS'] = n_jobs 
     os.environ['OPENBLAS_NUM_THREADS'] = n_jobs 
     os.environ['MKL_NUM_THREADS'] = n_jobs
 
+def write_results(results, save_file, timer, t0_run, c0_run):
+    """adds the timings and resource usage of the run to results and saves
+    them to save_file.json."""
+    timer.stop()
+    results['timings'] = timer.timings
+    results['wall_time'] = time.time() - t0_run
+    results['cpu_time'] = cpu_time() - c0_run
+    results.update(resource_usage())
+
+    print('results:')
+    print(json.dumps(results,indent=4))
+    print('---')
+
+    with open(save_file + '.json', 'w') as out:
+        json.dump(jsonify(results), out, indent=4)
+
+def get_model_str(est, model, X, feature_names):
+    """the symbolic model of est as a string, from the method's model()"""
+    if 'X' in inspect.signature(model).parameters.keys():
+        if not isinstance(X, pd.DataFrame):
+            X = pd.DataFrame(X, columns=feature_names)
+        return model(est, X)
+    return model(est)
+
+def subsample_train(X_train, y_train, max_train_samples, random_state):
+    """if the training set is large, subsamples it to max_train_samples.
+
+    The sample is drawn from its own RandomState(random_state), so runs
+    that share features (see evaluate_multi_target) draw the same one
+    whatever else used the global generator. Rows are taken by position:
+    the index of X_train is that of the dataset, so selecting by label
+    (.loc) took rows that did not match y_train[sample_idx].
+    """
+    if max_train_samples > 0 and len(y_train) > max_train_samples:
+        print('subsampling training data from',len(X_train),
+              'to',max_train_samples)
+        sample_idx = np.random.RandomState(random_state).choice(
+            np.arange(len(X_train)), size=max_train_samples)
+        y_train = y_train[sample_idx]
+        if isinstance(X_train, pd.DataFrame):
+            X_train = X_train.iloc[sample_idx]
+        else:
+            X_train = X_train[sample_idx]
+    return X_train, y_train
+
+def scale_features(X_train, X_test, feature_names, minmax=False, scale_x=True,
+                   use_dataframe=True):
+    """scales the features: with a MinMaxScaler + 1e-6 for ENB and Agric
+    (match codes/ENB/mtr_ginn_sym.py, codes/Agriculture/mtr_ginn_agric_sym.py),
+    otherwise with a StandardScaler if scale_x."""
+    if minmax:
+        # X: MinMaxScaler then + 1e-6 (same as reference scripts)
+        X_train_arr = np.asarray(X_train) if not isinstance(X_train, np.ndarray) else X_train
+        X_test_arr = np.asarray(X_test) if not isinstance(X_test, np.ndarray) else X_test
+        sc_X = MinMaxScaler()
+        X_train_scaled = sc_X.fit_transform(X_train_arr) + 1e-6
+        X_test_scaled = sc_X.transform(X_test_arr) + 1e-6
+    elif scale_x:
+        print('scaling X')
+        sc_X = StandardScaler()
+        X_train_scaled = sc_X.fit_transform(X_train)
+        X_test_scaled = sc_X.transform(X_test)
+    else:
+        return X_train, X_test
+    if use_dataframe:
+        X_train_scaled = pd.DataFrame(X_train_scaled, columns=feature_names)
+        X_test_scaled = pd.DataFrame(X_test_scaled, columns=feature_names)
+    return X_train_scaled, X_test_scaled
+
+def is_minmax_dataset(dataset):
+    return 'agric' in dataset or 'enb' in dataset
+
+def load_shared_features(dataset, random_state, use_dataframe=True,
+                         scale_x=True, max_train_samples=0):
+    """reads the features of dataset and splits, subsamples and scales them
+    as evaluate_model does, for the targets of a multi-target problem, which
+    share their features."""
+    features, labels, feature_names = read_file(dataset,
+                                                use_dataframe=use_dataframe)
+    X_train, X_test, y_train, _ = train_test_split(features, labels,
+                                                   train_size=0.80,
+                                                   test_size=0.20,
+                                                   random_state=random_state)
+    X_train, _ = subsample_train(X_train, y_train, max_train_samples,
+                                 random_state)
+    X_train_scaled, X_test_scaled = scale_features(
+        X_train, X_test, feature_names, is_minmax_dataset(dataset), scale_x,
+        use_dataframe)
+    return dict(features=features, feature_names=feature_names,
+                X_train_scaled=X_train_scaled, X_test_scaled=X_test_scaled)
+
 def evaluate_model(
     dataset, 
     results_path,
@@ -50,6 +148,17 @@ def evaluate_model(
     sym_data=False,
     target_noise=0.0, 
     feature_noise=0.0, 
+    full_simplicity=False,
+    spool_dir=None,
+    profile=False,
+    progress_interval=30,
+    supervise=False,
+    max_memory=0,
+    cost_model=None,
+    hyper_params=None,
+    tune=False,
+    warm_start=None,
+    shared=None,
     ##########
     # valid options for eval_kwargs
     ##########
@@ -58,53 +167,74 @@ def evaluate_model(
     scale_x=True,
     scale_y=True,
     pre_train=None,
+    harvest=None,
+    set_time_budget=None,
     use_dataframe=True
 ):
 
     print(40*'=','Evaluating '+est_name+' on ',dataset,40*'=',sep='\n')
 
+    t0_run, c0_run = time.time(), cpu_time()
+    timer = PhaseTimer()
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     np.random.seed(random_state)
+    # tuning estimators share the folds of this seed
+    folds.set_seed(random_state)
     if hasattr(est, 'random_state'):
         est.random_state = random_state
 
     ##################################################
     # setup data
     ##################################################
-
-    ##################################################
-    # setup data
-    ##################################################
-    features, labels, feature_names =  read_file(
-        dataset, 
-        use_dataframe=use_dataframe
-    )
+    timer.start('read_file')
+    if shared is None:
+        features, labels, feature_names =  read_file(
+            dataset, 
+            use_dataframe=use_dataframe
+        )
+    else:
+        # the features were read and scaled once for all targets
+        features, feature_names = shared['features'], shared['feature_names']
+        labels = read_target(dataset)
+        assert len(labels) == len(features)
     print('feature_names:',feature_names)
     if sym_data:
         true_model = get_sym_model(dataset)
+    timer.start('preprocess')
     # generate train/test split
     X_train, X_test, y_train, y_test = train_test_split(features, labels,
                                                     train_size=0.80,
                                                     test_size=0.20,
                                                     random_state=random_state)
 
-    # time limits
-    MAXTIME = 3600
-    if len(y_train) > 1000:
-        MAXTIME = 36000
+    # time limits: the job's wall clock and the estimator's own budget, from
+    # the size of the training set before subsampling, which the cost model
+    # is fit on (n_train_samples) and analyze.py knows
+    n_train_samples = len(y_train)
+    limits = time_budget(est_name, len(y_train), X_train.shape[1],
+                         cost_model)
+    MAXTIME = limits['job_time']
 
     print('max time:',MAXTIME)
 
     # if dataset is large, subsample the training set 
-    if max_train_samples > 0 and len(y_train) > max_train_samples:
-        print('subsampling training data from',len(X_train),
-              'to',max_train_samples)
-        sample_idx = np.random.choice(np.arange(len(X_train)),
-                                      size=max_train_samples)
-        y_train = y_train[sample_idx]
-        if isinstance(X_train, pd.DataFrame):
-            X_train = X_train.loc[sample_idx]
-        else:
-            X_train = X_train[sample_idx]
+    X_train, y_train = subsample_train(X_train, y_train, max_train_samples,
+                                       random_state)
+
+    # describes the dataset in the tuning knowledge base, when it is used
+    meta = None
+    if warm_start or (tune and hyper_params):
+        meta = knowledge_base.meta_features(X_train, y_train)
+    if shared is None:
+        X_train_scaled, X_test_scaled = scale_features(
+            X_train, X_test, feature_names, is_minmax_dataset(dataset),
+            scale_x, use_dataframe)
+    else:
+        X_train_scaled = shared['X_train_scaled']
+        X_test_scaled = shared['X_test_scaled']
 
     # ENB and Agric: use MinMaxScaler + 1e-6 (match codes/ENB/mtr_ginn_sym.py, codes/Agriculture/mtr_ginn_agric_sym.py)
     # Agric only: log-transform targets so models predict in log space
@@ -114,15 +244,6 @@ def evaluate_model(
     y_test_scaled = None     # set for agric/enb so scoring uses correct target
 
     if is_agric or is_enb:
-        # X: MinMaxScaler then + 1e-6 (same as reference scripts)
-        X_train_arr = np.asarray(X_train) if not isinstance(X_train, np.ndarray) else X_train
-        X_test_arr = np.asarray(X_test) if not isinstance(X_test, np.ndarray) else X_test
-        sc_X = MinMaxScaler()
-        X_train_scaled = sc_X.fit_transform(X_train_arr) + 1e-6
-        X_test_scaled = sc_X.transform(X_test_arr) + 1e-6
-        if use_dataframe:
-            X_train_scaled = pd.DataFrame(X_train_scaled, columns=feature_names)
-            X_test_scaled = pd.DataFrame(X_test_scaled, columns=feature_names)
         if is_agric:
             y_train_scaled = np.log(np.asarray(y_train, dtype=np.float64))
             y_test_scaled = np.log(np.asarray(y_test, dtype=np.float64))
@@ -134,20 +255,6 @@ def evaluate_model(
         print('scaling X with MinMaxScaler+1e-6' + ('; y in log space (agric)' if is_agric else ''))
     else:
         # scale and normalize the data (default)
-        if scale_x:
-            print('scaling X')
-            sc_X = StandardScaler()
-            X_train_scaled = sc_X.fit_transform(X_train)
-            X_test_scaled = sc_X.transform(X_test)
-            if use_dataframe:
-                X_train_scaled = pd.DataFrame(X_train_scaled,
-                                              columns=feature_names)
-                X_test_scaled = pd.DataFrame(X_test_scaled,
-                                              columns=feature_names)
-        else:
-            X_train_scaled = X_train
-            X_test_scaled = X_test
-
         if scale_y:
             print('scaling y')
             sc_y = StandardScaler()
@@ -179,13 +286,86 @@ def evaluate_model(
     ################################################## 
     # run any method-specific pre_train routines
     ################################################## 
+    # give the estimator its time budget
+    set_budget = set_time_budget or budget.set_time_budget
+    time_param = set_budget(est, limits['fit_time'])
+    print('time budget of est:',limits['fit_time'],'s',
+          '(' + str(time_param) + ')' if time_param else '')
+
     if pre_train:
+        timer.start('pre_train')
         pre_train(est, X_train_scaled, y_train_scaled)
 
     # define a test mode using estimator test_params, if they exist
     if test and len(test_params) != 0:
         est.set_params(**test_params)
 
+    ################################################## 
+    # tune hyperparameters
+    ################################################## 
+    warm_params = None
+    if warm_start:
+        # start from the params that did best on similar datasets, and tune
+        # only among the top recommendations
+        recommended = knowledge_base.recommend(
+            knowledge_base.read_kb(warm_start), est_name, meta,
+            n=tuning.FACTOR, exclude=dataset.split('/')[-1].split('.')[0])
+        recommended = [knowledge_base.applicable_params(est, p)
+                       for p in recommended]
+        if recommended:
+            warm_params = recommended[0]
+            print('warm start params:',warm_params)
+            est.set_params(**warm_params)
+            hyper_params = [{k:[v] for k,v in p.items()} for p in recommended]
+
+    tuning_results = None
+    if tune and hyper_params:
+        timer.start('tune')
+        tuning_results = tuning.tune(
+            est, hyper_params, X_train_scaled, y_train_scaled,
+            tuning.TUNE_FRACTION*limits['fit_time'],
+            max_candidates=2 if test else tuning.MAX_CANDIDATES,
+            random_state=random_state, set_time_budget=set_budget)
+        print('tuned params:',tuning_results['best_params'])
+        est.set_params(**tuning_results['best_params'])
+        # the fit gets what is left of the budget, at least a second (an
+        # alarm of 0 would never go off)
+        MAXTIME = max(1, int(MAXTIME - tuning_results['time']))
+        set_budget(est, max(1, int(limits['fit_time']
+                                   - tuning_results['time'])))
+        if test and len(test_params) != 0:
+            est.set_params(**test_params)
+
+    ################################################## 
+    # results file
+    ################################################## 
+    dataset_name = dataset.split('/')[-1].split('.')[0]
+    # Determine algorithm folder (DSR, BSR, or AIFeynman)
+    if 'DSR' in est_name:
+        algo_folder = 'DSR'
+    elif 'BSR' in est_name:
+        algo_folder = 'BSR'
+    elif 'AIF' in est_name or 'Feyn' in est_name:
+        algo_folder = 'AIFeynman'
+    else:
+        algo_folder = 'Other'
+
+    # Create algorithm-specific subdirectory
+    algo_results_path = os.path.join(results_path, algo_folder)
+    if not os.path.exists(algo_results_path):
+        os.makedirs(algo_results_path)
+
+    # Filename without prefix (since we're in algorithm folder)
+    base_name = dataset_name + '_' + est_name + '_' + str(random_state)
+    if target_noise > 0:
+        base_name += '_target-noise' + str(target_noise)
+    if feature_noise > 0:
+        base_name += '_feature-noise' + str(feature_noise)
+
+    save_file = os.path.join(algo_results_path, base_name)
+
+    print('save_file:',save_file)
+
     ################################################## 
     # Fit models
     ################################################## 
@@ -195,44 +375,72 @@ def evaluate_model(
     print('X_train:',type(X_train_scaled),X_train_scaled.shape)
     print('y_train:',y_train_scaled.shape)
     print('training',est)
-    t0t = time.time()
-    signal.signal(signal.SIGALRM, alarm_handler)
-    signal.alarm(MAXTIME) # maximum time, defined above
-    try:
-        est.fit(X_train_scaled, y_train_scaled)
-    except TimeOutException:
-        print('WARNING: fitting timed out')
-
-    time_time = time.time() - t0t
-    print('Training time measure:', time_time)
+    timer.start('fit')
+    fit_kwargs = dict(harvest=harvest,
+                      progress_file=save_file + '.progress',
+                      progress_interval=progress_interval)
+    est_params = est.get_params()
+    if supervise:
+        try:
+            est, status = supervised_fit(
+                est, X_train_scaled, y_train_scaled, MAXTIME,
+                max_memory=max_memory,
+                model_str=lambda e: get_model_str(e, model, X_train_scaled,
+                                                  feature_names),
+                feature_names=feature_names, est_name=est_name,
+                **fit_kwargs)
+        except FitFailed as e:
+            print('WARNING:',e)
+            est, status = None, e.status
+    else:
+        status = fit(est, X_train_scaled, y_train_scaled, MAXTIME,
+                     **fit_kwargs)
+    timer.start('model')
     
     ##################################################
     # store results
     ##################################################
-    dataset_name = dataset.split('/')[-1].split('.')[0]
     results = {
         'dataset':dataset_name,
         'algorithm':est_name,
-        'params':jsonify(est.get_params()),
+        'params':jsonify(est_params),
         'random_state':random_state,
-        'time_time': time_time, 
+        'n_samples':len(y_train_scaled),
+        'n_train_samples':n_train_samples,
+        'n_features':X_train_scaled.shape[1],
+        'time_budget':limits['fit_time'],
+        'time_time': status['fit_time'], 
+        'timed_out': status['timed_out'],
+        'harvested': status['harvested'],
     }
     if sym_data:
         results['true_model'] = true_model
+    if meta is not None:
+        results['meta_features'] = meta
+    if warm_params is not None:
+        results['warm_start'] = warm_params
+    if tuning_results is not None:
+        results['tuning'] = tuning_results
+
+    if est is None:
+        # the supervised fit was killed or failed: its outcome and time are
+        # still recorded, for the job ledger and the cost model
+        results['killed'] = status['killed']
+        results['exitcode'] = status['exitcode']
+        results['symbolic_model'] = None
+        write_results(results, save_file, timer, t0_run, c0_run)
+        return save_file + '.json'
 
     # get the final symbolic model as a string
     print('fitted est:',est)
 
-    if 'X' in inspect.signature(model).parameters.keys():
-        if not isinstance(X_train_scaled, pd.DataFrame):
-            X_df = pd.DataFrame(X_train_scaled, 
-                                          columns=feature_names)
-        else:
-            X_df = X_train_scaled
-        results['symbolic_model'] = model(est, X_df)
+    if isinstance(est, SymbolicModel):
+        results['symbolic_model'] = est.model_str
     else:
-        results['symbolic_model'] = model(est)
+        results['symbolic_model'] = get_model_str(est, model, X_train_scaled,
+                                                  feature_names)
     print('symbolic model:',results['symbolic_model'])
+    timer.start('predict')
     ##################################################
     # scores
     ##################################################
@@ -240,6 +448,7 @@ def evaluate_model(
     # For agric/enb we score in scaled space (log(y) for agric); for default scale_y we score in original space
     train_target = y_train if use_y_inverse else y_train_scaled
     test_target = y_test if use_y_inverse else y_test_scaled
+    y_preds = {}
     for fold, target, X in [
             ['train', train_target, X_train_scaled],
             ['test', test_target, X_test_scaled]
@@ -247,6 +456,7 @@ def evaluate_model(
         y_pred = np.asarray(est.predict(X)).reshape(-1, 1)
         if use_y_inverse:
             y_pred = sc_y.inverse_transform(y_pred)
+        y_preds[fold] = y_pred.ravel()
 
         scorers = [
             ('mse', mean_squared_error),
@@ -274,72 +484,90 @@ def evaluate_model(
     results['rmse_train'] = float(np.sqrt(results['mse_train'])) if results.get('mse_train') is not None else None
     results['rmse_test'] = float(np.sqrt(results['mse_test'])) if results.get('mse_test') is not None else None
 
-    # Equation-on-test metrics (same as @codes: evaluate learned equation on test/train data)
-    # Uses correct target space: log(y) for agric, raw for enb
-    for key in ['equation_train_mse', 'equation_train_mae', 'equation_train_rmse', 'equation_train_mape',
-                'equation_test_mse', 'equation_test_mae', 'equation_test_rmse', 'equation_test_mape']:
-        results[key] = None
-    try:
-        y_eq_train = equation_predictions(results['symbolic_model'], feature_names, X_train_scaled, est=est, est_name=est_name)
-        y_eq_test = equation_predictions(results['symbolic_model'], feature_names, X_test_scaled, est=est, est_name=est_name)
-        if y_eq_train is not None:
-            m_train = equation_metrics(train_target, y_eq_train)
-            if m_train:
-                results['equation_train_mse'] = m_train['equation_mse']
-                results['equation_train_mae'] = m_train['equation_mae']
-                results['equation_train_rmse'] = m_train['equation_rmse']
-                results['equation_train_mape'] = m_train['equation_mape']
-        if y_eq_test is not None:
-            m_test = equation_metrics(test_target, y_eq_test)
-            if m_test:
-                results['equation_test_mse'] = m_test['equation_mse']
-                results['equation_test_mae'] = m_test['equation_mae']
-                results['equation_test_rmse'] = m_test['equation_rmse']
-                results['equation_test_mape'] = m_test['equation_mape']
-    except Exception as e:
-        print('Warning: equation-on-test metrics failed:', e)
-
-    # simplicity
-    results['simplicity'] = simplicity(results['symbolic_model'], feature_names)
+    # equation-on-data metrics and simplicity
+    timer.start('symbolic_analysis')
+    if spool_dir is None:
+        symbolic_analysis(results, feature_names, X_train_scaled,
+                          X_test_scaled, train_target, test_target, est=est,
+                          est_name=est_name)
+    else:
+        # deferred: only the predictions that need est are made here
+        y_eq = {}
+        if 'BSR' in est_name:
+            for fold, X in [['train', X_train_scaled], ['test', X_test_scaled]]:
+                y_eq[fold] = equation_predictions(results['symbolic_model'],
+                                                  feature_names, X, est=est,
+                                                  est_name=est_name)
+        results['analysis'] = 'pending'
 
     ##################################################
     # write to file
     ##################################################
-    print('results:')
-    print(json.dumps(results,indent=4))
-    print('---')
-
-    # Determine algorithm folder (DSR, BSR, or AIFeynman)
-    if 'DSR' in est_name:
-        algo_folder = 'DSR'
-    elif 'BSR' in est_name:
-        algo_folder = 'BSR'
-    elif 'AIF' in est_name or 'Feyn' in est_name:
-        algo_folder = 'AIFeynman'
-    else:
-        algo_folder = 'Other'
-
-    # Create algorithm-specific subdirectory
-    algo_results_path = os.path.join(results_path, algo_folder)
-    if not os.path.exists(algo_results_path):
-        os.makedirs(algo_results_path)
-
-    # Filename without prefix (since we're in algorithm folder)
-    base_name = dataset_name + '_' + est_name + '_' + str(random_state)
-    if target_noise > 0:
-        base_name += '_target-noise' + str(target_noise)
-    if feature_noise > 0:
-        base_name += '_feature-noise' + str(feature_noise)
-
-    save_file = os.path.join(algo_results_path, base_name)
-
-    print('save_file:',save_file)
-
-    with open(save_file + '.json', 'w') as out:
-        json.dump(jsonify(results), out, indent=4)
+    write_results(results, save_file, timer, t0_run, c0_run)
+
+    if profile:
+        profiler.disable()
+        profiler.dump_stats(save_file + '.prof')
+        print('profile saved to',save_file + '.prof')
+
+    if spool_dir is not None:
+        enqueue(spool_dir, save_file + '.json', feature_names, est_name,
+                X_train_scaled, X_test_scaled, train_target, test_target,
+                y_pred_train=y_preds['train'], y_pred_test=y_preds['test'],
+                y_eq_train=y_eq.get('train'), y_eq_test=y_eq.get('test'),
+                full_simplify=full_simplicity)
+    elif full_simplicity:
+        # the full simplify is left to postprocess.py workers, so the job
+        # ends right away
+        enqueue_full_simplicity(os.path.join(results_path, 'spool'),
+                                save_file + '.json', feature_names)
 
     return save_file + '.json'
 
+# the multi-target run, inherited by its forked workers
+_multi_target = {}
+
+def _evaluate_target(dataset):
+    mt = _multi_target
+    # the workers share the job's cores
+    set_env_vars(str(mt['threads']))
+    # workers may evaluate several targets, so each gets a fresh est
+    est = copy.deepcopy(mt['est'])
+    budget.set_threads(est, mt['threads'])
+    return evaluate_model(dataset, *mt['args'], est, mt['model'],
+                          shared=mt['shared'], **mt['kwargs'])
+
+def evaluate_multi_target(datasets, results_path, random_state, est_name,
+                          est, model, n_jobs=1, **kwargs):
+    """evaluates est on every target of a multi-target problem, i.e. on
+    datasets that share their features (see read_file.multi_target_siblings).
+
+    The features are read, split and scaled once, and the targets are
+    fitted by min(n_jobs, number of targets) forked workers, which share
+    the n_jobs cores of the job. By default the targets are fitted one
+    after the other; analyze.py -multi_target asks for the memory and time
+    of the workers' share of the targets. Each target gets its own results
+    file; their paths are returned.
+    """
+    if len(set(tuple(read_feature_names(d)) for d in datasets)) > 1:
+        raise ValueError('datasets do not share their features: '
+                         + ', '.join(datasets))
+    print('evaluating',len(datasets),'targets with shared features:',datasets)
+    _multi_target.update(
+        shared=load_shared_features(
+            datasets[0], random_state,
+            use_dataframe=kwargs.get('use_dataframe', True),
+            scale_x=kwargs.get('scale_x', True),
+            max_train_samples=kwargs.get('max_train_samples', 0)),
+        args=(results_path, random_state, est_name), est=est, model=model,
+        kwargs=kwargs)
+    n_workers = max(1, min(n_jobs, len(datasets)))
+    _multi_target['threads'] = max(1, n_jobs//n_workers)
+    ctx = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             mp_context=ctx) as pool:
+        return list(pool.map(_evaluate_target, datasets))
+
 ################################################################################
 # main entry point
 ################################################################################
@@ -377,8 +605,41 @@ if __name__ == '__main__':
                         'to the target')
     parser.add_argument('-sym_data',action='store_true',  
                        help='Use symbolic dataset settings')
+    parser.add_argument('-full_simplicity',action='store_true',
+                        help='Also compute simplicity after a full sympy '
+                        'simplify, in a post-processing task (queued to '
+                        'spool_dir, or to <results_path>/spool)')
+    parser.add_argument('-spool_dir',action='store',type=str,default=None,
+                        help='Defer the symbolic post-processing to a task in '
+                        'this directory (run it with postprocess.py)')
+    parser.add_argument('-profile',action='store_true',
+                        help='Save a cProfile dump of the run next to the '
+                        'results')
+    parser.add_argument('-progress_interval',action='store',type=int,
+                        default=30, help='Seconds between samples of the fit '
+                        'progress written to <results>.progress (0 to disable)')
+    parser.add_argument('-supervise',action='store_true',
+                        help='Fit in a child process group that is killed if '
+                        'it overruns the time or memory limit')
+    parser.add_argument('-max_memory',action='store',type=int,default=0,
+                        help='Resident memory limit (MB) of supervised fits '
+                        '(0 for no limit)')
+    parser.add_argument('-cost_model',action='store',type=str,default=None,
+                        help='Cost model file (from budget.py) used to set '
+                        'the time limit')
+    parser.add_argument('-tune',action='store_true',
+                        help='Tune the hyper_params of the method with '
+                        'successive halving before fitting')
     parser.add_argument('-skip_tuning',action='store_true', dest='SKIP_TUNE', 
                         default=False, help='Dont tune the estimator')
+    parser.add_argument('-multi_target',action='store_true',
+                        help='Also evaluate the other targets of a '
+                        'multi-target dataset (agric, enb), sharing the '
+                        'features and fitting the targets with up to n_jobs '
+                        'workers')
+    parser.add_argument('-warm_start',action='store',type=str,default=None,
+                        help='Tuning knowledge base (from knowledge_base.py) '
+                        'to take the starting params from')
 
     args = parser.parse_args()
     set_env_vars(args.n_jobs)
@@ -411,12 +672,36 @@ if __name__ == '__main__':
     if args.max_samples != 0:
         eval_kwargs['max_train_samples'] = args.max_samples
 
-    evaluate_model(args.INPUT_FILE,
-                   args.RDIR,
-                   args.RANDOM_STATE,
-                   args.ALG,
-                   algorithm.est,  
-                   algorithm.model, 
-                   test = args.TEST, 
-                   **eval_kwargs
-                  )
+    kwargs = dict(test = args.TEST,
+                  full_simplicity = args.full_simplicity,
+                  spool_dir = args.spool_dir,
+                  profile = args.profile,
+                  progress_interval = args.progress_interval,
+                  supervise = args.supervise,
+                  max_memory = args.max_memory,
+                  cost_model = (read_cost_model(args.cost_model)
+                                if args.cost_model else None),
+                  hyper_params = getattr(algorithm, 'hyper_params', None),
+                  tune = args.tune and not args.SKIP_TUNE,
+                  warm_start = args.warm_start,
+                  **eval_kwargs)
+    datasets = [args.INPUT_FILE]
+    if args.multi_target:
+        datasets = multi_target_siblings(args.INPUT_FILE)
+    if len(datasets) > 1:
+        evaluate_multi_target(datasets,
+                              args.RDIR,
+                              args.RANDOM_STATE,
+                              args.ALG,
+                              algorithm.est,
+                              algorithm.model,
+                              n_jobs=int(args.n_jobs),
+                              **kwargs)
+    else:
+        evaluate_model(args.INPUT_FILE,
+                       args.RDIR,
+                       args.RANDOM_STATE,
+                       args.ALG,
+                       algorithm.est,
+                       algorithm.model,
+                       **kwargs)
@@ -0,0 +1,409 @@
+"""
+Executors run the jobs of analyze.py on a backend.
+
+A job is a dict with the command to run and its resources:
+
+    name:     job name, unique per (dataset, ml, seed)
+    command:  shell command
+    out_file, err_file: where stdout and stderr go
+    time:     time limit, as hr:min
+    cores:    number of cores
+    memory:   memory in MB (per core on SLURM; see workers_memory)
+
+Every executor supports the same operations, so features built on top of
+them (packing, arrays, retries) work on all backends:
+
+    prepare(jobs)     fills in the err_file of jobs whose stderr goes where
+                      the backend decides (SLURM array tasks), so it can
+                      be recorded before they are submitted
+    submit(jobs)      submits jobs in bulk and returns their ids
+    status(ids)       maps job ids to PENDING, RUNNING, COMPLETED, FAILED or
+                      CANCELLED
+    cancel(ids)       cancels jobs
+    retry(ids)        resubmits the FAILED jobs among ids (all by default)
+    queued_names()    names of the jobs queued or running on the backend
+
+Backends are created by name with `get_executor`:
+
+    local   runs the jobs one by one in this process' machine
+    pool    runs the jobs with a pool of n_jobs local workers
+    slurm   sbatch, one job per job or one job array for all (array=True)
+    lsf     bsub
+    fake    keeps the jobs in memory, for tests
+"""
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import slurm
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+CANCELLED = 'CANCELLED'
+ACTIVE = (PENDING, RUNNING)
+
+
+class Executor:
+    """base class of executors. Subclasses implement _submit, status and
+    cancel."""
+    # whether the memory of a job is per core rather than for the job
+    memory_per_core = False
+
+    def __init__(self):
+        self.jobs = {}
+
+    def workers_memory(self, memory, n_workers):
+        """the memory of a job running n_workers concurrent fits, on at
+        least as many cores, that need memory MB each."""
+        if self.memory_per_core:
+            # every worker has the memory of its core(s)
+            return memory
+        return memory*n_workers
+
+    def prepare(self, jobs):
+        return jobs
+
+    def submit(self, jobs):
+        ids = self._submit(jobs)
+        self.jobs.update(zip(ids, jobs))
+        return ids
+
+    def _submit(self, jobs):
+        raise NotImplementedError
+
+    def status(self, ids=None):
+        raise NotImplementedError
+
+    def cancel(self, ids=None):
+        raise NotImplementedError
+
+    def queued_names(self):
+        ids = list(self.jobs.keys())
+        states = self.status(ids)
+        return [self.jobs[i]['name'] for i in ids if states[i] in ACTIVE]
+
+    def retry(self, ids=None, update=None):
+        """resubmits the FAILED jobs among ids. update(job) can return a
+        changed copy of a job (e.g. with more memory), or None to give up on
+        it. Returns the new ids."""
+        ids = list(self.jobs.keys()) if ids is None else ids
+        states = self.status(ids)
+        jobs = []
+        for i in ids:
+            if states[i] != FAILED:
+                continue
+            job = self.jobs[i] if update is None else update(self.jobs[i])
+            if job is not None:
+                jobs.append(job)
+        return self.submit(jobs) if jobs else []
+
+    def wait(self, ids=None, poll=60):
+        """blocks until none of the jobs is pending or running."""
+        ids = list(self.jobs.keys()) if ids is None else ids
+        while any(s in ACTIVE for s in self.status(ids).values()):
+            time.sleep(poll)
+        return self.status(ids)
+
+
+class LocalExecutor(Executor):
+    """runs jobs on this machine with n_jobs workers. Each job runs in its
+    own process group, so cancelling it also stops the processes it starts.
+    submit returns right away; use wait() to block until the jobs are done."""
+    def __init__(self, n_jobs=1):
+        super().__init__()
+        self.pool = ThreadPoolExecutor(max_workers=n_jobs)
+        self.lock = threading.Lock()
+        self.states = {}
+        self.procs = {}
+        self.n_submitted = 0
+
+    def _run(self, i, job):
+        with self.lock:
+            if self.states[i] == CANCELLED:
+                return
+            self.states[i] = RUNNING
+            out = open(job['out_file'], 'w') if job.get('out_file') else None
+            err = open(job['err_file'], 'w') if job.get('err_file') else None
+            self.procs[i] = subprocess.Popen(job['command'], shell=True,
+                                             stdout=out, stderr=err,
+                                             start_new_session=True)
+        returncode = self.procs[i].wait()
+        for f in [out, err]:
+            if f:
+                f.close()
+        with self.lock:
+            if self.states[i] != CANCELLED:
+                self.states[i] = COMPLETED if returncode == 0 else FAILED
+
+    def _submit(self, jobs):
+        ids = []
+        for job in jobs:
+            with self.lock:
+                i = str(self.n_submitted)
+                self.n_submitted += 1
+                self.states[i] = PENDING
+            self.pool.submit(self._run, i, job)
+            ids.append(i)
+        return ids
+
+    def status(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        with self.lock:
+            return {i:self.states[i] for i in ids}
+
+    def cancel(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        with self.lock:
+            for i in ids:
+                if self.states[i] not in ACTIVE:
+                    continue
+                self.states[i] = CANCELLED
+                if i in self.procs:
+                    try:
+                        os.killpg(self.procs[i].pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+
+    def wait(self, ids=None, poll=1):
+        return super().wait(ids, poll)
+
+
+# scheduler job states mapped to executor states
+SLURM_STATES = {
+    'PENDING':PENDING, 'CONFIGURING':PENDING, 'REQUEUED':PENDING,
+    'RUNNING':RUNNING, 'COMPLETING':RUNNING, 'SUSPENDED':RUNNING,
+    'COMPLETED':COMPLETED, 'CANCELLED':CANCELLED,
+}
+LSF_STATES = {
+    'PEND':PENDING, 'PSUSP':PENDING, 'WAIT':PENDING,
+    'RUN':RUNNING, 'USUSP':RUNNING, 'SSUSP':RUNNING,
+    'DONE':COMPLETED, 'EXIT':FAILED,
+}
+
+
+def _expand_array_ids(job_id):
+    """expands the pending tasks of an array, e.g. 12_[1-3,5%2], to their
+    ids 12_1, 12_2, 12_3 and 12_5."""
+    m = re.fullmatch(r'(\d+)_\[([^\]]*)\]', job_id)
+    if m is None:
+        return [job_id]
+    base, tasks = m.group(1), m.group(2).split('%')[0]
+    ids = []
+    for r in tasks.split(','):
+        lo, _, hi = r.partition('-')
+        ids += [base + '_' + str(t) for t in range(int(lo), int(hi or lo)+1)]
+    return ids
+
+
+def _run(cmd):
+    return subprocess.run(cmd, check=True, capture_output=True,
+                          text=True).stdout
+
+
+class SlurmExecutor(Executor):
+    """submits jobs with sbatch. With array=True, each submit is one job
+    array over a manifest of the commands (see slurm.submit_array) per set
+    of resources (time, memory, cores) of the jobs, and the ids are those
+    of the array tasks, <array id>_<task>."""
+    memory_per_core = True
+
+    def __init__(self, account, queue, array=False, array_name='array',
+                 throttle=100, max_array_size=1000, manifest_dir='manifests',
+                 setup=slurm.SETUP):
+        super().__init__()
+        self.account = account
+        self.queue = queue
+        self.array = array
+        self.array_name = array_name
+        self.throttle = throttle
+        self.max_array_size = max_array_size
+        self.manifest_dir = manifest_dir
+        self.setup = setup
+        # names of the arrays of the jobs prepared for the next submit
+        self.stamp = None
+
+    def _arrays(self, jobs):
+        """the arrays of jobs, one per set of resources, so every job keeps
+        its own: (name, (time, memory, cores), indices of its jobs)."""
+        groups = {}
+        for i, job in enumerate(jobs):
+            groups.setdefault((job['time'], job['memory'], job['cores']),
+                              []).append(i)
+        return [(self.array_name if len(groups) == 1
+                 else '{}_{}'.format(self.array_name, g), resources, members)
+                for g, (resources, members) in enumerate(groups.items())]
+
+    def prepare(self, jobs):
+        """in array mode, sets the err_file of each job to that of its array
+        task, with %J for the array id. The next submit uses the same
+        names."""
+        if self.array:
+            self.stamp = slurm.new_stamp()
+            for name, _, members in self._arrays(jobs):
+                for k, i in enumerate(members):
+                    jobs[i]['err_file'] = slurm.array_err_file(
+                        self.manifest_dir, name, self.stamp, k,
+                        self.max_array_size)
+        return jobs
+
+    def _header(self, job, **kwargs):
+        return slurm.BATCH_HEADER.format(
+            OUT_FILE=job['out_file'], ERR_FILE=job['err_file'],
+            JOB_NAME=job['name'], A=self.account, QUEUE=self.queue,
+            N_CORES=job['cores'], M=job['memory'], TIME=job['time'],
+            **kwargs)
+
+    def _submit(self, jobs):
+        if not jobs:
+            return []
+        if self.array:
+            stamp, self.stamp = self.stamp or slurm.new_stamp(), None
+            ids = [None]*len(jobs)
+            for name, (t, memory, cores), members in self._arrays(jobs):
+                array_ids = slurm.submit_array(
+                    [jobs[i]['command'] for i in members], self.manifest_dir,
+                    name, throttle=self.throttle,
+                    max_array_size=self.max_array_size, setup=self.setup,
+                    stamp=stamp, A=self.account, QUEUE=self.queue,
+                    N_CORES=cores, M=memory, TIME=t)
+                for k, i in enumerate(members):
+                    ids[i] = '{}_{}'.format(
+                        array_ids[k//self.max_array_size],
+                        k % self.max_array_size + 1)
+            return ids
+
+        ids = []
+        for job in jobs:
+            script_file = re.sub(r'(\.%J)?\.out$', '', job['out_file']) + '.sh'
+            with open(script_file, 'w') as f:
+                f.write(self._header(job) + '\n' + self.setup + '\n\n'
+                        + job['command'] + '\n')
+            print(job['name'])
+            ids.append(slurm.sbatch(script_file))
+        return ids
+
+    def status(self, ids=None):
+        """job states from sacct, which also knows about finished jobs.
+        Jobs sacct does not report are taken as COMPLETED."""
+        ids = list(self.jobs.keys()) if ids is None else ids
+        if not ids:
+            return {}
+        states = {i:COMPLETED for i in ids}
+        out = _run(['sacct', '-n', '-P', '-X', '-o', 'JobID,State',
+                    '-j', ','.join(sorted(set(i.split('_')[0]
+                                              for i in ids)))])
+        for line in out.splitlines():
+            if '|' not in line:
+                continue
+            job_id, state = line.split('|')[:2]
+            state = SLURM_STATES.get(state.split()[0] if state else '',
+                                     FAILED)
+            for i in _expand_array_ids(job_id):
+                if i in states:
+                    states[i] = state
+        return states
+
+    def cancel(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        if ids:
+            _run(['scancel'] + list(ids))
+
+    def queued_names(self):
+        return slurm.squeue_job_names()
+
+
+class LsfExecutor(Executor):
+    """submits jobs with bsub."""
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def _submit(self, jobs):
+        ids = []
+        for job in jobs:
+            cmd = ['bsub', '-o', job['out_file'], '-e', job['err_file'],
+                   '-n', str(job['cores']), '-J', job['name'],
+                   '-q', self.queue,
+                   '-R', 'span[hosts=1] rusage[mem={}]'.format(job['memory']),
+                   '-W', job['time'], '-M', str(job['memory']),
+                   job['command']]
+            print(' '.join(cmd))
+            out = _run(cmd)
+            m = re.search(r'Job <(\d+)>', out)
+            ids.append(m.group(1) if m else None)
+        return ids
+
+    def status(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        if not ids:
+            return {}
+        states = {i:COMPLETED for i in ids}
+        out = _run(['bjobs', '-a', '-noheader', '-o', 'jobid stat'] + ids)
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[0] in states:
+                states[fields[0]] = LSF_STATES.get(fields[1], FAILED)
+        return states
+
+    def cancel(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        if ids:
+            _run(['bkill'] + list(ids))
+
+    def queued_names(self):
+        out = _run(['bjobs', '-o', 'JOB_NAME', '-noheader'])
+        return out.split('\n')
+
+
+class FakeExecutor(Executor):
+    """keeps jobs in memory without running them. Tests set their states
+    with set_state."""
+    def __init__(self):
+        super().__init__()
+        self.states = {}
+        self.n_submitted = 0
+
+    def _submit(self, jobs):
+        ids = [str(self.n_submitted + k) for k in range(len(jobs))]
+        self.n_submitted += len(jobs)
+        self.states.update({i:PENDING for i in ids})
+        return ids
+
+    def set_state(self, ids, state):
+        for i in ids:
+            self.states[i] = state
+
+    def status(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        return {i:self.states[i] for i in ids}
+
+    def cancel(self, ids=None):
+        ids = list(self.jobs.keys()) if ids is None else ids
+        for i in ids:
+            if self.states[i] in ACTIVE:
+                self.states[i] = CANCELLED
+
+
+EXECUTORS = ['local', 'pool', 'slurm', 'lsf', 'fake']
+
+
+def get_executor(name, n_jobs=1, account=None, queue=None, **slurm_kwargs):
+    """creates the executor called name. n_jobs is used by pool, account
+    by slurm, queue by slurm and lsf, and slurm_kwargs by slurm."""
+    if name == 'local':
+        return LocalExecutor(n_jobs=1)
+    if name == 'pool':
+        return LocalExecutor(n_jobs=n_jobs)
+    if name == 'slurm':
+        return SlurmExecutor(account, queue, **slurm_kwargs)
+    if name == 'lsf':
+        return LsfExecutor(queue)
+    if name == 'fake':
+        return FakeExecutor()
+    raise ValueError('unknown executor ' + name + '; choose from '
+                     + ', '.join(EXECUTORS))
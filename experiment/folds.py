@@ -0,0 +1,141 @@
+"""
+Cross-validation folds shared by the tuning estimators.
+
+Tuning wrappers (OptunaSearchCV, bingo's CrossValRegressor, the halving
+searches and the tuning stage of evaluate_model) used to draw their own
+folds. Here the folds are computed once per (number of samples, number of
+splits, seed), so every method is tuned on the same folds of a dataset and
+seed:
+
+- `CachedKFold` is a drop-in for KFold(shuffle=True) in sklearn-style
+  wrappers. Its random_state defaults to the seed of the run, which
+  evaluate_model sets with `set_seed`.
+- `get_folds` materializes the folds of (X, y) once. The data is permuted
+  once, so every test set is a zero-copy view, and every training set is
+  one contiguous array in shuffled order, whose prefixes (views) are
+  random subsamples.
+"""
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import BaseCrossValidator
+from sklearn.utils import check_random_state
+from sklearn.utils.validation import _num_samples
+
+# the seed of the run, set by evaluate_model
+SEED = None
+
+
+def set_seed(random_state):
+    global SEED
+    SEED = random_state
+
+
+def _resolve(random_state):
+    return SEED if random_state is None else random_state
+
+
+@lru_cache(maxsize=32)
+def _bounds(n_samples, n_splits, random_state):
+    """the permutation of the samples and the [start, stop) of each test
+    set in it, as KFold(n_splits, shuffle=True, random_state) draws them."""
+    order = np.arange(n_samples)
+    check_random_state(random_state).shuffle(order)
+    order.setflags(write=False)
+    sizes = np.full(n_splits, n_samples // n_splits)
+    sizes[:n_samples % n_splits] += 1
+    stops = np.cumsum(sizes)
+    return order, list(zip(stops - sizes, stops))
+
+
+@lru_cache(maxsize=32)
+def kfold_splits(n_samples, n_splits, random_state):
+    """the (train, test) indices of KFold(n_splits, shuffle=True,
+    random_state), as read-only arrays computed once."""
+    order, bounds = _bounds(n_samples, n_splits, random_state)
+    splits = []
+    for start, stop in bounds:
+        mask = np.zeros(n_samples, dtype=bool)
+        mask[order[start:stop]] = True
+        train, test = np.flatnonzero(~mask), np.flatnonzero(mask)
+        train.setflags(write=False)
+        test.setflags(write=False)
+        splits.append((train, test))
+    return tuple(splits)
+
+
+class CachedKFold(BaseCrossValidator):
+    """KFold(n_splits, shuffle=True) over cached splits. With random_state
+    None, the seed of the run is used."""
+    def __init__(self, n_splits=5, random_state=None):
+        self.n_splits = n_splits
+        self.random_state = random_state
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return self.n_splits
+
+    def split(self, X, y=None, groups=None):
+        yield from kfold_splits(_num_samples(X), self.n_splits,
+                                _resolve(self.random_state))
+
+    def _iter_test_indices(self, X=None, y=None, groups=None):
+        for _, test in self.split(X, y, groups):
+            yield test
+
+
+def _rows(X, start, stop):
+    return X.iloc[start:stop] if isinstance(X, (pd.DataFrame, pd.Series)) \
+        else X[start:stop]
+
+
+class Folds:
+    """the folds of (X, y), materialized once. Use get_folds."""
+    def __init__(self, X, y, n_splits=5, random_state=None):
+        self.n_splits = n_splits
+        order, self.bounds = _bounds(len(y), n_splits,
+                                     _resolve(random_state))
+        # the only full copy: the data in shuffled order
+        if isinstance(X, pd.DataFrame):
+            self.X = X.iloc[order]
+        else:
+            self.X = np.ascontiguousarray(np.asarray(X)[order])
+        self.y = np.ascontiguousarray(np.asarray(y)[order])
+        self._train = {}
+
+    def __len__(self):
+        return self.n_splits
+
+    def test(self, k):
+        """X and y of test set k, as views."""
+        start, stop = self.bounds[k]
+        return _rows(self.X, start, stop), self.y[start:stop]
+
+    def train(self, k, n_samples=None):
+        """X and y of training set k, or of its first n_samples (a random
+        subsample), as views of one contiguous copy."""
+        if k not in self._train:
+            start, stop = self.bounds[k]
+            keep = np.r_[0:start, stop:len(self.y)]
+            if isinstance(self.X, pd.DataFrame):
+                X = self.X.iloc[keep]
+            else:
+                X = np.ascontiguousarray(self.X[keep])
+            self._train[k] = (X, np.ascontiguousarray(self.y[keep]))
+        X, y = self._train[k]
+        return _rows(X, 0, n_samples), y[:n_samples]
+
+
+# folds of the last few datasets
+_folds = {}
+MAX_CACHED = 4
+
+
+def get_folds(X, y, n_splits=5, random_state=None):
+    """the Folds of (X, y), reused for the same X and y objects."""
+    key = (id(X), id(y), n_splits, _resolve(random_state))
+    # the cache holds on to X and y, so their ids are not reused
+    if key not in _folds:
+        if len(_folds) >= MAX_CACHED:
+            _folds.pop(next(iter(_folds)))
+        _folds[key] = (X, y, Folds(X, y, n_splits, random_state))
+    return _folds[key][2]
@@ -0,0 +1,243 @@
+"""
+A knowledge base of tuning results across datasets.
+
+Each record holds the meta-features of a dataset, the params a method ran
+with on it, the score they got and the fit time. Records come from
+evaluate_model results (their params and test score, and the fold scores
+of every candidate of the tuning stage) and are stored as json lines:
+
+    python knowledge_base.py RESULTS_DIR -kb knowledge_base.jsonl
+
+Params for a new dataset are recommended from its nearest neighbours in
+meta-feature space: every setting tried on the k nearest datasets is
+scored by its mean score there, weighted by closeness. evaluate_model
+-warm_start starts from the recommended params (and tunes only among the
+top recommendations), and postprocessing/pick_best_params.py writes the
+settings recommended over all datasets to methods/tuned/params.
+"""
+import ast
+import json
+import os
+import numpy as np
+import pandas as pd
+from glob import glob
+from scipy.stats import kurtosis, skew
+from read_file import read_file
+import budget
+
+META_FEATURES = ['log_n_samples', 'log_n_features', 'target_skew',
+                 'target_kurtosis', 'mean_abs_corr', 'max_abs_corr',
+                 'frac_discrete', 'linear_r2']
+# params that describe the run rather than the search
+IGNORED_PARAMS = (['random_state', 'seed', 'n_jobs', 'n_threads', 'verbose']
+                  + budget.TIME_PARAMS)
+# features with at most this many values are discrete
+MAX_DISCRETE = 10
+# samples used for the linear fit
+MAX_LINEAR_SAMPLES = 2000
+K_NEIGHBORS = 5
+
+
+def meta_features(X, y):
+    """cheap descriptors of a regression dataset."""
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n, p = X.shape
+    Xc = X - X.mean(axis=0)
+    yc = y - y.mean()
+    norms = np.sqrt((Xc**2).sum(axis=0)*(yc**2).sum())
+    # constant features have no correlation
+    corr = np.abs(Xc.T @ yc)/np.where(norms > 0, norms, np.inf)
+    # least squares on standardized features, with an intercept
+    idx = np.arange(n)[:MAX_LINEAR_SAMPLES]
+    sd = X.std(axis=0)
+    A = np.hstack([Xc[idx]/np.where(sd > 0, sd, 1), np.ones((len(idx), 1))])
+    coef = np.linalg.lstsq(A, y[idx], rcond=None)[0]
+    ss = ((y[idx] - y[idx].mean())**2).sum()
+    linear_r2 = 1 - ((y[idx] - A @ coef)**2).sum()/ss if ss > 0 else 0.0
+    return dict(
+        log_n_samples=float(np.log(n)),
+        log_n_features=float(np.log(p)),
+        target_skew=float(np.nan_to_num(skew(y))),
+        target_kurtosis=float(np.nan_to_num(kurtosis(y))),
+        mean_abs_corr=float(corr.mean()),
+        max_abs_corr=float(corr.max()),
+        frac_discrete=float(np.mean([len(np.unique(x)) <= MAX_DISCRETE
+                                     for x in X.T])),
+        linear_r2=float(linear_r2),
+    )
+
+
+def dataset_meta_features(dataset):
+    X, y, _ = read_file(dataset, use_dataframe=False)
+    return meta_features(X, y)
+
+
+def search_params(params):
+    """params without IGNORED_PARAMS."""
+    return {k:v for k,v in params.items() if k not in IGNORED_PARAMS}
+
+
+def params_key(params):
+    return json.dumps(search_params(params), sort_keys=True)
+
+
+def read_kb(kb_file):
+    with open(kb_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def records_from_result(results, meta=None):
+    """knowledge base records of an evaluate_model result: its params and
+    test score, and the last cross-validation score of every candidate of
+    its tuning stage."""
+    meta = meta or results.get('meta_features')
+    if meta is None:
+        return []
+    base = dict(algorithm=results['algorithm'], dataset=results['dataset'],
+                meta_features=meta)
+    records = []
+    if results.get('r2_test') is not None:
+        records.append(dict(base, params=search_params(results['params']),
+                            score=results['r2_test'],
+                            time=results.get('time_time'), source='test'))
+    if results.get('tuning'):
+        last = {}
+        for r in results['tuning']['rounds']:
+            for c in r['candidates']:
+                last[params_key(c['params'])] = c
+        for c in last.values():
+            records.append(dict(base, params=search_params(c['params']),
+                                score=c['mean_score'], time=c['fit_time'],
+                                source='tuning'))
+    return records
+
+
+def add_results(kb_file, results_dir, data_dir=None):
+    """adds the records of the results in results_dir (searched recursively)
+    to kb_file. Results saved without meta-features need their dataset in
+    data_dir. Returns the number of records added."""
+    meta_cache = {}
+    n = 0
+    with open(kb_file, 'a') as out:
+        for f in glob(os.path.join(results_dir, '**', '*.json'),
+                      recursive=True):
+            try:
+                with open(f, 'r') as fh:
+                    results = json.load(fh)
+            except Exception:
+                continue
+            if not all(c in results for c in ['dataset','algorithm','params']):
+                continue
+            name = results['dataset']
+            meta = results.get('meta_features')
+            if meta is None and data_dir is not None:
+                if name not in meta_cache:
+                    files = glob(os.path.join(data_dir, '**', name + '.tsv.gz'),
+                                 recursive=True)
+                    meta_cache[name] = (dataset_meta_features(files[0])
+                                        if files else None)
+                meta = meta_cache[name]
+            for rec in records_from_result(results, meta):
+                out.write(json.dumps(rec) + '\n')
+                n += 1
+    return n
+
+
+def records_from_frame(df, meta_features_of):
+    """knowledge base records from a collated results frame (with dataset,
+    algorithm, params_str, r2_test and time_time columns).
+    meta_features_of(dataset) gives the meta-features of a dataset, or None
+    to pool all datasets."""
+    records = []
+    for _, row in df.iterrows():
+        records.append(dict(algorithm=row['algorithm'],
+                            dataset=row['dataset'],
+                            meta_features=meta_features_of(row['dataset']),
+                            params=search_params(
+                                ast.literal_eval(row['params_str'])),
+                            score=row['r2_test'], time=row['time_time'],
+                            source='test'))
+    return records
+
+
+def recommend(kb, algorithm, meta=None, k=K_NEIGHBORS, n=1, exclude=None):
+    """the n best params of algorithm for a dataset with meta-features meta.
+
+    Each setting is scored by its mean score (r2 clipped to [-1, 1]) on the
+    k datasets nearest to meta, weighted by 1/(1 + distance), with the
+    meta-features standardized over the knowledge base. Without meta, all
+    datasets count equally. Records of the dataset `exclude` are left out.
+    """
+    recs = [r for r in kb if r['algorithm'] == algorithm
+            and r['dataset'] != exclude and r['score'] is not None
+            and np.isfinite(r['score'])
+            and (meta is None or r['meta_features'] is not None)]
+    if not recs:
+        return []
+    # mean score of each setting on each dataset
+    df = pd.DataFrame(dict(dataset=r['dataset'], key=params_key(r['params']),
+                           score=float(np.clip(r['score'], -1, 1)))
+                      for r in recs)
+    scores = df.groupby(['dataset', 'key'])['score'].mean().reset_index()
+
+    datasets = scores['dataset'].unique()
+    weights = pd.Series(1.0, index=datasets)
+    if meta is not None:
+        metas = {r['dataset']:r['meta_features'] for r in recs}
+        M = np.array([[metas[d][f] for f in META_FEATURES] for d in datasets])
+        q = np.array([meta[f] for f in META_FEATURES])
+        mu, sd = M.mean(axis=0), M.std(axis=0)
+        sd[sd == 0] = 1
+        dist = np.sqrt((((M - mu)/sd - (q - mu)/sd)**2).sum(axis=1))
+        nearest = np.argsort(dist)[:k]
+        weights = pd.Series(1/(1 + dist[nearest]), index=datasets[nearest])
+    scores = scores.loc[scores['dataset'].isin(weights.index)]
+    w = scores['dataset'].map(weights)
+    ranked = ((scores['score']*w).groupby(scores['key']).sum()
+              / w.groupby(scores['key']).sum())
+    # ties go to the setting tried on more of the datasets
+    counts = scores.groupby('key').size()
+    order = sorted(ranked.index, key=lambda key: (-ranked[key], -counts[key]))
+    return [json.loads(key) for key in order[:n]]
+
+
+def applicable_params(est, params):
+    """the params that est has, skipping values that were stored as strings
+    but are not strings in est (e.g. objects)."""
+    current = est.get_params()
+    return {p:v for p,v in params.items() if p in current
+            and not (isinstance(v, str) and current[p] is not None
+                     and not isinstance(current[p], str))}
+
+
+def write_param_module(filename, params):
+    """writes params as a module of methods/tuned/params."""
+    with open(filename, 'w') as f:
+        f.write('params = {!r}\n'.format(params))
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Add evaluate_model results to the tuning knowledge "
+        "base.", add_help=False)
+    parser.add_argument('RESULTS_DIR', type=str,
+                        help='Directory of evaluate_model results')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-kb', action='store', dest='KB', type=str,
+                        default='knowledge_base.jsonl',
+                        help='Knowledge base file')
+    parser.add_argument('-data_dir', action='store', dest='DATA_DIR',
+                        type=str, default=None,
+                        help='Datasets of results saved without '
+                        'meta-features')
+    args = parser.parse_args()
+
+    n = add_results(args.KB, args.RESULTS_DIR, args.DATA_DIR)
+    print('added',n,'records to',args.KB)
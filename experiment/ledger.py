@@ -0,0 +1,249 @@
+"""
+The job ledger: what happened to every benchmark job.
+
+analyze.py runs each evaluate_model command through this script, which
+records how it ended in the results index (RESULTS_DIR/index.jsonl):
+
+    python ledger.py "python evaluate_model.py ..." -index INDEX -key KEY
+
+The key names the experiment (dataset, ml and seed, as in the result file
+name). analyze.py also records a 'submitted' event with the job's time and
+memory for every attempt, so the ledger holds, per key, the attempts made,
+their resources and how they ended: exit status, the tail of stderr, peak
+memory and duration.
+
+On the next run of analyze.py, experiments without results are triaged
+from their last attempt. Jobs that ran out of memory are resubmitted with
+MEMORY_FACTOR times the memory, jobs that hit their time limit with
+TIME_FACTOR times the time, and other failures as they were, until
+max_attempts attempts have been made.
+"""
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from glob import glob
+
+# outcomes of an attempt
+OK = 'ok'
+OOM = 'oom'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+# submitted, but neither finished nor queued
+LOST = 'lost'
+
+TAIL_LINES = 20
+MAX_ATTEMPTS = 3
+MEMORY_FACTOR = 2
+TIME_FACTOR = 2
+
+# stderr messages of jobs that ran out of memory or time, from python, C++,
+# the kernel, SLURM and LSF
+OOM_PATTERNS = ['MemoryError', 'std::bad_alloc', 'Cannot allocate memory',
+                'out of memory', 'Out Of Memory', 'oom-kill', 'oom_kill',
+                'TERM_MEMLIMIT']
+TIMEOUT_PATTERNS = ['DUE TO TIME LIMIT', 'TERM_RUNLIMIT', 'TimeLimit']
+
+
+def record_status(index_file, status):
+    """appends a job status to the results index."""
+    # a single short write in append mode, so concurrent workers do not
+    # interleave lines
+    with open(index_file, 'a') as f:
+        f.write(json.dumps(status) + '\n')
+
+
+def classify(returncode, stderr_tail='', terminated=False):
+    """the outcome of a job from its return code, the tail of its stderr and
+    whether it was terminated (by its scheduler, at the time limit)."""
+    if returncode == 0:
+        return OK
+    if any(p in stderr_tail for p in OOM_PATTERNS):
+        return OOM
+    if terminated or any(p in stderr_tail for p in TIMEOUT_PATTERNS):
+        return TIMEOUT
+    # the kernel's OOM killer sends SIGKILL
+    if returncode in [-signal.SIGKILL, 128 + signal.SIGKILL]:
+        return OOM
+    if returncode in [-signal.SIGTERM, 128 + signal.SIGTERM,
+                      -signal.SIGXCPU, 128 + signal.SIGXCPU]:
+        return TIMEOUT
+    return ERROR
+
+
+def _tee(stream, tail):
+    """copies stream to stderr, keeping its last lines in tail."""
+    for line in stream:
+        sys.stderr.write(line)
+        sys.stderr.flush()
+        tail.append(line)
+
+
+def run_command(cmd, index_file=None, handle_signals=False, **fields):
+    """runs cmd in a shell and returns its status: return code, outcome,
+    duration, peak memory (MB) and the tail of its stderr, plus fields.
+    The status is appended to index_file, if given.
+
+    With handle_signals (main thread only), SIGTERM and SIGINT are passed on
+    to cmd and mark it as terminated, so that a job stopped at its time
+    limit is still recorded.
+    """
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, shell=True, stderr=subprocess.PIPE,
+                            text=True, errors='replace')
+    tail = deque(maxlen=TAIL_LINES)
+    tee = threading.Thread(target=_tee, args=(proc.stderr, tail), daemon=True)
+    tee.start()
+
+    terminated = []
+    if handle_signals:
+        def forward(signum, frame):
+            terminated.append(signal.Signals(signum).name)
+            proc.send_signal(signum)
+        for s in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(s, forward)
+
+    # wait4 gives the resource usage of this command alone
+    _, wait_status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    tee.join(timeout=10)
+
+    stderr_tail = ''.join(tail)
+    status = dict(event='finished', command=cmd,
+                  returncode=proc.returncode,
+                  outcome=classify(proc.returncode, stderr_tail,
+                                   bool(terminated)),
+                  signal=terminated[0] if terminated else None,
+                  duration=time.time() - t0,
+                  # ru_maxrss is in KB on linux
+                  peak_rss_mb=rusage.ru_maxrss/1024,
+                  stderr_tail=stderr_tail,
+                  host=os.uname().nodename, finished=time.time(),
+                  **fields)
+    if index_file:
+        record_status(index_file, status)
+    return status
+
+
+def wrap(cmd, index_file, key):
+    """the command that runs cmd through the ledger."""
+    return 'python ledger.py {} -index {} -key {}'.format(
+        shlex.quote(cmd), shlex.quote(index_file), shlex.quote(key))
+
+
+def record_submitted(index_file, key, job, attempt=1, **fields):
+    """records the submission of job, an attempt at experiment key."""
+    record_status(index_file, dict(event='submitted', key=key,
+                                   attempt=attempt,
+                                   time=job.get('time'),
+                                   memory=job.get('memory'),
+                                   err_file=job.get('err_file'),
+                                   submitted=time.time(), **fields))
+
+
+def read_ledger(index_file):
+    """the attempts at each experiment, as {key: [attempt, ...]}. An attempt
+    is its submitted event updated with the finished event that followed."""
+    ledger = {}
+    if not os.path.exists(index_file):
+        return ledger
+    with open(index_file, 'r') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by a killed writer
+                continue
+            key = event.get('key')
+            if key is None:
+                continue
+            attempts = ledger.setdefault(key, [])
+            if (event.get('event') == 'finished' and attempts
+                and 'returncode' not in attempts[-1]):
+                attempts[-1].update(event)
+            else:
+                attempts.append(event)
+    return ledger
+
+
+def _err_tail(err_file):
+    """the tail of the newest err file matching err_file, where %J stands for
+    the job id."""
+    if not err_file:
+        return ''
+    files = glob(err_file.replace('%J', '*'))
+    if not files:
+        return ''
+    with open(max(files, key=os.path.getmtime), 'r', errors='replace') as f:
+        return ''.join(deque(f, maxlen=TAIL_LINES))
+
+
+def triage(attempt):
+    """the outcome of an attempt. Jobs killed along with the ledger (e.g. by
+    the OOM killer) have no finished event; their err file is checked."""
+    if 'outcome' in attempt:
+        return attempt['outcome']
+    tail = _err_tail(attempt.get('err_file'))
+    if any(p in tail for p in OOM_PATTERNS):
+        return OOM
+    if any(p in tail for p in TIMEOUT_PATTERNS):
+        return TIMEOUT
+    return LOST
+
+
+def scale_time(t, factor):
+    """scales a hr:min time limit."""
+    hours, minutes = t.split(':')
+    minutes = int(factor*(60*int(hours) + int(minutes)))
+    return '{}:{:02d}'.format(minutes//60, minutes % 60)
+
+
+def retry_resources(attempts, time_limit, memory,
+                    max_attempts=MAX_ATTEMPTS):
+    """the resources of the next attempt at an experiment, given the previous
+    attempts: a dict with the attempt number, time, memory and the outcome
+    of the last attempt, or None to give up on it."""
+    if not attempts:
+        return dict(attempt=1, time=time_limit, memory=memory, outcome=None)
+    if len(attempts) >= max_attempts:
+        return None
+    last = attempts[-1]
+    # escalate from the resources of the last attempt
+    time_limit = last.get('time') or time_limit
+    memory = last.get('memory') or memory
+    outcome = triage(last)
+    if outcome == OOM:
+        memory = int(MEMORY_FACTOR*memory)
+    elif outcome == TIMEOUT:
+        time_limit = scale_time(time_limit, TIME_FACTOR)
+    return dict(attempt=len(attempts) + 1, time=time_limit, memory=memory,
+                outcome=outcome)
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run a job and record how it ended in the job ledger.",
+        add_help=False)
+    parser.add_argument('COMMAND', type=str, help='Command to run')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-index', action='store', type=str, required=True,
+                        help='Results index the job status is added to')
+    parser.add_argument('-key', action='store', type=str, default=None,
+                        help='Experiment the job belongs to')
+    args = parser.parse_args()
+
+    status = run_command(args.COMMAND, args.index, handle_signals=True,
+                         key=args.key)
+    exit(status['returncode'] if status['returncode'] >= 0
+         else 128 - status['returncode'])
@@ -1,43 +1,13 @@
 from sklearn.base import BaseEstimator
-from sklearn.pipeline import make_pipeline, make_union
 
 import os
 import subprocess
-import pandas as pd
+import tempfile
 import numpy as np
-import time
 
 this_dir = os.path.dirname(os.path.realpath(__file__))
 
-class GSGPRegressor(BaseEstimator):
-
-
-
-
-  def __init__(self,  g=100, popsize=1000, rt_mut=0.5, rt_cross=0.5, 
-               max_len=10, n_jobs=1):
-    env = dict(os.environ)
-    self.g = g
-    self.popsize = popsize
-    self.rt_cross = rt_cross
-    self.rt_mut = rt_mut
-    self.max_len = max_len
-    self.trainsize=-1
-    self.nvar=-1
-    self.exe_name = 'GP'
-
-  def line_prepender(self,filename, line):
-    with open(filename, 'r+') as f:
-      content = f.read()
-      f.seek(0, 0)
-      f.write(line.rstrip('\r\n') + '\n' + content)
-
-
-  def fit(self, X_train, y_train, sample_weight=None):
-    self.X_train=X_train
-    self.y_train=y_train
-    self.y_test=y_train # this is a hack just to run the executable
-    text='''population_size={}
+CONFIG_TEMPLATE = '''population_size={}
 max_number_generations={}
 init_type = 2
 p_crossover={}
@@ -53,83 +23,154 @@ minimization_problem = 1
 random_tree = 500
 expression_file = 0
 USE_TEST_SET = 0
-'''.format(self.popsize, self.g, self.rt_cross,self.rt_mut,self.max_len)
+'''
+
+def _sigmoid(x):
+  # exp overflows to inf for very negative x, giving 0 as in GP.h
+  with np.errstate(over='ignore'):
+    return 1.0/(1.0 + np.exp(-x))
+
+
+def _protected_division(num, den):
+  """mirrors protected_division in GP.h: returns 1 where den == 0."""
+  out = np.ones_like(num)
+  np.divide(num, den, out=out, where=den != 0)
+  return out
+
+
+def _parse_tree(tokens, pos=0):
+  """parses the fully parenthesized infix output of print_math_style into a
+  nested (op, left, right) tuple. Terminals are ('x', index) or ('c', value)."""
+  tok = tokens[pos]
+  if tok == '(':
+    left, pos = _parse_tree(tokens, pos+1)
+    op = tokens[pos]
+    right, pos = _parse_tree(tokens, pos+1)
+    assert tokens[pos] == ')'
+    return (op, left, right), pos+1
+  if tok.startswith('x') and tok[1:].isdigit():
+    return ('x', int(tok[1:])), pos+1
+  return ('c', float(tok)), pos+1
+
+
+def _eval_tree(tree, X):
+  """evaluates a parsed tree on all rows of X at once."""
+  op = tree[0]
+  if op == 'x':
+    return X[:, tree[1]]
+  if op == 'c':
+    return np.full(X.shape[0], tree[1])
+  left = _eval_tree(tree[1], X)
+  right = _eval_tree(tree[2], X)
+  if op == '+':
+    return left + right
+  if op == '-':
+    return left - right
+  if op == '*':
+    return left * right
+  return _protected_division(left, right)
+
+
+def _read_trace(filename):
+  """reads <name>-trace.txt into one (n_entries, 6) array per generation."""
+  generations = []
+  with open(filename, 'r') as f:
+    for block in f.read().split('***'):
+      rows = [line.split() for line in block.strip().splitlines()]
+      if rows:
+        generations.append(np.array(rows, dtype=float))
+  return generations
 
-    self.dataset = this_dir + '/tmp_data_' + str(np.random.randint(2**15-1))
-    self.dataset_short = self.dataset.split('/')[-1]
-    ffile=open(self.dataset+"-configuration.ini","w")
-    ffile.write(text)
 
+class GSGPRegressor(BaseEstimator):
+  """Geometric Semantic GP (Castelli et al.).
 
-  def predict(self, X_test):
+  The GP executable is only used to evolve the model in `fit`. Its output
+  (the initial population, the random trees and the trace of the genetic
+  operators leading to the best individual) is parsed and kept in memory, so
+  `predict` evaluates the model in-process without calling the executable.
+  """
 
-    # train data
-    data=pd.DataFrame(self.X_train)
-    data['target']=self.y_train
-    data.to_csv(self.dataset+"_train",
-                header=None, index=None, sep='\t')
-    trainsize=self.X_train.shape[0]
-    nvar=self.X_train.shape[1]
-    self.line_prepender(self.dataset+'_train',str(trainsize)+'\n')
-    self.line_prepender(self.dataset+'_train',str(nvar)+'\n')
-    time.sleep(1)
-
-    # test data dummy: required by GSGP to be passed during training.
-    # I refuse to pass the target into this exe on the test data during train, 
-    # so I'm making a dummy random target.
-    datat_dummy=pd.DataFrame(X_test)
-    datat_dummy['target']=np.random.rand(len(X_test))
-    datat_dummy.to_csv(self.dataset+"_test_dummy",
-                  header=None, index=None, sep='\t')
-    testsize=X_test.shape[0]
-    nvar=X_test.shape[1]
-    time.sleep(1)
-    self.line_prepender(self.dataset+'_test_dummy',str(X_test.shape[0])+'\n')
-    self.line_prepender(self.dataset+'_test_dummy',str(X_test.shape[1])+'\n')
-    time.sleep(1)
-
-    #test data 2: the test data, without target.
-    datat2 = datat_dummy.drop('target',axis=1)
-    datat2.to_csv(self.dataset+"_test",
-                  header=None, index=None, sep='\t')
-
-    #do training
-    subprocess.call(["sed -i -e 's/USE_TEST_SET.*/USE_TEST_SET = 0/g' "
-                     +self.dataset+"-configuration.ini"],shell=True)
-    subprocess.call(["sed -i -e 's/expression_file.*/expression_file = 0/g' "
-                     +self.dataset+"-configuration.ini"],shell=True)
-
-    print('cmd:',' '.join([this_dir + '/' + self.exe_name, 
-                     ' -train_file '+ self.dataset+'_train',
-                     '-test_file ', self.dataset+'_test_dummy',
-                     " -name "+ self.dataset]))
-
-    subprocess.call(' '.join([this_dir + '/' + self.exe_name, 
-                     ' -train_file '+ self.dataset+'_train',
-                     '-test_file ', self.dataset+'_test_dummy',
-                     " -name "+ self.dataset]),
-                    shell=True)
-    time.sleep(1)
-    #do testing
-    subprocess.call(["sed -i -e 's/USE_TEST_SET.*/USE_TEST_SET = 1/g' "
-                     +self.dataset+"-configuration.ini"],shell=True)
-    subprocess.call(["sed -i -e 's/expression_file.*/expression_file = 1/g' "
-                     +self.dataset+"-configuration.ini"],shell=True)
-    subprocess.call(' '.join([this_dir + '/' + self.exe_name, 
-                     '-test_file',self.dataset+ '_test',
-                     '-name ', self.dataset]),
-                    shell=True)
-    time.sleep(1) # without this, the output file sometimes DNE
-    y_pred=[]
-    with open(self.dataset+'-evaluation_on_unseen_data.txt','r') as f:
-      for line in f:
-        y_pred.append(float(line.strip()))
-    # y_pred=y_pred[:-1]
-    print('y_pred:',len(y_pred),y_pred)
-    print('X len',len(X_test))
-    assert(len(y_pred) == len(X_test))
-
-    os.remove(self.dataset+"_train")
-    os.remove(self.dataset+"_test")
-    os.remove(self.dataset+"_test_dummy")
-    return y_pred
+  def __init__(self,  g=100, popsize=1000, rt_mut=0.5, rt_cross=0.5,
+               max_len=10, n_jobs=1):
+    self.g = g
+    self.popsize = popsize
+    self.rt_cross = rt_cross
+    self.rt_mut = rt_mut
+    self.max_len = max_len
+    self.n_jobs = n_jobs
+    self.exe_name = 'GP'
+
+  def _write_data(self, filename, X, y):
+    """writes data in the layout read by read_input_data in GP.h: the number
+    of variables, the number of rows, then one tab-separated row per line."""
+    data = np.column_stack((X, y))
+    with open(filename, 'w') as f:
+      f.write('{}\n{}\n'.format(X.shape[1], X.shape[0]))
+      np.savetxt(f, data, delimiter='\t', fmt='%.17g')
+
+  def fit(self, X_train, y_train, sample_weight=None):
+    X_train = np.asarray(X_train, dtype=float)
+    y_train = np.asarray(y_train, dtype=float).ravel()
+
+    with tempfile.TemporaryDirectory(prefix='gsgp_') as tmpdir:
+      name = os.path.join(tmpdir, 'run')
+      with open(name+'-configuration.ini', 'w') as f:
+        f.write(CONFIG_TEMPLATE.format(self.popsize, self.g, self.rt_cross,
+                                       self.rt_mut, self.max_len))
+      self._write_data(name+'_train', X_train, y_train)
+      # GP requires a test set during training. It only reports the test
+      # fitness of the best individual, so a single training row is enough.
+      self._write_data(name+'_test', X_train[:1], y_train[:1])
+
+      cmd = [os.path.join(this_dir, self.exe_name),
+             '-train_file', name+'_train',
+             '-test_file', name+'_test',
+             '-name', name]
+      print('cmd:', ' '.join(cmd))
+      subprocess.run(cmd, check=True, cwd=tmpdir)
+
+      with open(name+'-individuals.txt', 'r') as f:
+        self.individuals_ = [line.split() for line in f if line.strip()]
+      self.trace_ = _read_trace(name+'-trace.txt')
+
+    self.n_features_in_ = X_train.shape[1]
+    return self
+
+  def _eval_individual(self, i, X, cache):
+    """evaluates individual i of the initial population (or random tree)."""
+    if i not in cache:
+      tree, _ = _parse_tree(self.individuals_[i])
+      cache[i] = _eval_tree(tree, X)
+    return cache[i]
+
+  def predict(self, X_test):
+    """replays the trace of the best individual on X_test, following
+    evaluate_unseen_new_data in GP.h."""
+    X_test = np.asarray(X_test, dtype=float)
+    cache = {}
+    ev = lambda i: self._eval_individual(int(i), X_test, cache)
+
+    prev = None
+    best = 0
+    for generation in self.trace_:
+      current = {}
+      for p1, p2, number, event, ind, mut_step in generation:
+        ind = int(ind)
+        # parents come from the initial population in the first generation
+        # and from the previous generation afterwards
+        parent = ev if prev is None else (lambda i: prev[int(i)])
+        if event == 0:
+          sig = _sigmoid(ev(number))
+          current[ind] = parent(p1)*sig + parent(p2)*(1 - sig)
+        elif event == 1:
+          current[ind] = (parent(number)
+                          + mut_step*(_sigmoid(ev(p1)) - _sigmoid(ev(p2))))
+        elif event == -1 or prev is None:
+          current[ind] = parent(p1)
+        else:
+          current[ind] = prev[ind]
+        best = ind
+      prev = current
+
+    return prev[best]
@@ -2,6 +2,7 @@ import numpy as np
 from sklearn.metrics import accuracy_score, mean_squared_error, mean_absolute_error
 import sympy as sp
 from sympy.parsing.sympy_parser import parse_expr
+from .expressions import round_floats, normalize_model_str
 try:
     from sklearn.metrics import mean_absolute_percentage_error
 except ImportError:
@@ -42,22 +43,12 @@ Utilities
 """
 
 
-def round_floats(ex1):
-    ex2 = ex1
-    for a in sp.preorder_traversal(ex1):
-        if isinstance(a, sp.Float):
-            if abs(a) < 0.0001:
-                ex2 = ex2.subs(a, sp.Integer(0))
-            else:
-                ex2 = ex2.subs(a, round(a, 3))
-    return ex2
-
-
-
-def get_symbolic_model(pred_model, local_dict):
+def get_symbolic_model(pred_model, local_dict, simplify=True):
     # TODO: update namespace for exact_formula runs
     sp_model = sp.parse_expr(pred_model, local_dict=local_dict)
     sp_model = round_floats(sp_model)
+    if not simplify:
+        return sp_model
 
     signal.signal(signal.SIGALRM, alarm_handler)
     signal.alarm(MAXTIME) # maximum time, defined above
@@ -66,30 +57,67 @@ def get_symbolic_model(pred_model, local_dict):
     except Exception as e:
         print('Warning: simplify failed. Msg:',e)
         pass
+    finally:
+        signal.alarm(0)
     return sp_model
 
-def simplicity(pred_model, feature_names):
+# cheap canonical forms tried before falling back to a full sp.simplify
+CANONICALIZATIONS = [sp.expand, sp.together, sp.powsimp]
+# maximum time for all of them: expand blows up on nested powers and products
+CANONICALIZE_MAXTIME = 10
+
+def num_components(sp_model):
+    return sum(1 for _ in sp.preorder_traversal(sp_model))
+
+def simplicity_score(n_components):
+    """simplicity as per judging criteria: -round(log_5(components), 1)"""
+    return -np.round(np.log(n_components)/np.log(5), 1)
+
+def simplicity(pred_model, feature_names, full_simplify=False):
+    """Simplicity of a model string, computed in tiers.
+
+    1. the number of components of the parsed, rounded model;
+    2. the smallest number of components after the cheap canonicalizations
+       in CANONICALIZATIONS, within a CANONICALIZE_MAXTIME second alarm
+       (after which the smallest count so far is kept);
+    3. if full_simplify, the number of components after sp.simplify (with a
+       MAXTIME second alarm), which can be much slower and is best run
+       deferred, after the results of a run are saved.
+    """
     local_dict = {f:sp.Symbol(f) for f in feature_names} 
-    sp_model = get_symbolic_model(pred_model, local_dict)
-    # compute num. components
-    num_components = 0
-    for _ in sp.preorder_traversal(sp_model):
-        num_components += 1
-    # compute simplicity as per juding criteria
-    simplicity = -np.round(np.log(num_components)/np.log(5), 1)
-    return simplicity
+    sp_model = get_symbolic_model(pred_model, local_dict, simplify=False)
+    n = num_components(sp_model)
+
+    signal.signal(signal.SIGALRM, alarm_handler)
+    signal.alarm(CANONICALIZE_MAXTIME)
+    try:
+        for canonicalize in CANONICALIZATIONS:
+            try:
+                n = min(n, num_components(canonicalize(sp_model)))
+            except SimplifyTimeOutException:
+                raise
+            except Exception as e:
+                print('Warning:',canonicalize.__name__,'failed. Msg:',e)
+    except SimplifyTimeOutException:
+        print('Warning: canonicalizations timed out')
+    finally:
+        signal.alarm(0)
+
+    if full_simplify:
+        sp_model = get_symbolic_model(pred_model, local_dict)
+        n = min(n, num_components(sp_model))
+
+    return simplicity_score(n)
 
 
-def _equation_predictions_sympy(model_str, feature_names, X):
+def _equation_predictions_sympy(model_str, feature_names, X, est_name=""):
     """Evaluate a symbolic expression string on X using sympy. Returns 1d array or None."""
-    if not isinstance(model_str, str) or not model_str or not feature_names:
+    if not isinstance(model_str, str) or not model_str or len(feature_names) == 0:
         return None
-    # Normalize: 1-based first (x1,X1 -> first feature for ENB), then 0-based (x0,x1 -> feature names)
-    s = model_str.strip()
-    for i, f in enumerate(feature_names):
-        s = s.replace("x" + str(i + 1), f).replace("X" + str(i + 1), f)
-    for i, f in enumerate(feature_names):
-        s = s.replace("x" + str(i), f).replace("X" + str(i), f)
+    feature_names = [str(f) for f in feature_names]
+    # Normalize variable names (x1, X_1, x[:,1] -> feature names) and operator
+    # aliases, following the naming dialect of est_name
+    s = normalize_model_str(model_str, feature_names, est_name)
     def _sub_sym(a, b):
         return sp.Add(a, -b)
     def _div_sym(a, b):
@@ -101,6 +129,7 @@ def _equation_predictions_sympy(model_str, feature_names, X):
         "sqrt": sp.sqrt, "abs": sp.Abs, "neg": lambda x: -x,
         "inv": lambda x: 1 / x, "square": lambda x: x**2,
         "cube": lambda x: x**3, "quart": lambda x: x**4,
+        "PLOG": sp.log, "PLOG10": lambda x: sp.log(x, 10), "PSQRT": sp.sqrt,
     })
     try:
         expr = parse_expr(s, local_dict=local_dict)
@@ -125,6 +154,9 @@ def _equation_predictions_sympy(model_str, feature_names, X):
     try:
         y_pred = func(*[X_arr[:, j] for j in range(len(feature_names))])
         y_pred = np.asarray(y_pred, dtype=np.float64).flatten()
+        if y_pred.shape[0] == 1:
+            # constant models lambdify to a scalar
+            y_pred = np.full(X_arr.shape[0], y_pred[0])
         if y_pred.shape[0] != X_arr.shape[0]:
             return None
         return y_pred
@@ -144,7 +176,7 @@ def equation_predictions(model_str, feature_names, X, est=None, est_name=""):
             return np.asarray(y).flatten()
         except Exception:
             pass
-    return _equation_predictions_sympy(model_str, feature_names, X)
+    return _equation_predictions_sympy(model_str, feature_names, X, est_name)
 
 
 def equation_metrics(y_true, y_pred):
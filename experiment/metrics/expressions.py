@@ -0,0 +1,117 @@
+"""
+Normalization of sympy expressions, shared by symbolic_utils,
+metrics.evaluation and the EQL method.
+"""
+import importlib.util
+import os
+import re
+import sympy as sp
+
+# the single-pass round_floats lives in the EQL package (which cannot
+# depend on experiment/); it only needs sympy, so it is loaded from its file
+# rather than by importing eql, which needs jax
+_spec = importlib.util.spec_from_file_location(
+    'eql_expressions', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..', 'algorithms',
+        'eql', 'eql', 'expressions.py'))
+_eql_expressions = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_eql_expressions)
+round_floats = _eql_expressions.round_floats
+
+
+"""
+Model string normalization
+"""
+
+# how each algorithm names its variables. Algorithms not listed index
+# features from 0 (x0, x_0, X0, x[:,0], ...).
+DIALECTS = {
+    'mrgp': dict(index_base=1),
+    'operon': dict(index_base=1),
+    'dsr': dict(index_base=1),
+}
+
+# operator and constant aliases used by the different algorithms, mapped to
+# the names understood when parsing the model with sympy.
+ALIASES = {
+    # GP-GOMEA
+    'plog': 'PLOG',
+    'aq': '/',
+    # MRGP
+    'mylog': 'PLOG',
+    # ITEA
+    'sqrtAbs': 'PSQRT',
+    # ellyn & FEAT
+    'log': 'PLOG',
+    'log10': 'PLOG10',
+    'sqrt': 'PSQRT',
+    # AIFeynman
+    'pi': '3.1415926535',
+}
+
+_TOKEN = re.compile(r'''
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<indexed>[xX]\[\s*(?::\s*,\s*)?(?P<index>\d+)\s*\])   # x[:,i], x[i]
+  | (?P<numpy>np\.)
+  | (?P<pdiv>p/)                                             # GP-GOMEA
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<power>\^)
+  | (?P<drop>[|\[\]])                                       # ellyn, FEAT, BSR
+''', re.VERBOSE)
+
+_VARIABLE = re.compile(r'[xX]_?(\d+)')
+
+
+def get_dialect(est_name):
+    """return the naming dialect of the algorithm called est_name."""
+    dialect = dict(index_base=0)
+    for k, v in DIALECTS.items():
+        if k in est_name.lower():
+            dialect.update(v)
+    return dialect
+
+
+def normalize_model_str(model_str, feature_names, est_name='',
+                        aliases=ALIASES):
+    """Rewrite a model string into a sympy-parsable one in a single scan.
+
+    Variables named by index (x1, x_1, X1, X_1, x[:,1], x[1]) are renamed to
+    the matching entry of feature_names, following the index base of the
+    algorithm's dialect; names that already are feature names are kept.
+    Operator aliases are mapped through `aliases`, `^` becomes `**`, and the
+    `np.` prefix, `|` and square brackets are removed.
+
+    Each token is rewritten at most once, so feature and operator names can
+    not be mangled by later replacements (e.g. x1 inside x10).
+    """
+    features = [str(f) for f in feature_names]
+    feature_set = set(features)
+    base = get_dialect(est_name)['index_base']
+
+    def variable(i):
+        i = int(i) - base
+        if 0 <= i < len(features):
+            return features[i]
+        return None
+
+    def rewrite(m):
+        kind = m.lastgroup
+        tok = m.group(0)
+        if kind == 'name':
+            if tok in feature_set:
+                return tok
+            var = _VARIABLE.fullmatch(tok)
+            if var is not None:
+                return variable(var.group(1)) or tok
+            return aliases.get(tok, tok)
+        if kind == 'indexed':
+            return variable(m.group('index')) or tok
+        if kind == 'pdiv':
+            return '/'
+        if kind == 'power':
+            return '**'
+        if kind in ('numpy', 'drop'):
+            return ''
+        return tok
+
+    return _TOKEN.sub(rewrite, model_str.strip())
@@ -78,4 +78,48 @@ def test_simplicity_comparator():
     big =  '2.35*( 0.4 * x1 * x2 - 1.5 * x1 + 2.5 * x2 + 1 + log(30 * x3**2))'
     small =   '2.35*( 0.4 * x1 * x2 - 1.5 * x1 )'
     features = ['x1','x2','x3','x4','x5']
-    assert simplicity(big, features) < simplicity(small, features) 
\ No newline at end of file
+    assert simplicity(big, features) < simplicity(small, features) 
+
+def test_simplicity_tiers():
+    """Cheap canonicalizations never score worse than the raw node count,
+    and the full simplify never scores worse than the cheap tiers"""
+
+    model = '(x1**2 - x2**2)/(x1 - x2) + x1*x1'
+    features = ['x1','x2']
+    raw = simplicity_score(num_components(sp.sympify(model)))
+    cheap = simplicity(model, features)
+    full = simplicity(model, features, full_simplify=True)
+    assert raw <= cheap <= full
+
+def test_simplicity_timeout(monkeypatch):
+    """Canonicalizations that overrun their alarm fall back to the raw count"""
+
+    import metrics.evaluation as evaluation
+    monkeypatch.setattr(evaluation, 'CANONICALIZE_MAXTIME', 1)
+    model = '((x1 + x2 + x3)**12*(x1 - x2 + 1)**10)**2*(x3 + x1)**9'
+    features = ['x1','x2','x3']
+    raw = simplicity_score(num_components(sp.sympify(model)))
+    assert evaluation.simplicity(model, features) == raw
+
+def test_round_floats():
+    """Constants are rounded and near-zero constants dropped in one pass"""
+
+    x1, x2 = sp.symbols('x1 x2')
+    expr = 1.23456*x1 + 0.00001*x2 + 2.71828*sp.exp(0.5*x1)
+    rounded = round_floats(expr)
+    assert str(rounded) == '1.235*x1 + 2.718*exp(0.5*x1)'
+    assert round_floats(sp.Float(0.00001)*x2, digits=6, zero_tol=None) != 0
+
+def test_normalize_model_str():
+    """Variables and operators are renamed once, without mangling names"""
+
+    features = ['X{}'.format(i) for i in range(1, 12)]
+    # DSR indexes features from 1; x1 must not be replaced inside x10
+    assert (normalize_model_str('x1 + x10*x11 - log(x2)^2', features, 'DSR')
+            == 'X1 + X10*X11 - PLOG(X2)**2')
+    # 0-based naming schemes, and names that already are features
+    assert (normalize_model_str('x0 + X_10 + x[:,2] + np.sqrt(|X1|)', features)
+            == 'X1 + X11 + X3 + PSQRT(X1)')
+    # operator aliases are not replaced inside feature names
+    assert (normalize_model_str('mylog(x0) + pi*x1', ['plog_pi', 'sqrt_x'])
+            == 'PLOG(plog_pi) + 3.1415926535*sqrt_x')
@@ -0,0 +1,107 @@
+"""
+Packing short benchmark jobs into shared allocations.
+
+Runs that finish in seconds (test runs, small datasets, linear baselines)
+spend most of their time waiting in the scheduler's queue if each gets its
+own job. analyze.py -pack predicts the runtime of every job from the cost
+model of budget.py and packs the short ones into manifests; jobs of methods
+without a cost model are not packed. Each manifest
+is run as one scheduler job, by a local pool of workers:
+
+    python packing.py MANIFEST -n_jobs 8 -index RESULTS_DIR/index.jsonl
+
+Each finished command appends its status (return code, duration, peak
+memory, pack; see ledger.py) to the results index, a json lines file.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from budget import predicted_time, TRAIN_SIZE
+from read_file import read_shape
+import ledger
+
+# runtime assumed for every job in test mode (s)
+TEST_RUNTIME = 60
+
+
+def predicted_runtime(ml, dataset, cost_model=None, test=False):
+    """predicted wall clock time of evaluating ml on dataset, in seconds,
+    from the cost model. Without a cost model for ml the runtime is unknown:
+    this returns None, and the job is left unpacked."""
+    if test:
+        return TEST_RUNTIME
+    if not cost_model or ml not in cost_model:
+        return None
+    n_samples, n_features = read_shape(dataset)
+    n_train = int(TRAIN_SIZE*n_samples)
+    return predicted_time(ml, n_train, n_features, cost_model)
+
+
+def pack_jobs(runtimes, capacity):
+    """first fit decreasing: groups the jobs (indices of runtimes) into packs
+    whose total runtime is at most capacity."""
+    packs, loads = [], []
+    for i in sorted(range(len(runtimes)), key=lambda i: -runtimes[i]):
+        for k, load in enumerate(loads):
+            if load + runtimes[i] <= capacity:
+                packs[k].append(i)
+                loads[k] += runtimes[i]
+                break
+        else:
+            packs.append([i])
+            loads.append(runtimes[i])
+    return packs, loads
+
+
+def run_command(cmd, index_file=None, pack=None):
+    return ledger.run_command(cmd, index_file, pack=pack)
+
+
+def run_pack(manifest, n_jobs=1, index_file=None):
+    """runs the commands of a manifest with n_jobs workers. Returns their
+    statuses."""
+    with open(manifest, 'r') as f:
+        commands = [line.rstrip('\n') for line in f if line.strip()]
+    pack = os.path.basename(manifest)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        statuses = list(pool.map(
+            lambda cmd: run_command(cmd, index_file, pack), commands))
+    failed = sum(s['returncode'] != 0 for s in statuses)
+    print('pack',pack,'finished:',len(statuses)-failed,'succeeded,',
+          failed,'failed')
+    return statuses
+
+
+def seconds_to_time(seconds):
+    """formats seconds as the hr:min used for scheduler time limits."""
+    minutes = int(-(-seconds//60))
+    return '{}:{:02d}'.format(minutes//60, minutes % 60)
+
+
+def time_to_seconds(t):
+    """the seconds of a hr:min scheduler time limit."""
+    hours, minutes = t.split(':')
+    return 60*(60*int(hours) + int(minutes))
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run a pack of jobs with a local pool of workers.",
+        add_help=False)
+    parser.add_argument('MANIFEST', type=str,
+                        help='File with one command per line')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-n_jobs', action='store', type=int, default=1,
+                        help='number of workers')
+    parser.add_argument('-index', action='store', type=str, default=None,
+                        help='Results index the job statuses are added to')
+    args = parser.parse_args()
+
+    statuses = run_pack(args.MANIFEST, args.n_jobs, args.index)
+    if any(s['returncode'] != 0 for s in statuses):
+        exit(1)
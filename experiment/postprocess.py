@@ -0,0 +1,207 @@
+"""
+Deferred symbolic post-processing of evaluate_model results.
+
+With `evaluate_model(..., spool_dir=...)` the fitting job only saves the
+results that need the fitted estimator (the symbolic model string and the
+scores of est.predict) and leaves the single-threaded sympy work (equation
+predictions and simplicity) to a task in a spool directory. Any number of
+cheap workers can drain the spool later:
+
+    python postprocess.py SPOOL_DIR -n_jobs 4
+
+Each task is a pair of files in the spool directory: <name>.npz with the
+data and raw predictions, and <name>.json with the rest. A worker claims a
+task by renaming <name>.json to <name>.running, which is atomic, so several
+workers can share a spool. Finished tasks are renamed to <name>.done (and
+their data removed); tasks that raise are kept as <name>.failed.
+
+Tasks of `enqueue_full_simplicity` have no data: they only add the
+simplicity after a full sp.simplify to results that were otherwise
+analyzed by the fitting job.
+"""
+import json
+import os
+import traceback
+import numpy as np
+from glob import glob
+from joblib import Parallel, delayed
+from utils import jsonify, PhaseTimer
+from metrics.evaluation import simplicity, equation_predictions, equation_metrics
+
+EQUATION_KEYS = ['equation_'+fold+'_'+m
+                 for fold in ['train','test']
+                 for m in ['mse','mae','rmse','mape']]
+
+
+def symbolic_analysis(results, feature_names, X_train, X_test,
+                      train_target, test_target, est=None, est_name='',
+                      y_eq_train=None, y_eq_test=None, full_simplify=False):
+    """adds the equation-on-data metrics and simplicity of
+    results['symbolic_model'] to results.
+
+    y_eq_train and y_eq_test are equation predictions computed beforehand
+    (e.g. with est, before it was discarded); they are computed from the
+    model string when not given.
+    """
+    # Equation-on-test metrics (same as @codes: evaluate learned equation on
+    # test/train data). Uses correct target space: log(y) for agric, raw for
+    # enb
+    for key in EQUATION_KEYS:
+        results[key] = None
+    try:
+        if y_eq_train is None:
+            y_eq_train = equation_predictions(results['symbolic_model'],
+                                              feature_names, X_train,
+                                              est=est, est_name=est_name)
+        if y_eq_test is None:
+            y_eq_test = equation_predictions(results['symbolic_model'],
+                                             feature_names, X_test,
+                                             est=est, est_name=est_name)
+        for fold, target, y_eq in [['train', train_target, y_eq_train],
+                                   ['test', test_target, y_eq_test]]:
+            if y_eq is None:
+                continue
+            m = equation_metrics(target, y_eq)
+            if m:
+                for k, v in m.items():
+                    results[k.replace('equation_', 'equation_'+fold+'_')] = v
+    except Exception as e:
+        print('Warning: equation-on-test metrics failed:', e)
+
+    # simplicity. The full sp.simplify is slow, so it is only run when asked.
+    results['simplicity'] = simplicity(results['symbolic_model'],
+                                       feature_names)
+    if full_simplify:
+        results['simplicity_full'] = simplicity(results['symbolic_model'],
+                                                feature_names,
+                                                full_simplify=True)
+    return results
+
+
+def enqueue(spool_dir, save_file, feature_names, est_name, X_train, X_test,
+            train_target, test_target, y_pred_train=None, y_pred_test=None,
+            y_eq_train=None, y_eq_test=None, full_simplify=False):
+    """writes a post-processing task for the results in save_file to
+    spool_dir and returns the path of the task."""
+    os.makedirs(spool_dir, exist_ok=True)
+    name = os.path.join(spool_dir,
+                        os.path.splitext(os.path.basename(save_file))[0])
+    arrays = dict(X_train=X_train, X_test=X_test,
+                  train_target=train_target, test_target=test_target,
+                  y_pred_train=y_pred_train, y_pred_test=y_pred_test,
+                  y_eq_train=y_eq_train, y_eq_test=y_eq_test)
+    np.savez_compressed(name + '.npz',
+                        **{k:np.asarray(v, dtype=float)
+                           for k,v in arrays.items() if v is not None})
+    task = dict(save_file=os.path.abspath(save_file),
+                feature_names=[str(f) for f in feature_names],
+                est_name=est_name,
+                full_simplify=full_simplify)
+    return _write_task(name, task)
+
+
+def enqueue_full_simplicity(spool_dir, save_file, feature_names):
+    """writes a task that adds the simplicity after a full sp.simplify to the
+    results in save_file, and returns the path of the task."""
+    os.makedirs(spool_dir, exist_ok=True)
+    name = os.path.join(spool_dir,
+                        os.path.splitext(os.path.basename(save_file))[0])
+    task = dict(save_file=os.path.abspath(save_file),
+                feature_names=[str(f) for f in feature_names],
+                simplicity_only=True)
+    return _write_task(name, task)
+
+
+def _write_task(name, task):
+    # the task only becomes visible to workers once it is complete
+    with open(name + '.tmp', 'w') as out:
+        json.dump(task, out, indent=4)
+    os.replace(name + '.tmp', name + '.json')
+    print('queued post-processing task',name + '.json')
+    return name + '.json'
+
+
+def process(task_file):
+    """claims and runs one task. Returns False if another worker claimed it
+    first."""
+    name = os.path.splitext(task_file)[0]
+    try:
+        os.rename(task_file, name + '.running')
+    except FileNotFoundError:
+        return False
+
+    try:
+        with open(name + '.running', 'r') as f:
+            task = json.load(f)
+        with open(task['save_file'], 'r') as f:
+            results = json.load(f)
+        timer = PhaseTimer()
+        if task.get('simplicity_only'):
+            timer.start('full_simplify')
+            results['simplicity_full'] = simplicity(results['symbolic_model'],
+                                                    task['feature_names'],
+                                                    full_simplify=True)
+        else:
+            data = np.load(name + '.npz')
+            get = lambda k: data[k] if k in data.files else None
+            timer.start('symbolic_analysis')
+            symbolic_analysis(results, task['feature_names'],
+                              get('X_train'), get('X_test'),
+                              get('train_target'), get('test_target'),
+                              est_name=task['est_name'],
+                              y_eq_train=get('y_eq_train'),
+                              y_eq_test=get('y_eq_test'),
+                              full_simplify=task['full_simplify'])
+        timer.stop()
+        results.setdefault('timings', {}).update(timer.timings)
+        results.pop('analysis', None)
+        with open(task['save_file'] + '.tmp', 'w') as out:
+            json.dump(jsonify(results), out, indent=4)
+        os.replace(task['save_file'] + '.tmp', task['save_file'])
+    except Exception:
+        traceback.print_exc()
+        os.rename(name + '.running', name + '.failed')
+        return False
+
+    if os.path.exists(name + '.npz'):
+        os.remove(name + '.npz')
+    os.rename(name + '.running', name + '.done')
+    print('post-processed',task['save_file'])
+    return True
+
+
+def drain(spool_dir, n_jobs=1):
+    """runs all pending tasks in spool_dir with n_jobs workers. Returns the
+    number of tasks completed."""
+    tasks = sorted(glob(os.path.join(spool_dir, '*.json')))
+    print(len(tasks),'tasks pending in',spool_dir)
+    done = Parallel(n_jobs=n_jobs)(delayed(process)(t) for t in tasks)
+    return sum(done)
+
+
+################################################################################
+# main entry point
+################################################################################
+import argparse
+import time
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run deferred symbolic post-processing tasks.",
+        add_help=False)
+    parser.add_argument('SPOOL_DIR', type=str,
+                        help='Spool directory written by evaluate_model')
+    parser.add_argument('-h', '--help', action='help',
+                        help='Show this help message and exit.')
+    parser.add_argument('-n_jobs', action='store', type=int, default=1,
+                        help='number of workers')
+    parser.add_argument('-poll', action='store', type=int, default=0,
+                        help='If > 0, keep watching the spool directory, '
+                        'checking for new tasks every POLL seconds')
+    args = parser.parse_args()
+
+    while True:
+        drain(args.SPOOL_DIR, args.n_jobs)
+        if args.poll <= 0:
+            break
+        time.sleep(args.poll)
@@ -1,9 +1,74 @@
+import gzip
+import io
+import os
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder
+import bgzf
+
+def _clean_name(name):
+    return name.strip().replace('.','_')
+
+
+def _csv_source(filename, compression):
+    """What pandas reads for filename: BGZF files (see bgzf.py) are
+    decompressed here, with their blocks in parallel."""
+    if compression == 'gzip' and bgzf.is_bgzf(filename):
+        return io.BytesIO(bgzf.decompress(filename)), None
+    return filename, compression
+
+
+def _sidecar(filename, label='target', sep=None):
+    """Return the binary copy of a dataset, <name>.npy next to <name>.tsv.gz
+    (see data/csv_to_tsvgz_agric.py), if there is an up-to-date one with
+    the columns of the dataset, whose label is the last. It holds the
+    features and then the label, as float64."""
+    if not filename.endswith('.tsv.gz'):
+        return None
+    sidecar = filename[:-len('.tsv.gz')] + '.npy'
+    if (not os.path.exists(sidecar)
+        or os.path.getmtime(sidecar) < os.path.getmtime(filename)):
+        return None
+    columns = _read_head(filename, sep)[0]
+    if (columns[-1] != label
+        or np.load(sidecar, mmap_mode='r').shape[1:] != (len(columns),)):
+        return None
+    return sidecar
+
+
+def _sidecar_target(filename, y, sep=None):
+    """y of a sidecar with the dtype read_file gives the label: integers if
+    they are written as such in the dataset. None if they are not integers
+    in the sidecar."""
+    if not _is_int(_read_head(filename, sep)[1][-1]):
+        return y
+    if not np.array_equal(y, np.round(y)):
+        return None
+    return y.astype(np.int64)
+
+
+def _is_int(text):
+    try:
+        int(text)
+        return True
+    except ValueError:
+        return False
+
 
 def read_file(filename, label='target', use_dataframe=True, sep=None):
     
+    sidecar = _sidecar(filename, label, sep)
+    if sidecar is not None:
+        data = np.load(sidecar)
+        y = _sidecar_target(filename, data[:, -1], sep)
+        if y is not None:
+            feature_names = read_feature_names(filename, label, sep)
+            X = data[:, :-1]
+            if use_dataframe:
+                X = pd.DataFrame(X, columns=feature_names)
+            return X, y, feature_names
+
     if filename.endswith('gz'):
         compression = 'gzip'
     else:
@@ -30,10 +95,11 @@ def read_file(filename, label='target', use_dataframe=True, sep=None):
             else:
                 sep = None  # Let pandas auto-detect
 
-    input_data = pd.read_csv(filename, sep=sep, compression=compression)
+    source, compression = _csv_source(filename, compression)
+    input_data = pd.read_csv(source, sep=sep, compression=compression)
      
     # clean up column names
-    clean_names = {k:k.strip().replace('.','_') for k in input_data.columns}
+    clean_names = {k:_clean_name(k) for k in input_data.columns}
     input_data = input_data.rename(columns=clean_names)
 
     feature_names = [x for x in input_data.columns.values if x != label]
@@ -49,3 +115,122 @@ def read_file(filename, label='target', use_dataframe=True, sep=None):
     return X, y, feature_names
 
 
+
+@lru_cache(maxsize=None)
+def _read_head(filename, sep):
+    """the (cleaned) column names and the first row of a dataset."""
+    if filename.endswith('gz'):
+        f = gzip.open(filename, 'rt')
+    else:
+        f = open(filename, 'r')
+    with f:
+        first_line = f.readline().rstrip('\r\n')
+        second_line = f.readline().rstrip('\r\n')
+
+    if sep is None:
+        sep = '\t' if ('tsv' in filename.lower() or '\t' in first_line) else ','
+    columns = tuple(_clean_name(c) for c in first_line.split(sep))
+    return columns, tuple(second_line.split(sep))
+
+def _read_header(filename, label, sep):
+    return tuple(c for c in _read_head(filename, sep)[0] if c != label)
+
+def read_feature_names(filename, label='target', sep=None):
+    """Return the feature names of a dataset, as read_file does, by reading
+    only its header line. Results are cached per file."""
+    return np.array(_read_header(filename, label, sep))
+
+# blocks of a BGZF dataset that read_shape reads
+SHAPE_BLOCKS = 8
+
+@lru_cache(maxsize=None)
+def read_shape(filename, label='target', sep=None):
+    """Return (n_samples, n_features) of a dataset without parsing it.
+    n_samples is the number of rows of its sidecar if it has one; for
+    indexed BGZF datasets, it is estimated from their size and the lines of
+    a few of their blocks; other datasets have their lines counted. Results are
+    cached per file."""
+    n_features = len(_read_header(filename, label, sep))
+    sidecar = _sidecar(filename, label, sep)
+    if sidecar is not None:
+        return np.load(sidecar, mmap_mode='r').shape[0], n_features
+    if (filename.endswith('gz') and os.path.exists(filename + '.gzi')
+        and bgzf.is_bgzf(filename)):
+        size = bgzf.uncompressed_size(filename)
+        head = bgzf.read_range(filename, 0, bgzf.MAX_BLOCK)
+        if len(head) < size:
+            # the header, then lines as long as those of SHAPE_BLOCKS blocks
+            # spread over the file
+            header_size = head.index(b'\n') + 1
+            n_bytes = n_lines = 0
+            for k in range(SHAPE_BLOCKS):
+                block = bgzf.read_range(
+                    filename, header_size + k*(size - header_size)
+                    // SHAPE_BLOCKS, bgzf.MAX_BLOCK)
+                first, last = block.find(b'\n'), block.rfind(b'\n')
+                n_bytes += last - first
+                n_lines += block.count(b'\n', first + 1, last + 1)
+            if n_lines:
+                return (int(round((size - header_size)*n_lines/n_bytes)),
+                        n_features)
+        else:
+            n_lines = sum(1 for line in head.splitlines() if line.strip())
+            return n_lines - 1, n_features
+    opener = gzip.open if filename.endswith('gz') else open
+    with opener(filename, 'rb') as f:
+        n_lines = sum(1 for line in f if line.strip())
+    return n_lines - 1, n_features
+
+
+def read_target(filename, label='target', sep=None):
+    """Return the label column of a dataset, as read_file does, without
+    parsing the features."""
+    sidecar = _sidecar(filename, label, sep)
+    if sidecar is not None:
+        y = _sidecar_target(
+            filename, np.array(np.load(sidecar, mmap_mode='r')[:, -1]), sep)
+        if y is not None:
+            return y
+    if sep is None:
+        sep = '\t' if 'tsv' in filename.lower() else None
+    compression = 'gzip' if filename.endswith('gz') else None
+    source, compression = _csv_source(filename, compression)
+    return pd.read_csv(source, sep=sep, compression=compression,
+                       usecols=[label])[label].values
+
+# targets of the multi-target problems, which are split into one dataset
+# per target named <prefix>_<target> (see data/csv_to_tsvgz_*.py)
+MULTI_TARGETS = {
+    'agric': ['sustainability', 'consumer_trend'],
+    'enb': ['heating', 'cooling'],
+}
+
+def multi_target_siblings(filename):
+    """Return the datasets of all targets of the multi-target problem that
+    filename belongs to (filename first), or [filename] for other datasets.
+    Only siblings that exist are returned."""
+    dirname, basename = os.path.split(filename)
+    name = basename.split('.')[0]
+    ext = basename[len(name):]
+    for group, targets in MULTI_TARGETS.items():
+        if not name.startswith(group):
+            continue
+        for target in targets:
+            if not name.endswith('_' + target):
+                continue
+            prefix = name[:-len(target)]
+            siblings = [filename]
+            for other in targets:
+                if other == target:
+                    continue
+                sibling = prefix + other
+                if os.path.basename(dirname) == name:
+                    # datasets live in a directory named after them
+                    path = os.path.join(os.path.dirname(dirname), sibling,
+                                        sibling + ext)
+                else:
+                    path = os.path.join(dirname, sibling + ext)
+                if os.path.exists(path):
+                    siblings.append(path)
+            return siblings
+    return [filename]
@@ -0,0 +1,128 @@
+"""
+SLURM job arrays for analyze.py.
+
+Instead of one sbatch call per job, the commands are written to a manifest
+file (one command per line) and submitted as a single job array. Each array
+task runs the line of the manifest given by its SLURM_ARRAY_TASK_ID, and at
+most `throttle` tasks run at once. Arrays longer than `max_array_size` (the
+cluster's MaxArraySize) are split over several manifests.
+
+The sbatch and squeue executables are looked up on the PATH, so tests can
+put stand-ins in front of them.
+"""
+import os
+import re
+import shlex
+import subprocess
+import time
+
+BATCH_HEADER = """#!/usr/bin/bash
+#SBATCH -o {OUT_FILE}
+#SBATCH --error={ERR_FILE}
+#SBATCH -N 1
+#SBATCH -n {N_CORES}
+#SBATCH -J {JOB_NAME}
+#SBATCH -A {A} -p {QUEUE}
+#SBATCH --ntasks-per-node=1 --time={TIME}:00
+#SBATCH --mem-per-cpu={M}
+"""
+
+# environment setup of the jobs, run before their command
+SETUP = 'conda info\nsource plg_modules.sh'
+
+ARRAY_SCRIPT = BATCH_HEADER + """#SBATCH --array=1-{N_TASKS}%{THROTTLE}
+
+{SETUP}
+
+cmd=$(sed -n "${{SLURM_ARRAY_TASK_ID}}p" {MANIFEST})
+echo "task $SLURM_ARRAY_TASK_ID: $cmd"
+eval "$cmd"
+"""
+
+
+def squeue_job_names():
+    """names of the jobs currently in the queue."""
+    res = subprocess.run(['squeue', '-h', '-o', '%j'], check=True,
+                         capture_output=True, text=True)
+    return res.stdout.split('\n')
+
+
+def sbatch(script_file):
+    """submits script_file and returns the job id."""
+    res = subprocess.run(['sbatch', script_file], check=True,
+                         capture_output=True, text=True)
+    print(res.stdout.strip())
+    m = re.search(r'(\d+)', res.stdout)
+    return m.group(1) if m else None
+
+
+def queued_commands(manifest_dir, job_names):
+    """commands of the arrays in manifest_dir that are still queued or
+    running, i.e. whose job name is in job_names."""
+    commands = set()
+    for name in set(job_names):
+        manifest = os.path.join(manifest_dir, name + '.manifest')
+        if name and os.path.exists(manifest):
+            with open(manifest, 'r') as f:
+                commands.update(line.rstrip('\n') for line in f)
+    return commands
+
+
+def write_manifest(filename, commands):
+    with open(filename, 'w') as f:
+        for cmd in commands:
+            assert '\n' not in cmd
+            f.write(cmd + '\n')
+
+
+def new_stamp():
+    """a stamp unique per submission, so parallel submitters do not
+    collide."""
+    return time.strftime('%Y%m%d-%H%M%S') + '_' + str(os.getpid())
+
+
+def _array_name(job_name, stamp, k):
+    return '_'.join([job_name, stamp, str(k)])
+
+
+def array_err_file(manifest_dir, job_name, stamp, i, max_array_size=1000):
+    """the err file of the task running commands[i] of submit_array, with %J
+    standing for the id of its array."""
+    name = _array_name(job_name, stamp, i//max_array_size)
+    return os.path.join(os.path.abspath(manifest_dir), '{}.%J_{}.err'.format(
+        name, i % max_array_size + 1))
+
+
+def submit_array(commands, manifest_dir, job_name, throttle=100,
+                 max_array_size=1000, setup=SETUP, stamp=None,
+                 **batch_args):
+    """submits commands as SLURM job arrays, with at most throttle tasks
+    running at once, each after the environment setup lines. batch_args
+    fill in BATCH_HEADER (A, QUEUE, N_CORES, M, TIME). Each array is named
+    after its manifest (job_name, stamp and its number), so queued_commands
+    can find it. Returns the job ids of the arrays."""
+    os.makedirs(manifest_dir, exist_ok=True)
+    stamp = stamp or new_stamp()
+    job_ids = []
+    for start in range(0, len(commands), max_array_size):
+        chunk = commands[start:start+max_array_size]
+        name = _array_name(job_name, stamp, start//max_array_size)
+        manifest = os.path.abspath(os.path.join(manifest_dir,
+                                                name + '.manifest'))
+        write_manifest(manifest, chunk)
+        script_file = os.path.join(manifest_dir, name + '.sh')
+        out_file = os.path.join(os.path.abspath(manifest_dir),
+                                name + '.%A_%a.out')
+        with open(script_file, 'w') as f:
+            f.write(ARRAY_SCRIPT.format(
+                OUT_FILE=out_file,
+                ERR_FILE=out_file[:-4] + '.err',
+                JOB_NAME=name,
+                N_TASKS=len(chunk),
+                THROTTLE=throttle,
+                MANIFEST=shlex.quote(manifest),
+                SETUP=setup,
+                **batch_args))
+        print('submitting array of',len(chunk),'jobs from',manifest)
+        job_ids.append(sbatch(script_file))
+    return job_ids
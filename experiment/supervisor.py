@@ -0,0 +1,201 @@
+"""
+Fitting estimators under time and memory limits.
+
+`fit` interrupts est.fit with a SIGALRM, which only stops python bytecode on
+the main thread. Methods that fit in native threads (Operon, PySR/Julia) or
+in subprocesses (the DSO and AIFeynman bridges, GP-ZGD) can overrun it.
+`supervised_fit` runs `fit` in a forked child that leads its own process
+group, and kills the whole group once the time limit plus a grace period
+has passed, or once the group's resident memory exceeds its limit, so no
+job overruns its slot. Memory is watched rather than capped with
+RLIMIT_AS, which breaks methods that reserve large virtual address spaces
+(Julia for PySR, JAX for EQL). The fitted estimator is sent back pickled,
+or as its model string if it can not be pickled.
+"""
+import os
+import pickle
+import signal
+import tempfile
+import time
+import multiprocessing
+from sklearn.base import BaseEstimator, RegressorMixin
+from utils import ProgressSampler
+from metrics.evaluation import equation_predictions
+
+class TimeOutException(Exception):
+    pass
+
+class FitFailed(RuntimeError):
+    """a supervised fit that returned no estimator. Its status has the fit
+    time, why it was killed ('time' or 'memory', or None) and its exit
+    code."""
+    def __init__(self, status):
+        super().__init__('supervised fit '
+                         + ('was killed (' + status['killed'] + ')'
+                            if status['killed'] else
+                            'failed with exit code '
+                            + str(status['exitcode'])))
+        self.status = status
+
+# seconds between checks of the memory of a supervised fit
+MEMORY_POLL = 1
+
+def alarm_handler(signum, frame):
+    print(f"raising TimeOutException")
+    raise TimeOutException
+
+
+def fit(est, X, y, max_time, harvest=None, progress_file=None,
+        progress_interval=0):
+    """fits est, raising a TimeOutException in it after max_time seconds.
+
+    If the fit times out and `harvest` is given, harvest(est, X, y) recovers
+    the best model found so far. Returns a dict with the fit time and
+    whether the fit timed out and was harvested.
+    """
+    t0 = time.time()
+    signal.signal(signal.SIGALRM, alarm_handler)
+    signal.alarm(max_time)
+    try:
+        if progress_interval > 0:
+            with ProgressSampler(est, progress_file, progress_interval):
+                est.fit(X, y)
+        else:
+            est.fit(X, y)
+        timed_out = False
+    except TimeOutException:
+        print('WARNING: fitting timed out')
+        timed_out = True
+    finally:
+        # so the alarm can not go off while scoring
+        signal.alarm(0)
+    fit_time = time.time() - t0
+    print('Training time measure:', fit_time)
+
+    # recover the best model found before the timeout, if the method can
+    harvested = False
+    if timed_out and harvest:
+        try:
+            harvest(est, X, y)
+            harvested = True
+            print('harvested best-so-far model')
+        except Exception as e:
+            print('Warning: harvest failed. Msg:',e)
+
+    return dict(fit_time=fit_time, timed_out=timed_out, harvested=harvested)
+
+
+class SymbolicModel(BaseEstimator, RegressorMixin):
+    """stands in for a fitted estimator that could not be pickled, predicting
+    with its model string."""
+    def __init__(self, model_str, feature_names, est_name=''):
+        self.model_str = model_str
+        self.feature_names = feature_names
+        self.est_name = est_name
+
+    def predict(self, X):
+        y = equation_predictions(self.model_str, self.feature_names, X,
+                                 est_name=self.est_name)
+        if y is None:
+            raise ValueError('could not evaluate model ' + self.model_str)
+        return y
+
+
+def group_rss_mb(pgid):
+    """resident memory (MB) of the processes in process group pgid, from
+    /proc (0 where there is no /proc)."""
+    total = 0
+    try:
+        pids = [p for p in os.listdir('/proc') if p.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            with open('/proc/' + pid + '/stat') as f:
+                stat = f.read()
+            # the fields after the command name, which can hold spaces:
+            # state, ppid, pgrp, ...
+            if int(stat[stat.rindex(')') + 2:].split()[2]) != pgid:
+                continue
+            with open('/proc/' + pid + '/statm') as f:
+                total += int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            # the process ended while reading
+            continue
+    return total/1024**2
+
+
+def _supervised_child(est, X, y, max_time, out_file, model_str, fit_kwargs):
+    # lead a new process group, so the supervisor can kill every process
+    # the fit starts along with this one
+    os.setpgrp()
+
+    status = fit(est, X, y, max_time, **fit_kwargs)
+    try:
+        payload = pickle.dumps(dict(status, est=est))
+    except Exception as e:
+        print('Warning: could not pickle est (',e,'), returning its model')
+        payload = pickle.dumps(dict(status, model_str=model_str(est)))
+    with open(out_file + '.tmp', 'wb') as f:
+        f.write(payload)
+    os.replace(out_file + '.tmp', out_file)
+
+
+def supervised_fit(est, X, y, max_time, max_memory=0, grace=60,
+                   model_str=None, feature_names=None, est_name='',
+                   **fit_kwargs):
+    """runs fit(est, X, y, max_time, **fit_kwargs) in a child process.
+
+    The child leads its own process group. If it is still running
+    max_time + grace seconds after it started, or the resident memory of the
+    group exceeds max_memory MB (if > 0), the whole group is killed.
+    `model_str(est)` gives the model string of a fitted est, used to return
+    estimators that can not be pickled as a SymbolicModel over
+    feature_names.
+
+    Returns the fitted estimator and the status dict of fit. Raises
+    FitFailed if the child returns no estimator.
+    """
+    ctx = multiprocessing.get_context('fork')
+    t0 = time.time()
+    with tempfile.TemporaryDirectory(prefix='fit_') as tmpdir:
+        out_file = os.path.join(tmpdir, 'est.pkl')
+        proc = ctx.Process(target=_supervised_child,
+                           args=(est, X, y, max_time, out_file, model_str,
+                                 fit_kwargs))
+        proc.start()
+        deadline = t0 + max_time + grace
+        killed = None
+        while True:
+            proc.join(max(0, min(MEMORY_POLL, deadline - time.time())))
+            if not proc.is_alive():
+                break
+            if time.time() >= deadline:
+                killed = 'time'
+                print('WARNING: fit did not stop in time, killing it')
+                break
+            if max_memory > 0 and group_rss_mb(proc.pid) > max_memory:
+                killed = 'memory'
+                print('WARNING: fit exceeded',max_memory,'MB, killing it')
+                break
+        # also cleans up processes the fit left behind
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        proc.join()
+
+        if not os.path.exists(out_file):
+            raise FitFailed(dict(fit_time=time.time() - t0,
+                                 timed_out=killed == 'time',
+                                 harvested=False, killed=killed,
+                                 exitcode=proc.exitcode))
+        with open(out_file, 'rb') as f:
+            result = pickle.load(f)
+
+    if 'est' in result:
+        fitted = result.pop('est')
+    else:
+        fitted = SymbolicModel(result.pop('model_str'),
+                               [str(f) for f in feature_names], est_name)
+    return fitted, result
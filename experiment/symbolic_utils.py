@@ -5,7 +5,10 @@ import sympy
 # from sympy import *
 from sympy import Symbol, simplify, factor, Float, preorder_traversal, Integer
 from sympy.parsing.sympy_parser import parse_expr
-from read_file import read_file
+from read_file import read_feature_names
+from functools import lru_cache
+from metrics.expressions import round_floats as _round_floats
+from metrics.expressions import normalize_model_str
 import re
 import ast 
 
@@ -66,15 +69,7 @@ def complexity(expr):
     return c
         
 def round_floats(ex1):
-    ex2 = ex1
-
-    for a in preorder_traversal(ex1):
-        if isinstance(a, Float):
-            if abs(a) < 0.0001:
-                ex2 = ex2.subs(a,Integer(0))
-            else:
-                ex2 = ex2.subs(a, Float(round(a, 3),3))
-    return ex2
+    return _round_floats(ex1, precision=3)
 
 ################################################################################
 # currently the MRGP model is put together incorrectly. this set of functions
@@ -150,43 +145,11 @@ def clean_pred_model(model_str, dataset, est_name):
         betas, model_str = decompose_mrgp_model(model_str)
 
 
-    X, labels, features = read_file(dataset)
+    features = read_feature_names(dataset)
    
     local_dict = {k:Symbol(k) for k in features}
-    new_model_str = model_str
-    # rename features
-    for i,f in reversed(list(enumerate(features))):
-        print('replacing feature',i,'with',f)
-        if any([n in est_name.lower() for n in ['mrgp','operon','dsr']]):
-            i = i + 1
-        new_model_str = new_model_str.replace('x'+str(i),f)
-        new_model_str = new_model_str.replace('x_'+str(i),f)
-        new_model_str = new_model_str.replace('X_'+str(i),f)
-        new_model_str = new_model_str.replace('X'+str(i),f)
-        new_model_str = new_model_str.replace('x[:,{}]'.format(i),f)
-        new_model_str = new_model_str.replace('x[{}]'.format(i),f)
-    # operators
-    new_model_str = new_model_str.replace('^','**')
-    #GP-GOMEA
-    new_model_str = new_model_str.replace('p/','/') 
-    new_model_str = new_model_str.replace('plog','PLOG') 
-    new_model_str = new_model_str.replace('aq','/') 
-    # MRGP
-    new_model_str = new_model_str.replace('mylog','PLOG')
-    # ITEA
-    new_model_str = new_model_str.replace('sqrtAbs','PSQRT')
-    # new_model_str = re.sub(pattern=r'sqrtAbs\((.*?)\)',
-    #        repl=r'sqrt(abs(\1))',
-    #        string=new_model_str
-    #       )
-    new_model_str = new_model_str.replace('np.','') 
-    # ellyn & FEAT
-    new_model_str = new_model_str.replace('|','')
-    new_model_str = new_model_str.replace('log','PLOG') 
-    new_model_str = new_model_str.replace('sqrt','PSQRT') 
-
-    # AIFeynman
-    new_model_str = new_model_str.replace('pi','3.1415926535')
+    # rename features and operators
+    new_model_str = normalize_model_str(model_str, features, est_name)
 
     local_dict.update({
                        'add':sympy.Add,
@@ -202,10 +165,6 @@ def clean_pred_model(model_str, dataset, est_name):
                        'PLOG10':PLOG,
                        'PSQRT':PSQRT
                        })
-    # BSR
-    # get rid of square brackets
-    new_model_str = new_model_str.replace('[','').replace(']','')
-
     print('parsing',new_model_str)
     if mrgp:
         mrgp_ast = ast.parse(new_model_str, "","eval")
@@ -223,28 +182,29 @@ def clean_pred_model(model_str, dataset, est_name):
     return model_sym
 
 
+@lru_cache(maxsize=None)
+def read_metadata(dataset):
+    """return the metadata.yaml of dataset (cached)"""
+    with open('/'.join(dataset.split('/')[:-1])+'/metadata.yaml','r') as f:
+        return load(f, Loader=Loader)
+
+@lru_cache(maxsize=None)
+def _get_sym_model_str(dataset):
+    description = read_metadata(dataset)['description'].split('\n')
+    model_str = [ms for ms in description if '=' in ms][0].split('=')[-1]
+    return model_str.replace('pi','3.1415926535')
+
 def get_sym_model(dataset, return_str=True):
     """return sympy model from dataset metadata"""
-    metadata = load(
-            open('/'.join(dataset.split('/')[:-1])+'/metadata.yaml','r'),
-            Loader=Loader
-    )
-    df = pd.read_csv(dataset,sep='\t')
-    features = [c for c in df.columns if c != 'target']
-#     print('features:',df.columns)
-    description = metadata['description'].split('\n')
-    model_str = [ms for ms in description if '=' in ms][0].split('=')[-1]
-    model_str = model_str.replace('pi','3.1415926535')
+    model_str = _get_sym_model_str(dataset)
     if return_str:
         return model_str
 
-    # pdb.set_trace()
     # handle feynman problem constants
-#     print('model:',model_str)
+    features = read_feature_names(dataset)
     model_sym = parse_expr(model_str, 
 			   local_dict = {k:Symbol(k) for k in features})
     model_sym = round_floats(model_sym)
-#     print('sym model:',model_sym)
     return model_sym
 
 def rewrite_AIFeynman_model_size(model_str):
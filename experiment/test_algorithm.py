@@ -56,6 +56,8 @@ def test_import(ml):
             'scale_x':bool,
             'scale_y':bool,
             'pre_train':types.FunctionType,
+            'harvest':types.FunctionType,
+            'set_time_budget':types.FunctionType,
             'use_dataframe':bool
         }
         for k,v in eval_kwargs.items():
@@ -64,6 +66,8 @@ def test_import(ml):
                          'scale_x', 
                          'scale_y',
                          'pre_train',
+                         'harvest',
+                         'set_time_budget',
                          'use_dataframe'
                         ]
             assert isinstance(v, eval_kwarg_types[k])
@@ -0,0 +1,39 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import json
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from executors import SlurmExecutor
+
+def write_enb(tmp_path):
+    for name in ['enb_heating', 'enb_cooling']:
+        (tmp_path / name).mkdir()
+        df = pd.DataFrame(np.arange(20).reshape(10, 2), columns=['a', 'b'])
+        df['target'] = np.arange(10)
+        df.to_csv(tmp_path / name / (name + '.tsv.gz'), sep='\t', index=False)
+        (tmp_path / name / 'metadata.yaml').write_text('task: regression\n')
+
+def submitted(tmp_path, *args):
+    results = tmp_path / 'results'
+    subprocess.run([sys.executable, 'analyze.py', str(tmp_path), '-ml',
+                    'LinearRegression', '-results', str(results) + '/',
+                    '-n_trials', '1', '-multi_target', '-n_jobs', '4',
+                    '-m', '1000'] + list(args),
+                   check=True, capture_output=True, cwd=d(abspath(__file__)))
+    with open(str(results / 'index.jsonl')) as f:
+        return [json.loads(line) for line in f]
+
+def test_multi_target_memory(tmp_path):
+    """A multi-target job asks for the memory of each of its workers"""
+    write_enb(tmp_path)
+    jobs = submitted(tmp_path, '-executor', 'fake')
+    # one job for both targets, fitted by 2 workers
+    assert len(jobs) == 1 and jobs[0]['memory'] == 2000
+    # SLURM's memory is per core, and the job has a core per worker
+    assert SlurmExecutor('a', 'q').workers_memory(1000, 2) == 1000
@@ -0,0 +1,64 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import gzip
+import os
+import shutil
+
+import numpy as np
+
+import bgzf
+from read_file import read_file, read_shape
+
+def random_data(n_lines=50000):
+    rng = np.random.RandomState(0)
+    return b''.join(b'%d\t%r\n' % (i, x) for i, x in enumerate(rng.rand(n_lines)))
+
+def test_roundtrip(tmp_path):
+    """BGZF files are gzip files, and decompress block by block in parallel"""
+    data = random_data()
+    path = str(tmp_path / 'data.tsv.gz')
+    with bgzf.BgzfWriter(path, threads=3) as w:
+        for k in range(0, len(data), 10007):
+            w.write(data[k:k+10007].decode())
+    assert bgzf.is_bgzf(path)
+    assert gzip.open(path, 'rb').read() == data
+    assert bgzf.decompress(path, threads=3) == data
+    assert len(bgzf.read_index(path)) == -(-len(data) // bgzf.MAX_BLOCK)
+    assert bgzf.uncompressed_size(path) == len(data)
+
+def test_read_range(tmp_path):
+    """Ranges are read through the index, across block boundaries"""
+    data = random_data()
+    path = str(tmp_path / 'data.tsv.gz')
+    with bgzf.BgzfWriter(path) as w:
+        w.write(data)
+    for start, size in [(0, 10), (bgzf.MAX_BLOCK - 3, 6), (12345, 200000),
+                        (len(data) - 5, 10)]:
+        assert bgzf.read_range(path, start, size) == data[start:start+size]
+
+def test_read_file(tmp_path):
+    """read_file reads converted datasets as before"""
+    path = str(tmp_path / '192_vineyard_small.tsv.gz')
+    shutil.copy('test/192_vineyard_small.tsv.gz', path)
+    X, y, feature_names = read_file(path)
+    mtime = os.path.getmtime(path)
+    assert not bgzf.is_bgzf(path)
+    bgzf.convert(path)
+    assert bgzf.is_bgzf(path) and os.path.getmtime(path) == mtime
+    X2, y2, feature_names2 = read_file(path)
+    assert X.equals(X2)
+    assert np.array_equal(y, y2)
+    assert np.array_equal(feature_names, feature_names2)
+
+def test_read_shape(tmp_path):
+    """The rows of indexed BGZF datasets are estimated without reading them"""
+    data = b'i\ttarget\n' + random_data()
+    path = str(tmp_path / 'data.tsv.gz')
+    with bgzf.BgzfWriter(path) as w:
+        w.write(data)
+    n_samples, n_features = read_shape(path)
+    assert n_features == 1
+    assert abs(n_samples - 50000) < 500
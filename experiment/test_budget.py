@@ -0,0 +1,50 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import json
+
+import numpy as np
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import GridSearchCV
+
+from budget import (fit_cost_model, dataset_time_budget, set_threads,
+                    MIN_JOB_TIME)
+
+def write_runs(path, times, budget=None, timed_out=False):
+    for i, t in enumerate(times):
+        r = dict(algorithm='Slow', n_samples=100*(i+1), n_features=1,
+                 time_time=t, time_budget=budget, timed_out=timed_out)
+        with open(str(path / ('%s_%d.json' % (timed_out, i))), 'w') as f:
+            json.dump(r, f)
+
+def test_censored_runs(tmp_path):
+    """Runs stopped by their budget are kept, as lower bounds of their cost"""
+    write_runs(tmp_path, [10*(i+1) for i in range(5)], budget=1000)
+    uncensored = fit_cost_model(str(tmp_path))['Slow']
+    assert uncensored['n_censored'] == 0
+    write_runs(tmp_path, [50, 100, 990], budget=100, timed_out=True)
+    c = fit_cost_model(str(tmp_path))['Slow']
+    assert c['n_results'] == 8 and c['n_censored'] == 3
+    predict = lambda c, x: c['intercept'] + c['slope']*np.log(x)
+    # the runs that timed out cost at least their budget
+    assert predict(c, 100) > predict(uncensored, 100)
+    assert np.exp(predict(c, 100) + c['residual_quantile']) >= 100
+
+def test_dataset_time_budget():
+    """Jobs get the wall clock of their dataset, from the cost model if there
+    is one"""
+    dataset = 'test/192_vineyard_small.tsv.gz'
+    assert dataset_time_budget('Fast', dataset)['job_time'] == 3600
+    cost_model = {'Fast':dict(intercept=0.0, slope=0.0, residual_quantile=1.0)}
+    limits = dataset_time_budget('Fast', dataset, cost_model)
+    assert limits['job_time'] == MIN_JOB_TIME > limits['fit_time']
+
+def test_set_threads():
+    """Thread counts are set, including those of wrapped estimators"""
+    est = GridSearchCV(RandomForestRegressor(n_jobs=-1), {'max_depth': [2]},
+                       n_jobs=8)
+    assert sorted(set_threads(est, 2)) == ['estimator__n_jobs', 'n_jobs']
+    assert est.n_jobs == est.estimator.n_jobs == 2
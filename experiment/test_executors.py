@@ -0,0 +1,90 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import executors
+import ledger
+from executors import (get_executor, PENDING, RUNNING, COMPLETED, FAILED,
+                       CANCELLED)
+
+def job(name, command='true'):
+    return dict(name=name, command=command, out_file=None, err_file=None,
+                time='0:10', cores=1, memory=1000)
+
+def test_fake_executor():
+    """Only failed jobs are retried, with the changes of update"""
+    ex = get_executor('fake')
+    ids = ex.submit([job('a'), job('b'), job('c')])
+    assert ex.status(ids) == {i:PENDING for i in ids}
+    assert ex.queued_names() == ['a', 'b', 'c']
+
+    ex.set_state(ids[:1], COMPLETED)
+    ex.set_state(ids[1:2], FAILED)
+    ex.cancel(ids)
+    assert [ex.status()[i] for i in ids] == [COMPLETED, FAILED, CANCELLED]
+
+    new_ids = ex.retry(update=lambda j: dict(j, memory=2*j['memory']))
+    assert len(new_ids) == 1
+    assert ex.jobs[new_ids[0]]['name'] == 'b'
+    assert ex.jobs[new_ids[0]]['memory'] == 2000
+    # update returning None gives up on the job
+    ex.set_state(new_ids, FAILED)
+    assert ex.retry(new_ids, update=lambda j: None) == []
+
+def test_local_executor(tmp_path):
+    """Local jobs report their exit status and can be cancelled"""
+    ex = get_executor('pool', n_jobs=2)
+    out_file = str(tmp_path / 'a.out')
+    ids = ex.submit([dict(job('a', 'echo hello'), out_file=out_file),
+                     job('b', 'false')])
+    states = ex.wait(ids)
+    assert states == {ids[0]:COMPLETED, ids[1]:FAILED}
+    assert open(out_file).read() == 'hello\n'
+
+    ids = ex.submit([job('c', 'sleep 60')])
+    while ex.status(ids)[ids[0]] != RUNNING:
+        pass
+    ex.cancel(ids)
+    assert ex.wait(ids) == {ids[0]:CANCELLED}
+
+def test_expand_array_ids():
+    """Pending array tasks are expanded to their ids"""
+    assert executors._expand_array_ids('12_[1-3,5%2]') == ['12_1', '12_2',
+                                                           '12_3', '12_5']
+    assert executors._expand_array_ids('12_4') == ['12_4']
+
+def test_slurm_array_resources(monkeypatch):
+    """Array jobs are grouped by their resources, keep their order and run
+    the setup of the executor"""
+    arrays = []
+    def submit_array(commands, manifest_dir, job_name, **kwargs):
+        arrays.append((commands, kwargs))
+        return [str(len(arrays))]
+    monkeypatch.setattr(executors.slurm, 'submit_array', submit_array)
+    ex = executors.SlurmExecutor('a', 'q', array=True, setup='module load x')
+    ids = ex.submit([job('a', 'a'), dict(job('b', 'b'), memory=4000),
+                     job('c', 'c')])
+    assert ids == ['1_1', '2_1', '1_2']
+    assert [(c, kw['M']) for c, kw in arrays] == [(['a', 'c'], 1000),
+                                                  (['b'], 4000)]
+    assert all(kw['setup'] == 'module load x' for _, kw in arrays)
+
+def test_slurm_array_err_files(tmp_path, monkeypatch):
+    """Array jobs are recorded with the err file of their array task"""
+    stamps = []
+    def submit_array(commands, manifest_dir, job_name, stamp=None, **kwargs):
+        stamps.append(stamp)
+        return ['7']
+    monkeypatch.setattr(executors.slurm, 'submit_array', submit_array)
+    manifest_dir = tmp_path / 'manifests'
+    manifest_dir.mkdir()
+    ex = executors.SlurmExecutor('a', 'q', array=True, array_name='run',
+                                 manifest_dir=str(manifest_dir))
+    jobs = ex.prepare([job('a'), job('b')])
+    assert ex.submit(jobs) == ['7_1', '7_2']
+    # where the array script sends the stderr of task 2
+    (manifest_dir / 'run_{}_0.7_2.err'.format(stamps[0])).write_text(
+        'slurmstepd: error: Detected 1 oom_kill event\n')
+    assert ledger.triage(dict(err_file=jobs[1]['err_file'])) == ledger.OOM
+    assert ledger.triage(dict(err_file=jobs[0]['err_file'])) == ledger.LOST
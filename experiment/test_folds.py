@@ -0,0 +1,32 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import numpy as np
+from sklearn.model_selection import KFold
+
+import folds
+
+def test_cached_kfold():
+    """Cached splits are those of KFold(shuffle=True), computed once"""
+    X = np.random.rand(103, 4)
+    for (a, b), (c, e) in zip(KFold(5, shuffle=True, random_state=3).split(X),
+                              folds.CachedKFold(5, 3).split(X)):
+        assert (a == c).all() and (b == e).all()
+    folds.set_seed(3)
+    assert (next(folds.CachedKFold(5).split(X))[1]
+            is next(folds.CachedKFold(5, 3).split(X))[1])
+
+def test_get_folds():
+    """Materialized folds hold the same samples, as views of one copy"""
+    X, y = np.random.rand(103, 4), np.random.rand(103)
+    f = folds.get_folds(X, y, 5, 3)
+    assert folds.get_folds(X, y, 5, 3) is f
+    for k, (train, test) in enumerate(folds.kfold_splits(103, 5, 3)):
+        X_test, y_test = f.test(k)
+        assert np.shares_memory(X_test, f.X)
+        assert sorted(y_test) == sorted(y[test])
+        X_train, y_train = f.train(k)
+        assert sorted(y_train) == sorted(y[train])
+        assert np.shares_memory(f.train(k, 10)[0], X_train)
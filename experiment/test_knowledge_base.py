@@ -0,0 +1,37 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import numpy as np
+
+import knowledge_base as kb
+
+def test_meta_features():
+    """Meta-features describe the size and linearity of a dataset"""
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(200, 3))
+    meta = kb.meta_features(X, X @ [1, 2, 3])
+    assert list(meta) == kb.META_FEATURES
+    assert np.isclose(meta['linear_r2'], 1)
+    assert np.isclose(meta['log_n_samples'], np.log(200))
+
+def test_recommend():
+    """Params are recommended from the datasets nearest in meta-features"""
+    def meta(linear_r2):
+        return {f:(linear_r2 if f == 'linear_r2' else 0.0)
+                for f in kb.META_FEATURES}
+    records = []
+    for dataset, linear_r2, best in [('a', 0.9, 1), ('b', 0.8, 1),
+                                     ('c', 0.1, 2), ('d', 0.2, 2)]:
+        for alpha in [1, 2]:
+            records.append(dict(algorithm='Lasso', dataset=dataset,
+                                meta_features=meta(linear_r2),
+                                params={'alpha':alpha, 'random_state':0},
+                                score=0.9 if alpha == best else 0.5))
+    assert kb.recommend(records, 'Lasso', meta(0.95), k=2) == [{'alpha':1}]
+    assert kb.recommend(records, 'Lasso', meta(0.0), k=2) == [{'alpha':2}]
+    assert kb.recommend(records, 'Lasso', meta(0.95), k=2,
+                        exclude='a')[0] == {'alpha':1}
+    assert len(kb.recommend(records, 'Lasso', n=3)) == 2
+    assert kb.recommend(records, 'Ridge') == []
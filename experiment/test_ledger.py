@@ -0,0 +1,42 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import ledger
+
+def test_run_command(tmp_path):
+    """Finished jobs record their outcome and stderr tail in the ledger"""
+    index = str(tmp_path / 'index.jsonl')
+    ledger.record_submitted(index, 'a', dict(time='1:00', memory=1000))
+    status = ledger.run_command('echo MemoryError >&2; exit 1', index,
+                                key='a')
+    assert status['outcome'] == ledger.OOM
+    assert 'MemoryError' in status['stderr_tail']
+    status = ledger.run_command('true', index, key='b')
+    assert status['outcome'] == ledger.OK
+
+    attempts = ledger.read_ledger(index)
+    assert len(attempts['a']) == 1
+    assert attempts['a'][0]['memory'] == 1000
+    assert attempts['a'][0]['returncode'] == 1
+    assert attempts['b'][0]['returncode'] == 0
+
+def test_retry_resources():
+    """Jobs get more memory after an OOM, more time after a timeout, and are
+    given up on after max_attempts"""
+    assert ledger.classify(0) == ledger.OK
+    assert ledger.classify(-9) == ledger.OOM
+    assert ledger.classify(-15, terminated=True) == ledger.TIMEOUT
+    assert ledger.classify(1, 'Traceback') == ledger.ERROR
+
+    oom = dict(time='1:00', memory=1000, outcome=ledger.OOM)
+    timeout = dict(time='1:00', memory=1000, outcome=ledger.TIMEOUT)
+    r = ledger.retry_resources([oom], '1:00', 1000)
+    assert (r['attempt'], r['time'], r['memory']) == (2, '1:00', 2000)
+    r = ledger.retry_resources([oom, timeout], '1:00', 1000)
+    assert (r['attempt'], r['time'], r['memory']) == (3, '2:00', 1000)
+    assert ledger.retry_resources([oom, timeout, oom], '1:00', 1000) is None
+    # submitted, but not finished and not queued
+    assert ledger.retry_resources([dict(time='1:00')], '1:00', 1000
+                                  )['outcome'] == ledger.LOST
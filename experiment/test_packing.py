@@ -0,0 +1,35 @@
+import json
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import packing
+
+def test_pack_jobs():
+    """Packs respect the capacity, and every job is packed once"""
+    runtimes = [50, 10, 30, 70, 20, 60, 40]
+    packs, loads = packing.pack_jobs(runtimes, 100)
+    assert sorted(i for p in packs for i in p) == list(range(len(runtimes)))
+    for pack, load in zip(packs, loads):
+        assert load == sum(runtimes[i] for i in pack) <= 100
+    assert len(packs) == 3
+
+def test_run_pack(tmp_path):
+    """Every command of a pack reports its status to the results index"""
+    manifest = tmp_path / 'pack.manifest'
+    manifest.write_text('true\nfalse\ntrue\n')
+    index = tmp_path / 'index.jsonl'
+    packing.run_pack(str(manifest), n_jobs=2, index_file=str(index))
+    statuses = [json.loads(l) for l in index.read_text().splitlines()]
+    assert sorted(s['returncode'] for s in statuses) == [0, 0, 1]
+    assert all(s['pack'] == 'pack.manifest' for s in statuses)
+
+def test_predicted_runtime():
+    """Runtimes come from the cost model; without one the job is not packed"""
+    dataset = 'test/192_vineyard_small.tsv.gz'
+    cost_model = {'Fast':dict(intercept=0.0, slope=0.0, residual_quantile=1.0)}
+    assert abs(packing.predicted_runtime('Fast', dataset, cost_model)
+               - 2.718281828) < 1e-6
+    assert packing.predicted_runtime('Slow', dataset, cost_model) is None
+    assert packing.predicted_runtime('Slow', dataset) is None
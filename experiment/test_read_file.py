@@ -0,0 +1,69 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from read_file import read_file, read_target, multi_target_siblings
+
+def write_dataset(path, target):
+    df = pd.DataFrame(np.arange(20).reshape(10, 2), columns=['a', 'b'])
+    df['target'] = target
+    df.to_csv(path, sep='\t', index=False)
+
+def test_multi_target_siblings(tmp_path):
+    """The targets of a multi-target problem are found next to each other or
+    in directories named after them"""
+    for name in ['enb_heating', 'enb_cooling', 'agric_001_consumer_trend']:
+        (tmp_path / name).mkdir()
+        write_dataset(tmp_path / name / (name + '.tsv.gz'), np.arange(10))
+    heating = str(tmp_path / 'enb_heating' / 'enb_heating.tsv.gz')
+    assert multi_target_siblings(heating) == [
+        heating, str(tmp_path / 'enb_cooling' / 'enb_cooling.tsv.gz')]
+    # siblings that do not exist are left out
+    agric = str(tmp_path / 'agric_001_consumer_trend'
+                / 'agric_001_consumer_trend.tsv.gz')
+    assert multi_target_siblings(agric) == [agric]
+    assert multi_target_siblings('test/192_vineyard_small.tsv.gz') == [
+        'test/192_vineyard_small.tsv.gz']
+
+def test_read_target(tmp_path):
+    """read_target gives the labels of read_file"""
+    path = str(tmp_path / 'enb_heating.tsv.gz')
+    write_dataset(path, np.linspace(0, 1, 10))
+    _, labels, _ = read_file(path)
+    assert np.array_equal(read_target(path), labels)
+
+def test_sidecar(tmp_path):
+    """An up-to-date <name>.npy sidecar is read instead of the TSV.GZ"""
+    path = str(tmp_path / 'agric_01_sustainability.tsv.gz')
+    write_dataset(path, np.linspace(0, 1, 10))
+    data = np.hstack([np.arange(20).reshape(10, 2), np.ones((10, 1))])
+    np.save(str(tmp_path / 'agric_01_sustainability.npy'), data)
+    X, y, feature_names = read_file(path)
+    assert list(feature_names) == ['a', 'b'] and list(X.columns) == ['a', 'b']
+    assert np.array_equal(y, np.ones(10))
+    assert np.array_equal(read_target(path), np.ones(10))
+    # a sidecar older than the dataset is ignored
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert np.array_equal(read_file(path)[1], np.linspace(0, 1, 10))
+
+def test_sidecar_checks(tmp_path):
+    """Sidecars keep integer labels, and are only read if the label is the
+    last of the dataset's columns"""
+    path = str(tmp_path / 'agric_01_sustainability.tsv.gz')
+    write_dataset(path, np.arange(10))
+    data = np.hstack([np.arange(20).reshape(10, 2), np.arange(10)[:, None]])
+    np.save(str(tmp_path / 'agric_01_sustainability.npy'), data.astype(float))
+    _, y, _ = read_file(path)
+    assert y.dtype == np.int64 and np.array_equal(y, np.arange(10))
+    assert read_target(path).dtype == np.int64
+    # labelled by another column, the dataset is parsed
+    X, y, feature_names = read_file(path, label='a')
+    assert list(feature_names) == ['b', 'target']
+    assert np.array_equal(y, np.arange(0, 20, 2))
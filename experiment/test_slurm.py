@@ -0,0 +1,59 @@
+import os
+import stat
+import subprocess
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import slurm
+
+FAKE_SBATCH = """#!/usr/bin/env bash
+echo "$@" >> {LOG}
+echo "Submitted batch job 1234"
+"""
+FAKE_SQUEUE = """#!/usr/bin/env bash
+cat {QUEUE} 2>/dev/null
+"""
+
+def fake_slurm(tmp_path, monkeypatch):
+    """puts sbatch and squeue stand-ins on the PATH"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for name, script in [('sbatch', FAKE_SBATCH), ('squeue', FAKE_SQUEUE)]:
+        f = bin_dir / name
+        f.write_text(script.format(LOG=tmp_path / 'sbatch.log',
+                                   QUEUE=tmp_path / 'queue'))
+        f.chmod(f.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+
+def test_submit_array(tmp_path, monkeypatch):
+    """Commands are split over throttled arrays, and each task runs its line
+    of the manifest"""
+    fake_slurm(tmp_path, monkeypatch)
+    commands = ['echo job ' + str(i) for i in range(5)]
+    manifest_dir = tmp_path / 'manifests'
+    job_ids = slurm.submit_array(commands, str(manifest_dir), 'test',
+                                 throttle=2, max_array_size=3, A='a',
+                                 QUEUE='q', N_CORES=1, M=1000, TIME='1:00')
+    assert job_ids == ['1234', '1234']
+    assert len((tmp_path / 'sbatch.log').read_text().splitlines()) == 2
+
+    scripts = sorted(manifest_dir.glob('*.sh'))
+    assert '#SBATCH --array=1-3%2' in scripts[0].read_text()
+    assert '#SBATCH --array=1-2%2' in scripts[1].read_text()
+
+    # run the array's task 2 without sbatch's #SBATCH directives
+    script = scripts[1].read_text().replace('conda info\n', '').replace(
+        'source plg_modules.sh\n', '')
+    res = subprocess.run(['bash', '-c', script], capture_output=True,
+                         text=True,
+                         env=dict(os.environ, SLURM_ARRAY_TASK_ID='2'))
+    assert res.stdout.strip().endswith('job 4')
+
+    # commands of arrays still in the queue are found
+    names = [s.name[:-3] for s in scripts]
+    (tmp_path / 'queue').write_text(names[0] + '\nother\n')
+    queued = slurm.queued_commands(str(manifest_dir),
+                                   slurm.squeue_job_names())
+    assert queued == set(commands[:3])
@@ -0,0 +1,52 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import os
+import time
+import numpy as np
+import pytest
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import LinearRegression
+
+from supervisor import FitFailed, supervised_fit, group_rss_mb, SymbolicModel
+
+class Hog(BaseEstimator, RegressorMixin):
+    """holds on to more memory than its limit"""
+    def fit(self, X, y):
+        self.hog_ = np.ones(400*1024**2//8)
+        time.sleep(30)
+        return self
+
+class Crash(BaseEstimator, RegressorMixin):
+    """dies during fit"""
+    def fit(self, X, y):
+        os._exit(3)
+
+X, y = np.random.rand(50, 2), np.random.rand(50)
+
+def test_supervised_fit():
+    """Supervised fits return the fitted estimator"""
+    est, status = supervised_fit(LinearRegression(), X, y, 10)
+    assert hasattr(est, 'coef_') and not status['timed_out']
+
+def test_memory_limit():
+    """Fits whose resident memory exceeds the limit are killed"""
+    assert group_rss_mb(os.getpgrp()) > 0
+    with pytest.raises(FitFailed) as e:
+        supervised_fit(Hog(), X, y, 20, max_memory=200, grace=0)
+    assert e.value.status['killed'] == 'memory'
+    assert e.value.status['fit_time'] < 20
+
+def test_failed_fit():
+    """Fits that die are reported with their exit code"""
+    with pytest.raises(FitFailed) as e:
+        supervised_fit(Crash(), X, y, 10)
+    assert e.value.status['killed'] is None
+    assert e.value.status['exitcode'] == 3
+
+def test_constant_symbolic_model():
+    """Constant model strings predict one value per sample"""
+    y_pred = SymbolicModel('1.5', ['a', 'b']).predict(X)
+    assert np.array_equal(y_pred, np.full(len(X), 1.5))
@@ -0,0 +1,61 @@
+import sys
+from os.path import dirname as d
+from os.path import abspath
+sys.path.append(d(abspath(__file__)))
+
+import time
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import Lasso
+from sklearn.model_selection import GridSearchCV
+
+import tuning
+
+def test_tune():
+    """Successive halving keeps the best candidates and records fold scores"""
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(600, 5))
+    y = X @ np.arange(5) + 0.1*rng.normal(size=600)
+    hyper_params = {'alpha': (1e-3, 0.1, 1, 10, 100)}
+    res = tuning.tune(Lasso(), hyper_params, X, y, time_limit=60, n_jobs=2,
+                      cv=3, random_state=0)
+    assert res['best_params'] == {'alpha': 1e-3}
+    # 5 candidates, halved by 3: 5 then 2
+    assert [len(r['candidates']) for r in res['rounds']] == [5, 2]
+    assert res['rounds'][0]['n_samples'] < res['rounds'][1]['n_samples']
+    assert all(len(c['fold_scores']) == 3 for r in res['rounds']
+               for c in r['candidates'])
+
+class Slow(BaseEstimator, RegressorMixin):
+    """a mean predictor that takes its time"""
+    def __init__(self, delay=0.5):
+        self.delay = delay
+    def fit(self, X, y):
+        time.sleep(self.delay)
+        self.mean_ = y.mean()
+        return self
+    def predict(self, X):
+        return np.full(len(X), self.mean_)
+
+def test_tune_deadline():
+    """A round stops when the budget is spent, even if no fit times out"""
+    rng = np.random.RandomState(0)
+    X, y = rng.normal(size=(200, 2)), rng.normal(size=200)
+    t0 = time.time()
+    res = tuning.tune(Slow(), {'delay': (0.5, 0.6, 0.7)}, X, y, time_limit=1,
+                      n_jobs=1, cv=2, random_state=0)
+    assert time.time() - t0 < 2
+    assert res['rounds'] == [] and res['best_params'] == {}
+
+def test_tune_search_cv():
+    """Tuning wrappers, whose hyper_params name the wrapped estimator's
+    params, are left to tune themselves"""
+    hyper_params = {'alpha': (0.1, 1)}
+    est = GridSearchCV(Lasso(), hyper_params, cv=2)
+    assert tuning.is_search_cv(est) and not tuning.is_search_cv(Lasso())
+    rng = np.random.RandomState(0)
+    res = tuning.tune(est, hyper_params, rng.normal(size=(100, 2)),
+                      rng.normal(size=100), time_limit=60, n_jobs=1, cv=2)
+    assert res['best_params'] == {} and res['rounds'] == []
+    est.set_params(**res['best_params'])
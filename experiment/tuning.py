@@ -0,0 +1,168 @@
+"""
+Successive-halving tuning of a method's hyper_params.
+
+Methods list candidate settings in `hyper_params`, a dict or list of dicts of
+parameter values as for sklearn's ParameterGrid. `tune` searches them with
+successive halving over training samples: the first round cross-validates
+every candidate on a small sample of each training fold, and each following
+round keeps the best 1/factor of the candidates and gives them factor times
+more samples, up to the full folds. The folds come from folds.get_folds,
+so they are the same for every method, and the samples of a round are
+views of the fold's training set.
+
+The rounds share a time budget. Each round costs about the same, so fits of
+estimators with a time parameter (see budget.TIME_PARAMS) get an even share
+of the budget, spread over the n_jobs workers. The fits of a round are run
+in batches of n_jobs, and the round is stopped once the budget is spent
+(between batches, or by joblib's timeout within one); the best candidate of
+the last complete round is kept. Every candidate is scored on the same folds
+in every round, and the score of every fold is recorded.
+
+Tuning wrappers (GridSearchCV, OptunaSearchCV, bingo's CrossValRegressor)
+search their own hyper_params, which name the params of the wrapped
+estimator, so they are not tuned again.
+"""
+import math
+import os
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+import budget
+from folds import get_folds
+
+# share of the estimator's time budget spent on tuning
+TUNE_FRACTION = 0.25
+FACTOR = 3
+CV = 5
+# larger grids are randomly sampled
+MAX_CANDIDATES = 81
+# smallest training sample of the first round
+MIN_SAMPLES = 50
+# params holding the search space of tuning wrappers
+SEARCH_SPACES = ('param_grid', 'param_distributions')
+
+
+def n_workers():
+    """the cores allotted to the job (see set_env_vars in evaluate_model)."""
+    return int(os.environ.get('OMP_NUM_THREADS', 1))
+
+
+def candidates(hyper_params, max_candidates=MAX_CANDIDATES, random_state=None):
+    """the settings in hyper_params, at most max_candidates of them."""
+    grid = ParameterGrid(hyper_params)
+    if len(grid) <= max_candidates:
+        return list(grid)
+    # sample without replacement from the lists of values
+    return list(ParameterSampler(hyper_params, max_candidates,
+                                 random_state=random_state))
+
+
+def is_search_cv(est):
+    """whether est is a tuning wrapper: a search over the params of its
+    `estimator`."""
+    params = est.get_params(deep=False)
+    return 'estimator' in params and any(p in params for p in SEARCH_SPACES)
+
+
+def _score_fold(est, params, train, test, fit_time, set_time_budget):
+    est = clone(est).set_params(**params)
+    if fit_time:
+        set_time_budget(est, fit_time)
+    t0 = time.time()
+    try:
+        est.fit(*train)
+        score = r2_score(test[1], est.predict(test[0]))
+        if not np.isfinite(score):
+            score = -np.inf
+    except Exception as e:
+        print('Warning: tuning fit with',params,'failed. Msg:',e)
+        score = -np.inf
+    return float(score), time.time() - t0
+
+
+def tune(est, hyper_params, X, y, time_limit, n_jobs=None, cv=CV,
+         factor=FACTOR, max_candidates=MAX_CANDIDATES, random_state=None,
+         set_time_budget=budget.set_time_budget):
+    """successive halving of the settings in hyper_params for est, within
+    time_limit seconds.
+
+    Returns a dict with the best params, the time spent, and per round the
+    number of training samples and, per candidate, its params, fold scores,
+    mean score and fit time.
+    """
+    t0 = time.time()
+    if is_search_cv(est):
+        print('Warning:',type(est).__name__,'tunes its own hyper_params;',
+              'skipping tuning')
+        return dict(best_params={}, best_score=None, rounds=[], time=0.0)
+    deadline = t0 + time_limit
+    n_jobs = n_jobs or n_workers()
+    params = candidates(hyper_params, max_candidates, random_state)
+    # the rounds use growing prefixes of the (shuffled) training folds
+    folds = get_folds(X, y, cv, random_state)
+    n_train = min(len(folds.train(k)[1]) for k in range(cv))
+
+    n_rounds = 1
+    if len(params) > 1:
+        n_rounds += math.ceil(math.log(len(params), factor))
+    # skip the first rounds if their samples would be too small
+    while n_rounds > 1 and n_train/factor**(n_rounds - 1) < MIN_SAMPLES:
+        n_rounds -= 1
+    # fits of estimators with a time parameter share the budget evenly
+    has_time_param = any(p in est.get_params() for p in budget.TIME_PARAMS)
+    round_time = time_limit/n_rounds
+
+    rounds = []
+    best = dict(params={}, mean_score=None)
+    for r in range(n_rounds):
+        n_samples = int(n_train/factor**(n_rounds - 1 - r))
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        fit_time = None
+        if has_time_param:
+            fit_time = max(1, int(min(round_time, remaining)*n_jobs
+                                  / (len(params)*cv)))
+        tasks = [(p, folds.train(k, n_samples), folds.test(k))
+                 for p in params for k in range(cv)]
+        out = []
+        try:
+            for start in range(0, len(tasks), n_jobs):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError('tuning budget spent')
+                # (joblib only times out fits run by workers)
+                out += Parallel(n_jobs=n_jobs,
+                                timeout=remaining if n_jobs > 1 else None)(
+                    delayed(_score_fold)(est, p, train, test, fit_time,
+                                         set_time_budget)
+                    for p, train, test in tasks[start:start+n_jobs])
+        except Exception as e:
+            # the last complete round decides
+            print('Warning: tuning round',r,'stopped. Msg:',repr(e))
+            break
+        results = []
+        for k, p in enumerate(params):
+            scores, times = zip(*out[k*cv:(k+1)*cv])
+            results.append(dict(params=p, fold_scores=list(scores),
+                                mean_score=float(np.mean(scores)),
+                                fit_time=float(np.sum(times))))
+        rounds.append(dict(n_samples=n_samples, candidates=results))
+        ranked = sorted(results, key=lambda c: -c['mean_score'])
+        best = ranked[0]
+        print('tuning round',r,':',len(params),'candidates on',n_samples,
+              'samples, best',best['mean_score'],best['params'])
+        params = [c['params'] for c in
+                  ranked[:max(1, math.ceil(len(params)/factor))]]
+        if len(params) == 1 and r < n_rounds - 1:
+            # nothing left to compare
+            break
+
+    if best['mean_score'] == -np.inf:
+        # every candidate failed; keep the method's defaults
+        best = dict(params={}, mean_score=None)
+    return dict(best_params=best['params'], best_score=best['mean_score'],
+                rounds=rounds, time=time.time() - t0)
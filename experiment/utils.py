@@ -1,3 +1,9 @@
+import os
+import json
+import sys
+import time
+import threading
+import resource
 import numpy as np
 import pandas as pd
 
@@ -28,3 +34,136 @@ def jsonify(d):
         return str(d)
     return d
 
+
+def cpu_time():
+    """user + system time of this process and its finished children"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+class PhaseTimer:
+    """records the wall and cpu time (in s) of consecutive phases of a run.
+
+    start(phase) ends the running phase, if any, and starts the next one.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.phase = None
+
+    def start(self, phase):
+        self.stop()
+        self.phase = phase
+        self.t0, self.c0 = time.time(), cpu_time()
+
+    def stop(self):
+        if self.phase is not None:
+            self.timings[self.phase] = {'wall': time.time() - self.t0,
+                                        'cpu': cpu_time() - self.c0}
+        self.phase = None
+
+def thread_count():
+    """number of OS threads of this process (python threads if unknown)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+def resource_usage():
+    """peak memory and thread count of this process so far"""
+    # ru_maxrss is in KB on linux and in bytes on mac
+    scale = 1024**2 if sys.platform == 'darwin' else 1024
+    return {
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale,
+        'peak_rss_children_mb':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/scale,
+        'n_threads': thread_count(),
+    }
+
+def current_rss_mb():
+    """resident memory of this process now (its peak if unknown)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return resource_usage()['peak_rss_mb']
+
+# estimator attributes reported as fit progress, if they are set during fit
+PROGRESS_ATTRS = ['generation', 'generation_', 'n_generations_', 'gen_',
+                  'best_fitness', 'best_fitness_', 'best_score_', 'loss_']
+
+def fit_progress(est):
+    """progress of a running fit: est.progress() if the estimator defines it,
+    otherwise the scalar PROGRESS_ATTRS it exposes. gplearn's run_details_
+    is reported by its latest entries."""
+    if callable(getattr(est, 'progress', None)):
+        try:
+            return dict(est.progress())
+        except Exception as e:
+            return {'error': str(e)}
+    progress = {}
+    for attr in PROGRESS_ATTRS:
+        v = getattr(est, attr, None)
+        if isinstance(v, (int, float, np.number)):
+            progress[attr] = v
+    run_details = getattr(est, 'run_details_', None)
+    if isinstance(run_details, dict):
+        for k in ['generation', 'best_fitness', 'average_length']:
+            if run_details.get(k):
+                progress[k] = run_details[k][-1]
+    return progress
+
+class ProgressSampler(threading.Thread):
+    """samples cpu utilization, memory and fit progress of est every
+    `interval` seconds, appending one json line per sample to `filename`.
+
+    Used as a context manager around est.fit. A run that is stalled or
+    thrashing can be spotted from the last lines of the file, long before
+    it times out.
+    """
+    def __init__(self, est, filename, interval=30):
+        super().__init__(daemon=True)
+        self.est = est
+        self.filename = filename
+        self.interval = interval
+        self.finished = threading.Event()
+
+    def sample(self):
+        t, c = time.time(), cpu_time()
+        wall = t - self.t_last
+        s = {
+            'time': t - self.t0,
+            # in cores: > 1 for multithreaded fits
+            'cpu_utilization': (c - self.c_last)/wall if wall > 0 else 0.0,
+            'rss_mb': current_rss_mb(),
+            'n_threads': thread_count(),
+            'progress': fit_progress(self.est),
+        }
+        self.t_last, self.c_last = t, c
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(jsonify(s)) + '\n')
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print('Warning: progress sampling failed:', e)
+
+    def __enter__(self):
+        open(self.filename, 'w').close()
+        self.t0 = self.t_last = time.time()
+        self.c_last = cpu_time()
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.finished.set()
+        self.join()
+        self.sample()
+        return False
@@ -66,6 +66,9 @@ comparison_cols = [
     'algorithm',
     'random_state',
     'time_time',
+    'wall_time',
+    'cpu_time',
+    'peak_rss_mb',
     'model_size',
     'symbolic_model',
     'r2_test',
@@ -92,7 +95,11 @@ for f in tqdm(glob(rdir + '/*/*.json')):
             sm = '+'.join(sm)
             r['symbolic_model'] = sm
             
-        sub_r = {k:v for k,v in r.items() if k in comparison_cols}
+        # one column per phase timed by evaluate_model
+        for phase, t in r.pop('timings', {}).items():
+            r[phase + '_wall_time'] = t['wall']
+        sub_r = {k:v for k,v in r.items() 
+                 if k in comparison_cols or k.endswith('_wall_time')}
     #     df = pd.DataFrame(sub_r)
         frames.append(sub_r) 
     #     print(f)
@@ -111,6 +118,14 @@ df_results = df_results.drop(columns=['params'])
 ##########
 df_results = df_results.rename(columns={'time_time':'training time (s)'})
 df_results.loc[:,'training time (hr)'] = df_results['training time (s)']/3600
+# time spent outside of est.fit (reading, scaling, predicting, sympy), for
+# results that record the wall time of the whole run
+if 'wall_time' in df_results.columns:
+    df_results['overhead time (s)'] = (df_results['wall_time']
+                                       - df_results['training time (s)'])
+    print('overhead vs training time (s) per algorithm:')
+    print(df_results.groupby('algorithm')[
+        ['training time (s)','overhead time (s)']].median())
 # remove regressor from names
 df_results['algorithm'] = df_results['algorithm'].apply(lambda x: x.replace('Regressor','')) 
 #Rename SGD to Linear
@@ -57,6 +57,9 @@ for f in tqdm(glob(rdir + '/*/*.json')):
             sm = '+'.join(sm)
             r['symbolic_model'] = sm
             
+        # one column per phase timed by evaluate_model
+        for phase, t in r.pop('timings', {}).items():
+            r[phase + '_wall_time'] = t['wall']
         sub_r = {k:v for k,v in r.items() if k not in excluded_cols}
     #     df = pd.DataFrame(sub_r)
         frames.append(sub_r) 
@@ -78,6 +81,14 @@ df_results = pd.DataFrame.from_records(frames)
 ##########
 df_results = df_results.rename(columns={'time_time':'training time (s)'})
 df_results.loc[:,'training time (hr)'] = df_results['training time (s)']/3600
+# time spent outside of est.fit (reading, scaling, predicting, sympy), for
+# results that record the wall time of the whole run
+if 'wall_time' in df_results.columns:
+    df_results['overhead time (s)'] = (df_results['wall_time']
+                                       - df_results['training time (s)'])
+    print('overhead vs training time (s) per algorithm:')
+    print(df_results.groupby('algorithm')[
+        ['training time (s)','overhead time (s)']].median())
 # add modified R2 with 0 floor
 df_results['r2_zero_test'] = df_results['r2_test'].apply(lambda x: max(x,0))
 for col in ['symbolic_error_is_zero', 'symbolic_error_is_constant', 'symbolic_fraction_is_constant']:
@@ -3,13 +3,17 @@
 
 # # saved tuned models
 # 
-# Go thru PMLB results and pick the most common params in the best estimators. 
+# Go thru PMLB results and pick the params that score best across datasets,
+# using the tuning knowledge base (experiment/knowledge_base.py). 
 # Use these parameter settings for the Feynman and Strogatz models.
 
 import pandas as pd
 import json
 import numpy as np
 import os
+import sys
+sys.path.append('../experiment')
+import knowledge_base
 
 symbolic_algs = [
     'AFP',
@@ -56,17 +60,18 @@ df_results = df_results.loc[df_results.algorithm.isin(symbolic_algs)]
 # df_results[['algorithm','params_str']].to_feather(rdir.replace('.','').replace('/','')+'_params.feather')
 
 
-# ## find the mode of each algorithm's params
+# ## find the best params of each algorithm over all datasets
 
 # In[3]:
 
 
-# df_results.params.apply(str)
+# datasets are pooled, so no meta-features are needed
+kb = knowledge_base.records_from_frame(df_results, lambda dataset: None)
 best_params = []
-for alg, dfg in df_results.groupby('algorithm'):
-    counts = dfg['params_str'].value_counts()
-    print(alg, 'mode of params:',counts.index[0])
-    best_params.append([alg, counts.index[0]])
+for alg in df_results.algorithm.unique():
+    params = knowledge_base.recommend(kb, alg)[0]
+    print(alg, 'best params:',params)
+    best_params.append([alg, params])
 
 # best_params                    
 
@@ -80,5 +85,5 @@ import os
 for alg, bp in best_params:
 #     os.system('cp ../experiment/methods/{ALG}.py ../experiment/methods/tuned/{ALG}.py'.format(ALG=alg))
     param_file = sr_name_to_filename[alg]
-    with open(f'../experiment/methods/tuned/params/_{param_file}.py','w') as f:
-        f.write('params = {}\n'.format(bp))
+    knowledge_base.write_param_module(
+        f'../experiment/methods/tuned/params/_{param_file}.py', bp)